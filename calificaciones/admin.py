@@ -1,12 +1,24 @@
 from django.contrib import admin
+from django.db import transaction
+from . import outbox, perfiles
 from .models import (
     Emisor, FactorTributario, BitacoraAccesos,
-    CargaMasiva, HistorialAuditoria, Reporte, Calificacion
+    CargaMasiva, HistorialAuditoria, Reporte, Calificacion, OperacionMasiva,
+    CalificacionVersion, EventoOutbox,
 )
+from .conteos import PaginadorEstimado
+from .versiones import cerrar_versiones
+
+
+class AdminTablaGrande(admin.ModelAdmin):
+    """Changelist sin COUNT(*) completo: conteo estimado por sobre CONTEO_EXACTO_MAX filas."""
+    paginator = PaginadorEstimado
+    show_full_result_count = False
+
 
 # Personalizar admin de Emisor para que admin pueda crear/editar
 @admin.register(Emisor)
-class EmisorAdmin(admin.ModelAdmin):
+class EmisorAdmin(AdminTablaGrande):
     list_display = ('rut', 'nombre', 'direccion', 'activo', 'fecha_registro')
     list_filter = ('activo', 'fecha_registro')
     search_fields = ('rut', 'nombre')
@@ -16,9 +28,88 @@ class EmisorAdmin(admin.ModelAdmin):
 # Para asegurar que admin pueda crear analistas (usuarios con is_staff=True)
 # Django ya lo permite por defecto en /admin/auth/user/
 
-admin.site.register(FactorTributario)
-admin.site.register(BitacoraAccesos)
-admin.site.register(CargaMasiva)
-admin.site.register(HistorialAuditoria)
+
+@admin.register(FactorTributario)
+class FactorTributarioAdmin(admin.ModelAdmin):
+    list_display = ('codigo', 'descripcion', 'vigente')
+    list_filter = ('vigente',)
+    search_fields = ('codigo', 'descripcion')
+
+
 admin.site.register(Reporte)
-admin.site.register(Calificacion)
+
+
+@admin.register(Calificacion)
+class CalificacionAdmin(AdminTablaGrande):
+    list_display = ('id', 'emisor', 'factor', 'usuario', 'fecha_asignacion')
+    list_select_related = ('emisor', 'factor', 'usuario')
+    # Búsqueda exacta por RUT: usa el índice único (un icontains recorrería todos los emisores)
+    search_fields = ('emisor__rut__exact',)
+    date_hierarchy = 'fecha_asignacion'
+    autocomplete_fields = ('emisor', 'factor', 'usuario')
+    readonly_fields = ('fecha_asignacion', 'fecha_modificacion')
+
+    # Los borrados del admin, como los de calificacion_delete y las operaciones masivas,
+    # cierran las versiones y dejan su evento en el outbox en la misma transacción
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            self._eliminar(Calificacion.objects.filter(pk=obj.pk))
+            perfiles.invalidar([obj.emisor_id])
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            self._eliminar(queryset)
+            # "Seleccionar todos" puede abarcar cualquier cantidad de emisores
+            perfiles.invalidar_todos()
+
+    def _eliminar(self, queryset):
+        cerrar_versiones(queryset)
+        outbox.registrar_queryset(outbox.CALIFICACION, 'ELIMINAR', queryset, origen='admin')
+        queryset.delete()
+
+
+@admin.register(HistorialAuditoria)
+class HistorialAuditoriaAdmin(AdminTablaGrande):
+    list_display = ('fecha', 'accion', 'usuario', 'emisor', 'factor_anterior', 'factor_nuevo')
+    list_select_related = ('usuario', 'emisor')
+    list_filter = ('accion',)
+    date_hierarchy = 'fecha'
+    autocomplete_fields = ('usuario', 'emisor')
+
+
+@admin.register(BitacoraAccesos)
+class BitacoraAccesosAdmin(AdminTablaGrande):
+    list_display = ('fecha', 'usuario', 'ip')
+    list_select_related = ('usuario',)
+    date_hierarchy = 'fecha'
+    autocomplete_fields = ('usuario',)
+
+
+@admin.register(OperacionMasiva)
+class OperacionMasivaAdmin(admin.ModelAdmin):
+    list_display = ('id', 'tipo', 'estado', 'total', 'afectadas', 'omitidas', 'usuario', 'fecha_creacion', 'fecha_fin')
+    list_filter = ('tipo', 'estado')
+    readonly_fields = ('total', 'afectadas', 'omitidas', 'error', 'fecha_creacion', 'fecha_fin')
+
+
+@admin.register(CargaMasiva)
+class CargaMasivaAdmin(AdminTablaGrande):
+    list_display = ('id', 'nombre', 'usuario', 'estado', 'filas_estimadas', 'registros_procesados',
+                    'registros_erroneos', 'fecha', 'fecha_inicio', 'fecha_fin')
+    list_select_related = ('usuario',)
+    list_filter = ('estado',)
+    autocomplete_fields = ('usuario',)
+    readonly_fields = ('fecha_inicio', 'fecha_fin', 'fecha_latido')
+
+
+@admin.register(CalificacionVersion)
+class CalificacionVersionAdmin(AdminTablaGrande):
+    list_display = ('calificacion_id', 'emisor', 'factor_id', 'comentario', 'valido_desde', 'valido_hasta')
+    list_select_related = ('emisor',)
+    raw_id_fields = ('calificacion', 'emisor', 'factor', 'usuario')
+
+
+@admin.register(EventoOutbox)
+class EventoOutboxAdmin(AdminTablaGrande):
+    list_display = ('id', 'posicion', 'entidad', 'operacion', 'fecha')
+    list_filter = ('entidad', 'operacion')
@@ -0,0 +1,61 @@
+"""Cache en servidor de las tablas de los listados de emisores y factores.
+
+La tabla renderizada se guarda por listado, rol (corredor/analista/admin) y número de
+generación del listado. Toda escritura sobre emisores o factores sube la generación con
+`invalidar()`, al confirmarse su transacción (antes, un request concurrente guardaría bajo
+la generación nueva las filas aún sin confirmar): las claves anteriores dejan de usarse y
+expiran solas. Un acierto no
+ejecuta la consulta ni renderiza el template (el queryset se evalúa recién al renderizar).
+
+Las escrituras con save()/delete() invalidan vía signals; las de conjunto (update(),
+bulk_create) llaman a `invalidar()` explícitamente. Con varios procesos, CACHE_URL debe
+apuntar a una cache compartida (Redis, Memcached) para que la invalidación llegue a todos.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.template.loader import render_to_string
+
+from .roles import roles_de
+
+EMISORES = 'emisores'
+FACTORES = 'factores'
+
+
+def _clave_generacion(listado):
+    return f'listas:generacion:{listado}'
+
+
+def generacion(listado):
+    # Parte de la hora actual: si la cache pierde la clave, no se reutilizan generaciones viejas
+    return cache.get_or_set(_clave_generacion(listado), time.time_ns, timeout=None)
+
+
+def invalidar(*listados):
+    """Sube la generación de los listados (todos si no se indican) al confirmarse la transacción en curso."""
+    listados = listados or (EMISORES, FACTORES)
+
+    def subir():
+        for listado in listados:
+            try:
+                cache.incr(_clave_generacion(listado))
+            except ValueError:
+                # Sin generación guardada (cache nueva o expulsada)
+                cache.set(_clave_generacion(listado), time.time_ns(), timeout=None)
+    transaction.on_commit(subir)
+
+
+def tabla(listado, request, template, contexto):
+    """HTML de la tabla del listado para el rol del usuario, desde la cache o renderizado.
+
+    `contexto` debe ser perezoso (querysets sin evaluar): en un acierto no se toca.
+    """
+    roles_usuario = roles_de(request)
+    clave = f'listas:{listado}:{generacion(listado)}:{roles_usuario.nombre}'
+    html = cache.get(clave)
+    if html is None:
+        html = render_to_string(template, {**contexto, 'puede_editar': roles_usuario.es_analista})
+        cache.set(clave, html, settings.LISTAS_CACHE_SEGUNDOS)
+    return html
@@ -0,0 +1,221 @@
+"""Cola de cargas masivas: tope global de cargas simultáneas, equidad por usuario y archivos chicos primero.
+
+Cada carga se registra como `CargaMasiva` en estado EN_COLA y el request que la recibió
+espera su turno (`turno()`). Las decisiones de admisión se toman con la BD como
+coordinadora, así que el tope vale para todos los procesos y servidores:
+
+- Como máximo `tope()` cargas EN_CURSO a la vez: CARGAS_MAX_CONCURRENTES, pero sin usar
+  las CARGAS_RESERVA_INTERACTIVA conexiones (de CARGAS_CAPACIDAD_BD) que quedan para las
+  páginas interactivas.
+- Orden de admisión: primero los usuarios con menos cargas en curso, luego los archivos
+  con menos filas; una carga que espera más de CARGAS_ENVEJECIMIENTO_SEGUNDOS pasa
+  adelante de las más chicas, para que un archivo grande no espere para siempre.
+- Una carga sin latido por CARGAS_LATIDO_VENCIDO segundos se da por muerta (proceso
+  caído) y libera su turno. Mientras espera, el latido lo renueva el bucle de espera; en
+  curso, un hilo lo renueva cada CARGAS_LATIDO_VENCIDO / 4 segundos (también durante la
+  preparación y los lotes largos), y cada lote confirma su avance con `avanzar()`, que
+  falla si la carga ya se dio por muerta, para que el lote se revierta en vez de
+  escribir sin turno.
+
+La posición y la espera estimada (filas pendientes por delante / filas por segundo de las
+últimas cargas) se informan con `estado_cola()`.
+"""
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import CargaMasiva
+
+# Filas aproximadas por byte de un .xlsx (comprimido) cuando no se pueden contar al subir
+BYTES_POR_FILA_XLSX = 25
+# Clave del advisory lock de PostgreSQL que serializa las admisiones entre procesos
+_LLAVE_ADMISION = 460046
+_lock_admision = threading.Lock()
+
+
+def tope():
+    """Cargas simultáneas permitidas (al menos una)."""
+    disponibles = settings.CARGAS_CAPACIDAD_BD - settings.CARGAS_RESERVA_INTERACTIVA
+    return max(1, min(settings.CARGAS_MAX_CONCURRENTES, disponibles))
+
+
+def filas_estimadas(nombre, tamano, filas=None):
+    if filas is not None:
+        return filas
+    return tamano // BYTES_POR_FILA_XLSX if nombre.lower().endswith('.xlsx') else 0
+
+
+def _clave_orden(carga, activas, ahora):
+    envejecida = ahora - carga.fecha >= timedelta(seconds=settings.CARGAS_ENVEJECIMIENTO_SEGUNDOS)
+    return (activas[carga.usuario_id], not envejecida, carga.filas_estimadas, carga.fecha, carga.id)
+
+
+def _orden_admision(en_cola, en_curso, ahora):
+    """Cargas en cola en el orden en que se admitirían, contando las que cada usuario ya tiene en curso."""
+    activas = Counter(carga.usuario_id for carga in en_curso)
+    pendientes = list(en_cola)
+    orden = []
+    while pendientes:
+        siguiente = min(pendientes, key=lambda carga: _clave_orden(carga, activas, ahora))
+        pendientes.remove(siguiente)
+        orden.append(siguiente)
+        activas[siguiente.usuario_id] += 1
+    return orden
+
+
+def _vigentes(ahora):
+    """Cargas en cola y en curso, tras dar por fallidas las que perdieron el latido."""
+    vencimiento = ahora - timedelta(seconds=settings.CARGAS_LATIDO_VENCIDO)
+    CargaMasiva.objects.filter(estado__in=['EN_COLA', 'EN_CURSO'], fecha_latido__lt=vencimiento).update(
+        estado='FALLIDA', fecha_fin=ahora
+    )
+    cargas = list(CargaMasiva.objects.filter(estado__in=['EN_COLA', 'EN_CURSO']).order_by('fecha', 'id'))
+    return [c for c in cargas if c.estado == 'EN_COLA'], [c for c in cargas if c.estado == 'EN_CURSO']
+
+
+def _admitir():
+    """Pasa a EN_CURSO las primeras cargas de la cola mientras haya turnos libres."""
+    with _lock_admision, transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_xact_lock(%s)', [_LLAVE_ADMISION])
+        ahora = timezone.now()
+        en_cola, en_curso = _vigentes(ahora)
+        libres = tope() - len(en_curso)
+        if libres <= 0 or not en_cola:
+            return
+        admitidas = [carga.id for carga in _orden_admision(en_cola, en_curso, ahora)[:libres]]
+        CargaMasiva.objects.filter(id__in=admitidas, estado='EN_COLA').update(
+            estado='EN_CURSO', fecha_inicio=ahora, fecha_latido=ahora
+        )
+
+
+def _filas_por_segundo():
+    """Ritmo de las últimas cargas terminadas (o CARGAS_FILAS_POR_SEGUNDO si no hay datos)."""
+    recientes = CargaMasiva.objects.filter(
+        estado='TERMINADA', fecha_inicio__isnull=False, registros_procesados__gt=0,
+    ).order_by('-fecha_fin').values_list('registros_procesados', 'fecha_inicio', 'fecha_fin')[:20]
+    filas = segundos = 0
+    for procesadas, inicio, fin in recientes:
+        filas += procesadas
+        segundos += (fin - inicio).total_seconds()
+    return filas / segundos if filas and segundos > 0 else settings.CARGAS_FILAS_POR_SEGUNDO
+
+
+def estado_cola(carga):
+    """Estado, posición en la cola (None si no está en cola) y espera estimada en segundos."""
+    carga.refresh_from_db()
+    datos = {
+        'id': carga.id,
+        'nombre': carga.nombre,
+        'estado': carga.estado,
+        'posicion': None,
+        'espera_estimada': 0,
+        'procesadas': carga.registros_procesados,
+        'filas_estimadas': carga.filas_estimadas,
+    }
+    if carga.estado != 'EN_COLA':
+        return datos
+    ahora = timezone.now()
+    en_cola, en_curso = _vigentes(ahora)
+    orden = _orden_admision(en_cola, en_curso, ahora)
+    posicion = next((i for i, c in enumerate(orden) if c.id == carga.id), len(orden))
+    pendientes = sum(max(c.filas_estimadas - c.registros_procesados, 0) for c in en_curso)
+    pendientes += sum(c.filas_estimadas for c in orden[:posicion])
+    datos['posicion'] = posicion + 1
+    datos['espera_estimada'] = round(pendientes / (_filas_por_segundo() * tope()))
+    return datos
+
+
+class TurnoPerdido(RuntimeError):
+    """La carga dejó de estar EN_CURSO (se dio por muerta) mientras se procesaba."""
+
+
+def _latido(carga, **campos):
+    return CargaMasiva.objects.filter(pk=carga.pk, estado=carga.estado).update(
+        fecha_latido=timezone.now(), **campos
+    )
+
+
+def avanzar(carga, procesadas, errores):
+    """Registra el avance de una carga en curso (y renueva su latido).
+
+    Se llama dentro de la transacción del lote, antes de confirmarla: el UPDATE bloquea la
+    fila de la carga hasta el COMMIT, así que no se puede dar por muerta entremedio, y si
+    ya se dio por muerta lanza TurnoPerdido y el lote se revierte.
+    """
+    if not _latido(carga, registros_procesados=procesadas, registros_erroneos=errores):
+        raise TurnoPerdido('La carga se dio por muerta (sin latido); vuelve a intentarlo.')
+
+
+@contextmanager
+def _latido_periodico(carga):
+    """Renueva el latido de la carga desde un hilo mientras dura el bloque."""
+    detener = threading.Event()
+
+    def renovar():
+        while not detener.wait(settings.CARGAS_LATIDO_VENCIDO / 4):
+            try:
+                _latido(carga)
+            finally:
+                # El hilo usa su propia conexión y no la retiene entre latidos
+                connection.close()
+
+    hilo = threading.Thread(target=renovar, name=f'latido-carga-{carga.pk}', daemon=True)
+    hilo.start()
+    try:
+        yield
+    finally:
+        detener.set()
+        hilo.join()
+
+
+@contextmanager
+def turno(usuario, nombre, tamano, filas=None, al_esperar=None):
+    """Registra la carga, espera su turno y la marca TERMINADA o FALLIDA al salir.
+
+    `al_esperar(estado)` se llama mientras la carga está en cola, con `estado_cola()`.
+    """
+    ahora = timezone.now()
+    carga = CargaMasiva.objects.create(
+        usuario=usuario, nombre=nombre[:255], tamano=tamano,
+        filas_estimadas=filas_estimadas(nombre, tamano, filas), fecha_latido=ahora,
+    )
+    try:
+        while True:
+            _admitir()
+            estado = estado_cola(carga)
+            if estado['estado'] == 'EN_CURSO':
+                break
+            if estado['estado'] != 'EN_COLA':
+                raise RuntimeError('La carga perdió su turno en la cola; vuelve a intentarlo.')
+            if al_esperar:
+                al_esperar(estado)
+            if not connection.in_atomic_block:
+                # La espera no retiene una conexión (la que devuelve al pool es de las interactivas)
+                connection.close()
+            time.sleep(settings.CARGAS_INTERVALO_SEGUNDOS)
+            _latido(carga)
+        carga.estado = 'EN_CURSO'
+        with _latido_periodico(carga):
+            yield carga
+    except BaseException:
+        CargaMasiva.objects.filter(pk=carga.pk).update(estado='FALLIDA', fecha_fin=timezone.now())
+        raise
+    if not CargaMasiva.objects.filter(pk=carga.pk, estado='EN_CURSO').update(
+            estado='TERMINADA', fecha_fin=timezone.now()):
+        raise TurnoPerdido('La carga se dio por muerta (sin latido) antes de terminar; revisa lo cargado.')
+
+
+def cargas_del_usuario(usuario):
+    """Cargas del usuario en cola o en curso, con su posición y espera estimada."""
+    return [
+        estado_cola(carga)
+        for carga in CargaMasiva.objects.filter(usuario=usuario, estado__in=['EN_COLA', 'EN_CURSO']).order_by('fecha')
+    ]
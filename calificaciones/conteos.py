@@ -0,0 +1,120 @@
+"""Conteos de filas sin recorrer tablas grandes completas.
+
+En PostgreSQL un COUNT(*) sin filtro lee la tabla entera. `contar()` cuenta exacto solo
+hasta CONTEO_EXACTO_MAX filas (`COUNT` sobre un `LIMIT`, que se detiene ahí). Por sobre
+eso devuelve, en orden:
+
+- El conteo exacto de la tabla completa guardado en cache por `actualizar_exacto()`
+  (comando `actualizar_conteos`, periódico), si el queryset no tiene filtros.
+- La estimación del planificador: `pg_class.reltuples` sin filtros, o las filas estimadas
+  por EXPLAIN con filtros. En otros motores no hay estimación y se cuenta exacto.
+
+Cada `Conteo` indica de cuál de estas fuentes salió, para mostrarlo en la UI.
+"""
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+EXACTO = 'exacto'
+CACHE = 'cache'
+ESTIMADO = 'estimado'
+
+# Tablas cuyo conteo exacto mantiene el comando actualizar_conteos
+TABLAS_GRANDES = [
+    'calificaciones.Calificacion',
+    'calificaciones.HistorialAuditoria',
+    'calificaciones.BitacoraAccesos',
+    'calificaciones.CalificacionVersion',
+]
+
+
+class Conteo:
+    """Cantidad de filas y su tipo: EXACTO, CACHE (exacto a `fecha`) o ESTIMADO."""
+
+    def __init__(self, valor, tipo, fecha=None):
+        self.valor = valor
+        self.tipo = tipo
+        self.fecha = fecha
+
+    @property
+    def exacto(self):
+        return self.tipo == EXACTO
+
+    def __repr__(self):
+        return f'Conteo({self.valor}, {self.tipo!r})'
+
+
+def contar_hasta(queryset, limite):
+    """Filas del queryset si son a lo más `limite`; None si hay más."""
+    cantidad = queryset.order_by()[:limite + 1].count()
+    return cantidad if cantidad <= limite else None
+
+
+def estimar(queryset):
+    """Filas estimadas por el planificador de PostgreSQL, o None en otros motores."""
+    conexion = connections[queryset.db]
+    if conexion.vendor != 'postgresql':
+        return None
+    queryset = queryset.order_by()
+    with conexion.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                           [queryset.model._meta.db_table])
+            fila = cursor.fetchone()
+            # reltuples es -1 si la tabla nunca se analizó (PostgreSQL 14+)
+            if fila and fila[0] >= 0:
+                return int(fila[0])
+        sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def _clave_cache(modelo):
+    return f'conteos:{modelo._meta.label_lower}'
+
+
+def actualizar_exacto(modelo):
+    """Cuenta exacto la tabla completa y lo deja en cache por CONTEOS_CACHE_SEGUNDOS."""
+    valor = modelo._default_manager.count()
+    cache.set(_clave_cache(modelo), {'valor': valor, 'fecha': timezone.now()}, settings.CONTEOS_CACHE_SEGUNDOS)
+    return valor
+
+
+def contar(queryset):
+    """Conteo del queryset: exacto si es chico, si no el exacto en cache o la estimación."""
+    limite = settings.CONTEO_EXACTO_MAX
+    exacto = contar_hasta(queryset, limite)
+    if exacto is not None:
+        return Conteo(exacto, EXACTO)
+    if not queryset.query.where:
+        guardado = cache.get(_clave_cache(queryset.model))
+        if guardado is not None:
+            return Conteo(guardado['valor'], CACHE, guardado['fecha'])
+    estimado = estimar(queryset)
+    if estimado is None:
+        return Conteo(queryset.count(), EXACTO)
+    return Conteo(max(estimado, limite + 1), ESTIMADO)
+
+
+class PaginadorEstimado(Paginator):
+    """Paginator que cuenta con `contar()`: exacto hasta CONTEO_EXACTO_MAX filas, aproximado sobre eso.
+
+    Para el admin de tablas grandes (junto con `show_full_result_count = False`): las
+    últimas páginas pueden quedar vacías o faltar si la estimación se aleja del total real.
+    """
+
+    @cached_property
+    def conteo(self):
+        return contar(self.object_list)
+
+    @cached_property
+    def count(self):
+        return self.conteo.valor
@@ -0,0 +1,8 @@
+from django.utils.functional import SimpleLazyObject
+
+from .roles import roles_de
+
+
+def roles(request):
+    # Perezoso: solo se resuelve si el template usa `roles`
+    return {'roles': SimpleLazyObject(lambda: roles_de(request))}
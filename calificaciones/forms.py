@@ -1,18 +1,23 @@
-import re
-
 from django import forms
+from django.conf import settings
+from django.urls import reverse_lazy
+from .importacion import MODO_ACTUALIZAR, MODO_INSERTAR
 from .models import Emisor, FactorTributario, Calificacion
+from .rut import RutInvalido, formatear_rut, validar_rut
 
 class EmisorForm(forms.ModelForm):
     def clean_rut(self):
         rut = (self.cleaned_data.get('rut') or '').strip().upper()
-        match = re.match(r'^\d{1,3}(?:\.?\d{3})*-([0-9K])$', rut)
-        if not match:
-            raise forms.ValidationError('Formato RUT inválido. Usa 12.345.678-9 y el DV solo puede ser 0-9 o K.')
-        dv = match.group(1)
-        if not (dv.isdigit() or dv == 'K'):
-            raise forms.ValidationError('El dígito verificador solo puede ser 0-9 o K.')
-        return rut
+        try:
+            numero = validar_rut(rut)
+        except RutInvalido:
+            raise forms.ValidationError(
+                'RUT inválido. Usa 12.345.678-5 y verifica el dígito verificador (0-9 o K).'
+            )
+        duplicado = Emisor.objects.filter(rut_numero=numero).exclude(pk=self.instance.pk)
+        if duplicado.exists():
+            raise forms.ValidationError('Ya existe un emisor con este RUT.')
+        return formatear_rut(numero)
 
     class Meta:
         model = Emisor
@@ -21,9 +26,9 @@ class EmisorForm(forms.ModelForm):
         widgets = {
             'rut': forms.TextInput(attrs={
                 'class': 'form-control',
-                'placeholder': 'Ej: 12.345.678-9',
+                'placeholder': 'Ej: 12.345.678-5',
                 'pattern': r'\d{1,3}(?:\.?\d{3})*-[0-9Kk]',
-                'title': 'Formato RUT: 12.345.678-9 (DV 0-9 o K)',
+                'title': 'Formato RUT: 12.345.678-5 (DV 0-9 o K)',
                 'inputmode': 'text',
                 'autocomplete': 'off',
             }),
@@ -42,12 +47,39 @@ class FactorForm(forms.ModelForm):
             'descripcion': forms.TextInput(attrs={'class': 'form-control'}),
         }
 
+class AutocompleteSelect(forms.Select):
+    """Select que solo renderiza la opción elegida; el resto se busca vía AJAX en `url`.
+
+    Evita consultar y renderizar todo el queryset del campo en cada página de formulario.
+    """
+
+    def __init__(self, url, attrs=None):
+        super().__init__(attrs)
+        self.url = url
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['attrs']['data-autocomplete-url'] = str(self.url)
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        seleccionados = [v for v in value if str(v).isdigit()]
+        opciones = [self.create_option(name, '', '---------', not seleccionados, 0)]
+        if seleccionados:
+            for indice, obj in enumerate(self.choices.queryset.filter(pk__in=seleccionados), start=1):
+                opciones.append(self.create_option(name, obj.pk, str(obj), True, indice))
+        return [(None, opciones, 0)]
+
+
 class CalificacionForm(forms.ModelForm):
     class Meta:
         model = Calificacion
         fields = ['emisor', 'factor', 'comentario']
         widgets = {
-            'emisor': forms.Select(attrs={'class': 'form-control select2'}),
+            'emisor': AutocompleteSelect(
+                url=reverse_lazy('emisor_autocompletar'),
+                attrs={'class': 'form-control select2'},
+            ),
             'factor': forms.Select(attrs={'class': 'form-control'}),
             'comentario': forms.Textarea(attrs={'class': 'form-control', 'rows': 3}),
         }
@@ -55,22 +87,41 @@ class CalificacionForm(forms.ModelForm):
 class CargaMasivaForm(forms.Form):
     """Formulario para cargar calificaciones desde Excel o CSV"""
     archivo = forms.FileField(
-        label='Archivo (.xlsx, .xls o .csv)',
-        help_text='El archivo debe tener columnas: RUT, Código Factor, Comentario (Máximo 10 MB)',
+        label='Archivo (.xlsx o .csv)',
         widget=forms.FileInput(attrs={
             'class': 'form-control',
-            'accept': '.xlsx,.xls,.csv',
+            'accept': '.xlsx,.csv',
         })
     )
-    
+    modo = forms.ChoiceField(
+        label='Calificaciones existentes',
+        choices=[
+            (MODO_INSERTAR, 'Omitir (solo cargar las nuevas)'),
+            (MODO_ACTUALIZAR, 'Actualizar el comentario'),
+        ],
+        initial=MODO_INSERTAR,
+        required=False,
+        widget=forms.RadioSelect(attrs={'class': 'form-check-input'}),
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['archivo'].help_text = (
+            'El archivo debe tener columnas: RUT, Código Factor, Comentario '
+            f'(Máximo {settings.CARGA_MASIVA_MAX_MB} MB)'
+        )
+
     def clean_archivo(self):
         archivo = self.cleaned_data.get('archivo')
         if archivo:
-            # Tamaño máximo: 10 MB
-            max_size = 10 * 1024 * 1024  # 10 MB en bytes
+            # Tamaño máximo configurable (CARGA_MASIVA_MAX_MB)
+            max_size = settings.CARGA_MASIVA_MAX_MB * 1024 * 1024
             if archivo.size > max_size:
                 raise forms.ValidationError(
                     f'El archivo es demasiado grande ({archivo.size / (1024*1024):.2f} MB). '
-                    f'El tamaño máximo permitido es 10 MB.'
+                    f'El tamaño máximo permitido es {settings.CARGA_MASIVA_MAX_MB} MB.'
                 )
-        return archivo
\ No newline at end of file
+        return archivo
+
+    def clean_modo(self):
+        return self.cleaned_data.get('modo') or MODO_INSERTAR
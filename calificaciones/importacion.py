@@ -0,0 +1,347 @@
+"""Carga masiva de calificaciones desde Excel o CSV con validación por lotes.
+
+Cada lote de filas se lleva a columnas (RUT, código de factor, comentario) y se valida
+columna a columna: la columna RUT se normaliza de una vez, los ids se resuelven con un
+solo `map` por columna contra los diccionarios en memoria y los pares ya existentes o
+repetidos se descartan con operaciones de conjunto. Solo las filas con error se
+recorren una a una, para armar los mismos mensajes de siempre.
+
+Dos modos de carga:
+
+- ``'insertar'`` (default): los pares (emisor, factor) que ya existen se omiten.
+- ``'actualizar'``: upsert por lotes. Los pares existentes cuyo comentario cambió se
+  reescriben con un solo ``INSERT ... ON CONFLICT DO UPDATE`` junto con los nuevos, y
+  sus diferencias quedan en la auditoría con un único bulk_create por lote. Los que
+  traen el mismo comentario no se tocan (no cambian `fecha_modificacion`).
+
+Con un `ReporteErrores` todas las filas rechazadas se escriben a un CSV a medida que se
+validan (el resultado trae solo los totales); sin él, el resultado trae los primeros
+MAX_ERRORES errores.
+"""
+import csv
+import io
+import tempfile
+from itertools import compress
+
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from . import outbox, perfiles
+from .models import Emisor, FactorTributario, Calificacion, HistorialAuditoria
+from .sql import insertar_ignorando
+from .rut import normalizar_ruts
+from .versiones import sincronizar_versiones
+from .xlsx import leer_filas_xlsx
+
+MAX_ERRORES = 100
+MODO_INSERTAR = 'insertar'
+MODO_ACTUALIZAR = 'actualizar'
+MODOS = (MODO_INSERTAR, MODO_ACTUALIZAR)
+
+
+def maps_emisores_factores():
+    """Carga ids de emisores activos (por RUT numérico) y factores en RAM para lookups O(1).
+
+    Los emisores dados de baja no se cargan (sus filas se informan como no encontradas);
+    el filtro calza con el índice parcial idx_emisor_rut_activo.
+    """
+    emisores_map = dict(
+        Emisor.objects.filter(activo=True).exclude(rut_numero=None).values_list('rut_numero', 'id')
+    )
+    factores_map = dict(FactorTributario.objects.values_list('codigo', 'id'))
+    return emisores_map, factores_map
+
+
+class ReporteErrores:
+    """CSV (fila, error) con todos los errores de una carga, escrito a un temporal mientras se procesa.
+
+    La memoria no crece con las filas rechazadas. `guardar()` lo adjunta a la CargaMasiva;
+    usar como context manager para cerrar el temporal también si la carga falla.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self._texto = io.TextIOWrapper(tempfile.TemporaryFile(), encoding='utf-8', newline='')
+        self._csv = csv.writer(self._texto)
+        self._csv.writerow(['fila', 'error'])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._texto.close()
+
+    def agregar(self, errores):
+        """Escribe errores {'fila', 'mensaje'} (los de validar_lote)."""
+        self._csv.writerows([error['fila'], error['mensaje']] for error in errores)
+        self.total += len(errores)
+
+    def guardar(self, carga):
+        """Adjunta el CSV a `carga` si hubo errores."""
+        if not self.total:
+            return
+        self._texto.flush()
+        self._texto.buffer.seek(0)
+        carga.archivo_errores.save(f'errores_carga_{carga.pk}.csv', File(self._texto.buffer), save=False)
+        # Solo este campo: los contadores de la instancia no están al día (cola_cargas.avanzar usa update())
+        carga.save(update_fields=['archivo_errores'])
+
+
+def en_lotes(filas, tamano):
+    """Agrupa un iterable de filas en listas de hasta `tamano` elementos."""
+    lote = []
+    for fila in filas:
+        lote.append(fila)
+        if len(lote) >= tamano:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def validar_lote(numeros, ruts, codigos, comentarios, emisores_map, factores_map, existentes, cupo_errores):
+    """Valida las columnas de un lote y devuelve (nuevas, errores, total_errores).
+
+    `nuevas` son tuplas (emisor_id, factor_id, comentario) a insertar; los pares que ya
+    están en `existentes` o se repiten dentro del lote se omiten (gana la primera
+    aparición) y `existentes` queda actualizado. `errores` trae a lo sumo
+    `cupo_errores` diccionarios {'fila', 'mensaje'}, en orden de fila.
+    """
+    ruts_numero = normalizar_ruts(ruts)
+    emisor_ids = list(map(emisores_map.get, ruts_numero))
+    factor_ids = list(map(factores_map.get, codigos))
+
+    validas = [bool(e and f) for e, f in zip(emisor_ids, factor_ids)]
+    total_errores = validas.count(False)
+
+    errores = []
+    if total_errores and cupo_errores > 0:
+        for i in compress(range(len(validas)), (not v for v in validas)):
+            if ruts_numero[i] is None:
+                mensaje = f"RUT {str(ruts[i]).strip()} inválido"
+            elif not emisor_ids[i]:
+                mensaje = f"Emisor con RUT {str(ruts[i]).strip()} no encontrado"
+            else:
+                mensaje = f"Factor {codigos[i]} no encontrado"
+            errores.append({'fila': numeros[i], 'mensaje': mensaje})
+            if len(errores) >= cupo_errores:
+                break
+
+    claves = list(compress(zip(emisor_ids, factor_ids), validas))
+    comentarios = list(compress(comentarios, validas))
+    # Recorrido inverso: ante pares repetidos en el lote, el valor que queda es el de la primera fila
+    candidatas = dict(zip(reversed(claves), reversed(comentarios)))
+    for clave in existentes.intersection(candidatas):
+        del candidatas[clave]
+    existentes.update(candidatas)
+
+    nuevas = [(emisor_id, factor_id, comentario) for (emisor_id, factor_id), comentario in candidatas.items()]
+    nuevas.reverse()
+    return nuevas, errores, total_errores
+
+
+def _columnas_excel(lote):
+    """Columnas de un lote de filas de Excel (tuplas de valores); omite filas sin RUT o factor."""
+    lote = [(numero, fila) for numero, fila in lote if len(fila) > 1 and fila[0] and fila[1]]
+    return (
+        [numero for numero, _ in lote],
+        [fila[0] for _, fila in lote],
+        [str(fila[1]).strip() for _, fila in lote],
+        [(fila[2] if len(fila) > 2 else "") or "" for _, fila in lote],
+    )
+
+
+def _columnas_csv(lote):
+    """Columnas de un lote de filas de csv.DictReader; omite filas sin RUT o factor."""
+    filas = [
+        (
+            numero,
+            (fila.get('RUT', '') or '').strip(),
+            (fila.get('Código Factor', '') or '').strip(),
+            (fila.get('Comentario', '') or '').strip(),
+        )
+        for numero, fila in lote
+    ]
+    filas = [fila for fila in filas if fila[1] and fila[2]]
+    if not filas:
+        return [], [], [], []
+    return tuple(list(columna) for columna in zip(*filas))
+
+
+def _comentarios_actuales(claves):
+    """Comentario actual de cada par (emisor_id, factor_id) de `claves`, en una consulta."""
+    filas = Calificacion.objects.filter(
+        emisor_id__in={emisor_id for emisor_id, _ in claves},
+        factor_id__in={factor_id for _, factor_id in claves},
+    ).values_list('emisor_id', 'factor_id', 'comentario')
+    return {(emisor_id, factor_id): comentario or "" for emisor_id, factor_id, comentario in filas
+            if (emisor_id, factor_id) in claves}
+
+
+def _ids_escritos(calificaciones):
+    """Ids de las calificaciones recién escritas con bulk_create(update_conflicts=True).
+
+    PostgreSQL y SQLite los devuelven en el mismo INSERT (RETURNING, también para las filas
+    actualizadas); en otros motores se buscan por su par (emisor, factor), que es único.
+    """
+    if all(calificacion.pk is not None for calificacion in calificaciones):
+        return [calificacion.pk for calificacion in calificaciones]
+    claves = {(calificacion.emisor_id, calificacion.factor_id) for calificacion in calificaciones}
+    filas = Calificacion.objects.filter(
+        emisor_id__in={emisor_id for emisor_id, _ in claves},
+        factor_id__in={factor_id for _, factor_id in claves},
+    ).values_list('pk', 'emisor_id', 'factor_id')
+    return [pk for pk, emisor_id, factor_id in filas if (emisor_id, factor_id) in claves]
+
+
+def insertar_lote(calificaciones, origen='carga_masiva'):
+    """Inserta un lote de calificaciones nuevas, omitiendo los pares que ya existan; devuelve cuántas creó.
+
+    Solo las filas que este INSERT creó (no las de otras cargas u operaciones concurrentes)
+    reciben versión y evento de outbox.
+    """
+    with transaction.atomic():
+        ids = insertar_ignorando(calificaciones)
+        sincronizar_versiones(Calificacion.objects.filter(pk__in=ids))
+        outbox.registrar_ids(outbox.CALIFICACION, 'CREAR', ids, origen=origen)
+        perfiles.invalidar(calificacion.emisor_id for calificacion in calificaciones)
+    return len(ids)
+
+
+def _upsert_lote(nuevas, en_bd, usuario, codigos_factor):
+    """Inserta o actualiza un lote validado; devuelve (creadas, actualizadas, sin_cambios)."""
+    existentes = {(emisor_id, factor_id) for emisor_id, factor_id, _ in nuevas} & en_bd
+    actuales = _comentarios_actuales(existentes) if existentes else {}
+
+    escribir = []
+    auditoria = []
+    sin_cambios = 0
+    for emisor_id, factor_id, comentario in nuevas:
+        comentario = str(comentario)
+        anterior = actuales.get((emisor_id, factor_id))
+        if anterior is not None:
+            if anterior == comentario:
+                sin_cambios += 1
+                continue
+            codigo = codigos_factor[factor_id]
+            auditoria.append(HistorialAuditoria(
+                accion='EDITAR',
+                usuario=usuario,
+                emisor_id=emisor_id,
+                factor_anterior=codigo,
+                factor_nuevo=codigo,
+                comentario_anterior=anterior,
+                comentario_nuevo=comentario,
+            ))
+        escribir.append((emisor_id, factor_id, comentario))
+
+    if escribir:
+        ahora = timezone.now()
+        with transaction.atomic():
+            escritas = Calificacion.objects.bulk_create(
+                [
+                    Calificacion(emisor_id=emisor_id, factor_id=factor_id, usuario=usuario,
+                                 comentario=comentario, fecha_modificacion=ahora)
+                    for emisor_id, factor_id, comentario in escribir
+                ],
+                update_conflicts=True,
+                unique_fields=['emisor', 'factor'],
+                update_fields=['comentario', 'usuario', 'fecha_modificacion'],
+            )
+            if auditoria:
+                HistorialAuditoria.objects.bulk_create(auditoria)
+            ids = _ids_escritos(escritas)
+            sincronizar_versiones(Calificacion.objects.filter(pk__in=ids))
+            # Un evento por lote: creadas y actualizadas juntas
+            outbox.registrar_ids(outbox.CALIFICACION, 'ACTUALIZAR', ids, origen='carga_masiva')
+            perfiles.invalidar(emisor_id for emisor_id, _, _ in escribir)
+    actualizadas = len(auditoria)
+    return len(escribir) - actualizadas, actualizadas, sin_cambios
+
+
+def _procesar_filas(filas, columnas, usuario, chunk_size, modo=MODO_INSERTAR, al_avanzar=None, reporte=None):
+    """Valida e inserta (o, en modo 'actualizar', hace upsert) por lotes las filas numeradas de un archivo.
+
+    `al_avanzar(avance)`, si se indica, se llama al final de cada lote (dentro de su transacción)
+    con los contadores acumulados; si lanza una excepción, el lote se revierte.
+    Con `reporte` (ReporteErrores) los errores van todos al reporte y no al resultado.
+    """
+    if modo not in MODOS:
+        raise ValueError(f"Modo de carga desconocido: {modo!r} (opciones: {', '.join(MODOS)})")
+    emisores_map, factores_map = maps_emisores_factores()
+    en_bd = set(Calificacion.objects.values_list('emisor_id', 'factor_id'))
+    if modo == MODO_ACTUALIZAR:
+        # validar_lote descarta solo los pares ya vistos en el archivo; los de la BD se actualizan
+        vistas = set()
+        codigos_factor = {factor_id: codigo for codigo, factor_id in factores_map.items()}
+    else:
+        vistas = en_bd
+
+    creadas = actualizadas = sin_cambios = procesadas = 0
+    errores = []
+    errores_totales = 0
+
+    for lote in en_lotes(filas, chunk_size):
+        procesadas += len(lote)
+        # Con reporte se piden todos los errores del lote (a lo más chunk_size)
+        cupo = chunk_size if reporte is not None else MAX_ERRORES - len(errores)
+        nuevas, errores_lote, total = validar_lote(*columnas(lote), emisores_map, factores_map, vistas, cupo)
+        if reporte is not None:
+            reporte.agregar(errores_lote)
+        else:
+            errores.extend(errores_lote)
+        errores_totales += total
+
+        # El avance se registra dentro de la transacción del lote: si falla (la carga perdió
+        # su turno, ver cola_cargas.avanzar) el lote se revierte
+        with transaction.atomic():
+            if nuevas and modo == MODO_ACTUALIZAR:
+                c, a, s = _upsert_lote(nuevas, en_bd, usuario, codigos_factor)
+                creadas += c
+                actualizadas += a
+                sin_cambios += s
+            elif nuevas:
+                creadas += insertar_lote([
+                    Calificacion(emisor_id=emisor_id, factor_id=factor_id, usuario=usuario, comentario=comentario)
+                    for emisor_id, factor_id, comentario in nuevas
+                ])
+            if al_avanzar:
+                al_avanzar({'procesadas': procesadas, 'creadas': creadas, 'actualizadas': actualizadas,
+                            'errores': errores_totales})
+
+    mensaje = f"✓ {creadas} calificaciones cargadas exitosamente"
+    if modo == MODO_ACTUALIZAR:
+        mensaje += f", {actualizadas} actualizadas y {sin_cambios} sin cambios"
+    if errores_totales:
+        mensaje += f" ({errores_totales} errores)"
+
+    return {
+        'creadas': creadas,
+        'actualizadas': actualizadas,
+        'sin_cambios': sin_cambios,
+        'errores': errores,
+        'errores_totales': errores_totales,
+        'mensaje': mensaje
+    }
+
+
+def procesar_excel_calificaciones(archivo, usuario, chunk_size=2000, modo=MODO_INSERTAR, al_avanzar=None,
+                                  reporte=None):
+    """Procesa Excel con validación por lotes y bulk_create por lote."""
+    filas = enumerate(leer_filas_xlsx(archivo, desde_fila=2), start=2)
+    return _procesar_filas(filas, _columnas_excel, usuario, chunk_size, modo, al_avanzar, reporte)
+
+
+def procesar_csv_calificaciones(archivo, usuario, chunk_size=2000, modo=MODO_INSERTAR, al_avanzar=None,
+                                reporte=None):
+    """Procesa CSV en streaming (sin copiar el archivo a memoria) con validación por lotes."""
+    # Archivo subido de Django -> archivo subyacente (temporal en disco o BytesIO)
+    texto = io.TextIOWrapper(getattr(archivo, 'file', archivo), encoding='utf-8', newline='')
+    try:
+        reader = csv.DictReader(texto)
+        return _procesar_filas(enumerate(reader, start=2), _columnas_csv, usuario, chunk_size, modo, al_avanzar,
+                               reporte)
+    finally:
+        # Se suelta el archivo sin cerrarlo: lo cierra quien lo abrió
+        texto.detach()
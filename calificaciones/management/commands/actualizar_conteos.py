@@ -0,0 +1,25 @@
+"""Guarda en cache el conteo exacto de las tablas grandes (ver calificaciones/conteos.py)."""
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from calificaciones.conteos import TABLAS_GRANDES, actualizar_exacto
+
+
+class Command(BaseCommand):
+    help = 'Cuenta exacto las tablas grandes y lo deja en cache para los totales de los listados'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seguir', action='store_true', help='Repite el conteo cada --intervalo segundos')
+        parser.add_argument('--intervalo', type=float, default=600.0, help='Segundos entre conteos con --seguir')
+
+    def handle(self, *args, **options):
+        while True:
+            for etiqueta in TABLAS_GRANDES:
+                inicio = time.perf_counter()
+                valor = actualizar_exacto(apps.get_model(etiqueta))
+                self.stdout.write(f'{etiqueta}: {valor} filas ({time.perf_counter() - inicio:.2f}s)')
+            if not options['seguir']:
+                break
+            time.sleep(options['intervalo'])
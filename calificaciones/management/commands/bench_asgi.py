@@ -0,0 +1,145 @@
+"""Compara requests/seg de los endpoints JSON bajo ASGI y WSGI con clientes concurrentes."""
+import asyncio
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+
+from calificaciones.models import Emisor, FactorTributario, Calificacion
+
+HOST = 'localhost'
+
+
+class Command(BaseCommand):
+    help = 'Load test en proceso: requests/seg de los endpoints JSON bajo ASGI vs WSGI'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000,
+                            help='Total de requests por escenario (default: 2000)')
+        parser.add_argument('--concurrencia', type=int, default=50,
+                            help='Clientes concurrentes (default: 50)')
+        parser.add_argument('--usuario', default='analista',
+                            help='Usuario existente con el que se autentican los clientes')
+        parser.add_argument('--url', action='append', dest='urls',
+                            help='URL a medir (repetible). Por defecto los endpoints detalle_* y api_*')
+
+    def handle(self, *args, **options):
+        try:
+            usuario = User.objects.get(username=options['usuario'])
+        except User.DoesNotExist:
+            raise CommandError(f"El usuario '{options['usuario']}' no existe.")
+
+        urls = options['urls'] or self._urls_por_defecto()
+        if not urls:
+            raise CommandError('No hay datos para construir las URLs. Carga datos o usa --url.')
+
+        client = Client()
+        client.force_login(usuario)
+        cookie = f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+
+        total = options['requests']
+        concurrencia = options['concurrencia']
+        self.stdout.write(f'{total} requests, {concurrencia} clientes concurrentes, {len(urls)} URL(s)')
+
+        for url in urls:
+            wsgi = self._medir_wsgi(url, cookie, total, concurrencia)
+            asgi = asyncio.run(self._medir_asgi(url, cookie, total, concurrencia))
+            self.stdout.write(self.style.SUCCESS(url))
+            for nombre, (segundos, estados) in (('WSGI', wsgi), ('ASGI', asgi)):
+                self.stdout.write(
+                    f'  {nombre}: {total / segundos:,.0f} req/s ({segundos:.2f} s) estados={estados}'
+                )
+
+    def _urls_por_defecto(self):
+        urls = [reverse('api_emisores'), reverse('api_factores'), reverse('api_calificaciones')]
+        emisor = Emisor.objects.order_by('id').values_list('id', flat=True).first()
+        factor = FactorTributario.objects.order_by('id').values_list('id', flat=True).first()
+        calificacion = Calificacion.objects.order_by('id').values_list('id', flat=True).first()
+        if emisor:
+            urls.append(reverse('detalle_emisor', args=[emisor]))
+        if factor:
+            urls.append(reverse('detalle_factor', args=[factor]))
+        if calificacion:
+            urls.append(reverse('detalle_calificacion_api', args=[calificacion]))
+        return urls
+
+    def _medir_wsgi(self, url, cookie, total, concurrencia):
+        handler = WSGIHandler()
+        partes = urlsplit(url)
+        estados = {}
+
+        def una_peticion(_):
+            environ = {
+                'REQUEST_METHOD': 'GET',
+                'PATH_INFO': partes.path,
+                'QUERY_STRING': partes.query,
+                'SERVER_NAME': HOST,
+                'SERVER_PORT': '80',
+                'SERVER_PROTOCOL': 'HTTP/1.1',
+                'HTTP_HOST': HOST,
+                'HTTP_COOKIE': cookie,
+                'wsgi.url_scheme': 'http',
+                'wsgi.input': io.BytesIO(b''),
+                'wsgi.errors': io.StringIO(),
+            }
+            estado = []
+            respuesta = handler(environ, lambda status, headers: estado.append(status))
+            b''.join(respuesta)
+            respuesta.close()
+            return estado[0].split(' ', 1)[0]
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+            for codigo in pool.map(una_peticion, range(total)):
+                estados[codigo] = estados.get(codigo, 0) + 1
+        return time.perf_counter() - inicio, estados
+
+    async def _medir_asgi(self, url, cookie, total, concurrencia):
+        handler = ASGIHandler()
+        partes = urlsplit(url)
+        semaforo = asyncio.Semaphore(concurrencia)
+        estados = {}
+
+        async def una_peticion():
+            scope = {
+                'type': 'http',
+                'asgi': {'version': '3.0'},
+                'http_version': '1.1',
+                'method': 'GET',
+                'scheme': 'http',
+                'path': partes.path,
+                'raw_path': partes.path.encode(),
+                'query_string': partes.query.encode(),
+                'headers': [(b'host', HOST.encode()), (b'cookie', cookie.encode())],
+                'client': ('127.0.0.1', 0),
+                'server': (HOST, 80),
+            }
+            cuerpo_enviado = False
+
+            async def receive():
+                nonlocal cuerpo_enviado
+                if not cuerpo_enviado:
+                    cuerpo_enviado = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                # Ningún cliente se desconecta: se bloquea hasta que Django cancele la escucha
+                await asyncio.Future()
+
+            async def send(mensaje):
+                if mensaje['type'] == 'http.response.start':
+                    codigo = str(mensaje['status'])
+                    estados[codigo] = estados.get(codigo, 0) + 1
+
+            async with semaforo:
+                await handler(scope, receive, send)
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(una_peticion() for _ in range(total)))
+        return time.perf_counter() - inicio, estados
@@ -0,0 +1,80 @@
+"""Mide el costo de conexión a la BD por request con y sin reutilización."""
+import statistics
+import time
+
+from django.core import signals
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = 'Mide el overhead de conexión por request (sin persistencia vs configuración actual)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iteraciones', type=int, default=200,
+                            help='Cantidad de requests simulados por escenario (default: 200)')
+        parser.add_argument('--database', default='default',
+                            help='Alias de la base de datos a medir (default: default)')
+
+    def handle(self, *args, **options):
+        iteraciones = options['iteraciones']
+        conn = connections[options['database']]
+        settings_dict = conn.settings_dict
+        max_age_original = settings_dict['CONN_MAX_AGE']
+        pool = bool(settings_dict.get('OPTIONS', {}).get('pool'))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Motor: {settings_dict['ENGINE']} | CONN_MAX_AGE={max_age_original} | "
+            f"CONN_HEALTH_CHECKS={settings_dict.get('CONN_HEALTH_CHECKS')} | pool={pool}"
+        ))
+
+        conn.close()
+        try:
+            # Escenario 1: una conexión nueva por request (CONN_MAX_AGE=0, sin pool)
+            if pool:
+                self.stdout.write(self.style.WARNING(
+                    'Pool activo: el escenario sin persistencia no aplica, se omite.'
+                ))
+                sin_persistencia = None
+            else:
+                settings_dict['CONN_MAX_AGE'] = 0
+                sin_persistencia = self._medir(conn, iteraciones)
+
+            # Escenario 2: configuración actual (persistente o pool)
+            settings_dict['CONN_MAX_AGE'] = max_age_original
+            conn.close()
+            configurado = self._medir(conn, iteraciones)
+        finally:
+            settings_dict['CONN_MAX_AGE'] = max_age_original
+            conn.close()
+
+        if sin_persistencia:
+            self._reportar('Sin persistencia (conexión por request)', sin_persistencia)
+        self._reportar('Configuración actual', configurado)
+
+        if sin_persistencia:
+            overhead = statistics.mean(sin_persistencia) - statistics.mean(configurado)
+            self.stdout.write(self.style.SUCCESS(
+                f'Overhead de conexión por request: {overhead:.3f} ms'
+            ))
+
+    def _medir(self, conn, iteraciones):
+        """Simula el ciclo de un request (request_started/finished) con una consulta mínima."""
+        tiempos = []
+        for _ in range(iteraciones):
+            inicio = time.perf_counter()
+            signals.request_started.send(sender=self.__class__)
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+            signals.request_finished.send(sender=self.__class__)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        return tiempos
+
+    def _reportar(self, titulo, tiempos):
+        ordenados = sorted(tiempos)
+        p95 = ordenados[int(len(ordenados) * 0.95) - 1] if ordenados else 0
+        self.stdout.write(
+            f'{titulo}: media {statistics.mean(tiempos):.3f} ms | '
+            f'p50 {statistics.median(tiempos):.3f} ms | p95 {p95:.3f} ms'
+        )
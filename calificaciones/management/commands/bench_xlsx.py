@@ -0,0 +1,175 @@
+"""Compara filas/seg y RSS máximo de los lectores XLSX (streaming vs openpyxl)."""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from calificaciones.rut import formatear_rut
+from calificaciones.xlsx import BACKENDS, leer_filas_xlsx
+
+try:
+    import resource
+except ImportError:  # Windows: sin getrusage, se reporta solo el tiempo
+    resource = None
+
+COMENTARIOS = ['Calificación regular', 'Requiere seguimiento', 'Excelente cumplimiento', 'Riesgo moderado']
+FACTORES = 100
+
+_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+_PKG = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+
+class Command(BaseCommand):
+    help = 'Mide filas/seg y RSS máximo de cada lector XLSX sobre una hoja de carga masiva (default: 1M filas)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, default=1000000,
+                            help='Filas de la hoja generada cuando no se indica --archivo (default: 1000000)')
+        parser.add_argument('--archivo', help='XLSX existente a leer en lugar de generar uno')
+        parser.add_argument('--backend', choices=BACKENDS, action='append', dest='backends',
+                            help='Lector a medir (repetible; default: todos)')
+        parser.add_argument('--medir', choices=BACKENDS, help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['medir']:
+            # Modo interno: una medición por proceso, para que el RSS máximo no se mezcle
+            self.stdout.write(json.dumps(_medir(options['archivo'], options['medir'])))
+            return
+
+        backends = options['backends'] or list(BACKENDS)
+        with tempfile.TemporaryDirectory() as tmp:
+            archivo = options['archivo']
+            if not archivo:
+                archivo = os.path.join(tmp, 'carga.xlsx')
+                inicio = time.perf_counter()
+                _generar_hoja(archivo, options['filas'])
+                self.stdout.write(
+                    f"Hoja generada: {options['filas']:,} filas, "
+                    f"{os.path.getsize(archivo) / 1024 / 1024:.1f} MB ({time.perf_counter() - inicio:.1f} s)"
+                )
+
+            for backend in backends:
+                proceso = subprocess.run(
+                    [sys.executable, '-m', 'django', 'bench_xlsx', '--archivo', archivo, '--medir', backend,
+                     '--settings', settings.SETTINGS_MODULE],
+                    cwd=settings.BASE_DIR, capture_output=True, text=True,
+                )
+                if proceso.returncode:
+                    raise CommandError(f'Falló la medición de {backend}:\n{proceso.stderr}')
+                r = json.loads(proceso.stdout.strip().splitlines()[-1])
+                rss = (
+                    f"RSS máx {r['rss_max_mb']:.0f} MB (+{r['rss_max_mb'] - r['rss_inicial_mb']:.0f} MB al leer)"
+                    if r['rss_max_mb'] is not None else 'RSS no disponible en esta plataforma'
+                )
+                self.stdout.write(self.style.SUCCESS(
+                    f"{backend:>8}: {r['filas']:,} filas en {r['segundos']:.1f} s = "
+                    f"{r['filas'] / r['segundos']:,.0f} filas/s | {rss}"
+                ))
+
+
+def _rss_mb():
+    """RSS máximo del proceso en MB (VmHWM en Linux; getrusage en otros Unix; None en Windows)."""
+    try:
+        # ru_maxrss de Linux se hereda a través de exec (incluiría el pico del proceso padre)
+        with open('/proc/self/status') as f:
+            for linea in f:
+                if linea.startswith('VmHWM:'):
+                    return int(linea.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    # macOS informa bytes
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 / 1024
+
+
+def _medir(archivo, backend):
+    rss_inicial = _rss_mb()
+    filas = 0
+    inicio = time.perf_counter()
+    with open(archivo, 'rb') as f:
+        for _ in leer_filas_xlsx(f, desde_fila=2, backend=backend):
+            filas += 1
+    return {
+        'backend': backend,
+        'filas': filas,
+        'segundos': time.perf_counter() - inicio,
+        'rss_inicial_mb': rss_inicial,
+        'rss_max_mb': _rss_mb(),
+    }
+
+
+def _generar_hoja(ruta, filas):
+    """Escribe una hoja de carga masiva con shared strings, como las que guarda Excel."""
+    compartidas = {}
+
+    def indice(texto):
+        if texto not in compartidas:
+            compartidas[texto] = len(compartidas)
+        return compartidas[texto]
+
+    with zipfile.ZipFile(ruta, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr('[Content_Types].xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/worksheets/sheet1.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            '<Override PartName="/xl/sharedStrings.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+            '</Types>'
+        ))
+        z.writestr('_rels/.rels', (
+            f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><Relationships xmlns="{_PKG}">'
+            '<Relationship Id="rId1" Target="xl/workbook.xml" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+            '</Relationships>'
+        ))
+        z.writestr('xl/workbook.xml', (
+            f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><workbook xmlns="{_NS}" xmlns:r="{_REL}">'
+            '<sheets><sheet name="Carga" sheetId="1" r:id="rId1"/></sheets></workbook>'
+        ))
+        z.writestr('xl/_rels/workbook.xml.rels', (
+            f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><Relationships xmlns="{_PKG}">'
+            f'<Relationship Id="rId1" Target="worksheets/sheet1.xml" Type="{_REL}/worksheet"/>'
+            f'<Relationship Id="rId2" Target="sharedStrings.xml" Type="{_REL}/sharedStrings"/>'
+            '</Relationships>'
+        ))
+
+        with z.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as hoja:
+            hoja.write(f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><worksheet xmlns="{_NS}"><sheetData>'.encode())
+            encabezado = ''.join(
+                f'<c r="{col}1" t="s"><v>{indice(texto)}</v></c>'
+                for col, texto in zip('ABC', ('RUT', 'Código Factor', 'Comentario'))
+            )
+            hoja.write(f'<row r="1">{encabezado}</row>'.encode())
+            for n in range(2, filas + 2):
+                rut = indice(formatear_rut(50000000 + n))
+                factor = indice(f'GEN-{n % FACTORES + 1:04d}')
+                comentario = indice(COMENTARIOS[n % len(COMENTARIOS)])
+                hoja.write((
+                    f'<row r="{n}"><c r="A{n}" t="s"><v>{rut}</v></c><c r="B{n}" t="s"><v>{factor}</v></c>'
+                    f'<c r="C{n}" t="s"><v>{comentario}</v></c></row>'
+                ).encode())
+            hoja.write(b'</sheetData></worksheet>')
+
+        with z.open('xl/sharedStrings.xml', 'w', force_zip64=True) as f:
+            f.write(
+                f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                f'<sst xmlns="{_NS}" count="{len(compartidas)}" uniqueCount="{len(compartidas)}">'.encode()
+            )
+            for texto in compartidas:
+                f.write(f'<si><t>{escape(texto)}</t></si>'.encode())
+            f.write(b'</sst>')
@@ -0,0 +1,190 @@
+"""Benchmark de las rutas críticas: importación, listados y auditoría a distintos volúmenes.
+
+Corre sobre una base de datos de prueba creada para la ocasión (mismo motor que
+DATABASE_URL: SQLite o PostgreSQL) y guarda los resultados en JSON para comparar
+entre commits con --comparar.
+"""
+import io
+import json
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from calificaciones import importacion, views
+from calificaciones.models import Calificacion
+
+FACTORES = 100
+# Métricas donde un valor mayor es mejor; en el resto (ms, consultas) menor es mejor
+MAYOR_ES_MEJOR = {'filas_por_segundo'}
+
+
+class Command(BaseCommand):
+    help = 'Mide filas/seg de las cargas masivas y tiempo/consultas de los listados a 10k, 100k y 1M filas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tamanos', type=int, nargs='+', default=[10000, 100000, 1000000],
+                            help='Cantidades de calificaciones a medir (default: 10000 100000 1000000)')
+        parser.add_argument('--limite-listas', type=int, default=100000,
+                            help='No renderiza listados por sobre esta cantidad de filas (default: 100000)')
+        parser.add_argument('--salida', help='Archivo JSON de resultados (default: benchmarks/<commit>.json)')
+        parser.add_argument('--comparar', help='JSON de una corrida anterior para reportar regresiones')
+        parser.add_argument('--umbral', type=float, default=10.0,
+                            help='Porcentaje de empeoramiento que se reporta como regresión (default: 10)')
+
+    def handle(self, *args, **options):
+        commit = _commit_actual()
+        salida = Path(options['salida'] or f'benchmarks/{commit}.json')
+        resultados = {
+            'meta': {
+                'commit': commit,
+                'fecha': datetime.now().isoformat(timespec='seconds'),
+                'motor': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+            },
+            'resultados': {},
+        }
+
+        setup_test_environment()
+        nombre_original = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                for tamano in options['tamanos']:
+                    self.stdout.write(self.style.SUCCESS(f'== {tamano:,} filas =='))
+                    resultados['resultados'][str(tamano)] = self._medir(
+                        tamano, Path(tmp), renderizar_listas=tamano <= options['limite_listas']
+                    )
+        finally:
+            connection.creation.destroy_test_db(nombre_original, verbosity=0)
+            teardown_test_environment()
+
+        salida.parent.mkdir(parents=True, exist_ok=True)
+        salida.write_text(json.dumps(resultados, indent=2), encoding='utf-8')
+        self.stdout.write(self.style.SUCCESS(f'Resultados guardados en {salida}'))
+
+        if options['comparar']:
+            self._comparar(options['comparar'], resultados, options['umbral'])
+
+    # ------------------------------------------------------------------
+    def _medir(self, tamano, tmp, renderizar_listas):
+        call_command('flush', interactive=False, verbosity=0)
+        usuario = User.objects.create_superuser('benchmark', 'benchmark@example.com', 'benchmark')
+        ruta_csv, ruta_xlsx = tmp / f'carga_{tamano}.csv', tmp / f'carga_{tamano}.xlsx'
+
+        inicio = time.perf_counter()
+        call_command(
+            'generar_datos_carga', emisores=max(100, tamano // 40), factores=FACTORES,
+            calificaciones=tamano, filas_archivo=tamano, csv=str(ruta_csv), xlsx=str(ruta_xlsx),
+            usuario='benchmark', stdout=io.StringIO(),
+        )
+        metricas = {'generacion': {'segundos': round(time.perf_counter() - inicio, 3)}}
+
+        # Cada importación parte del mismo estado: se borran las filas que insertó la anterior
+        ultimo_id = Calificacion.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+        with open(ruta_csv, 'rb') as archivo:
+            metricas['procesar_csv_calificaciones'] = self._medir_importacion(
+                'procesar_csv_calificaciones', tamano, lambda: importacion.procesar_csv_calificaciones(archivo, usuario)
+            )
+        Calificacion.objects.filter(id__gt=ultimo_id).delete()
+
+        with open(ruta_xlsx, 'rb') as archivo:
+            metricas['procesar_excel_calificaciones'] = self._medir_importacion(
+                'procesar_excel_calificaciones', tamano, lambda: importacion.procesar_excel_calificaciones(archivo, usuario)
+            )
+        Calificacion.objects.filter(id__gt=ultimo_id).delete()
+
+        request = RequestFactory().post(reverse('api_carga_masiva'), {
+            'archivo': SimpleUploadedFile('carga.xlsx', ruta_xlsx.read_bytes()),
+        })
+        request.user = usuario
+        metricas['api_carga_masiva'] = self._medir_importacion(
+            'api_carga_masiva', tamano, lambda: views.api_carga_masiva(request)
+        )
+
+        if renderizar_listas:
+            client = Client()
+            client.force_login(usuario)
+            for nombre in ('calificacion_list', 'lista_auditoria'):
+                metricas[nombre] = self._medir_listado(client, reverse(nombre))
+        else:
+            self.stdout.write(self.style.WARNING('  listados omitidos (--limite-listas)'))
+        return metricas
+
+    def _medir_importacion(self, nombre, filas, funcion):
+        with CaptureQueriesContext(connection) as consultas:
+            inicio = time.perf_counter()
+            funcion()
+            segundos = time.perf_counter() - inicio
+        resultado = {
+            'segundos': round(segundos, 3),
+            'filas_por_segundo': round(filas / segundos, 1),
+            'consultas': len(consultas),
+        }
+        self.stdout.write(f"  {nombre}: {resultado['filas_por_segundo']:,.0f} filas/s, {len(consultas)} consultas")
+        return resultado
+
+    def _medir_listado(self, client, url):
+        with CaptureQueriesContext(connection) as consultas:
+            inicio = time.perf_counter()
+            respuesta = client.get(url)
+            ms = (time.perf_counter() - inicio) * 1000
+        resultado = {
+            'ms': round(ms, 1),
+            'consultas': len(consultas),
+            'bytes': len(respuesta.content),
+            'estado': respuesta.status_code,
+        }
+        self.stdout.write(f"  {url}: {resultado['ms']:,.1f} ms, {len(consultas)} consultas")
+        return resultado
+
+    def _comparar(self, ruta, actual, umbral):
+        try:
+            previo = json.loads(Path(ruta).read_text(encoding='utf-8'))
+        except (OSError, ValueError) as e:
+            raise CommandError(f'No se pudo leer {ruta}: {e}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Comparación contra {previo['meta'].get('commit')} ({previo['meta'].get('fecha')})"
+        ))
+        regresiones = 0
+        for tamano, metricas in actual['resultados'].items():
+            for nombre, valores in metricas.items():
+                anteriores = previo['resultados'].get(tamano, {}).get(nombre, {})
+                for clave in ('filas_por_segundo', 'ms', 'consultas'):
+                    if clave not in valores or not anteriores.get(clave):
+                        continue
+                    cambio = (valores[clave] - anteriores[clave]) / anteriores[clave] * 100
+                    empeora = -cambio if clave in MAYOR_ES_MEJOR else cambio
+                    linea = f'  {tamano} {nombre}.{clave}: {anteriores[clave]} → {valores[clave]} ({cambio:+.1f}%)'
+                    if empeora > umbral:
+                        regresiones += 1
+                        self.stdout.write(self.style.ERROR(linea + ' REGRESIÓN'))
+                    else:
+                        self.stdout.write(linea)
+        if regresiones:
+            self.stdout.write(self.style.ERROR(f'{regresiones} regresión(es) sobre {umbral}%'))
+
+
+def _commit_actual():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'sin-commit'
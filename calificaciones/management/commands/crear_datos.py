@@ -2,6 +2,7 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
 from calificaciones.models import Emisor, FactorTributario, Calificacion, HistorialAuditoria
+from calificaciones.rut import separar_rut
 from datetime import datetime, timedelta
 import random
 
@@ -70,18 +71,19 @@ class Command(BaseCommand):
     def crear_emisores(self):
         """Crear emisores ficticios"""
         emisores_data = [
-            {'rut': '76.123.456-7', 'nombre': 'Empresa XYZ S.A.', 'direccion': 'Av. Principal 123, Santiago'},
-            {'rut': '77.234.567-8', 'nombre': 'Comercial ABC Ltda.', 'direccion': 'Calle Central 456, Valparaíso'},
-            {'rut': '78.345.678-9', 'nombre': 'Industria DEF SpA', 'direccion': 'Camino Sur 789, Concepción'},
-            {'rut': '79.456.789-0', 'nombre': 'Servicios GHI E.I.R.L.', 'direccion': 'Pasaje Oriente 321, Temuco'},
-            {'rut': '80.567.890-1', 'nombre': 'Constructora JKL S.A.', 'direccion': 'Av. Libertad 654, Puerto Montt'},
+            {'rut': '76.123.456-0', 'nombre': 'Empresa XYZ S.A.', 'direccion': 'Av. Principal 123, Santiago'},
+            {'rut': '77.234.567-4', 'nombre': 'Comercial ABC Ltda.', 'direccion': 'Calle Central 456, Valparaíso'},
+            {'rut': '78.345.678-8', 'nombre': 'Industria DEF SpA', 'direccion': 'Camino Sur 789, Concepción'},
+            {'rut': '79.456.789-1', 'nombre': 'Servicios GHI E.I.R.L.', 'direccion': 'Pasaje Oriente 321, Temuco'},
+            {'rut': '80.567.890-9', 'nombre': 'Constructora JKL S.A.', 'direccion': 'Av. Libertad 654, Puerto Montt'},
         ]
         
         emisores = []
         for data in emisores_data:
             emisor, created = Emisor.objects.get_or_create(
-                rut=data['rut'],
+                rut_numero=separar_rut(data['rut'])[0],
                 defaults={
+                    'rut': data['rut'],
                     'nombre': data['nombre'],
                     'direccion': data['direccion'],
                     'activo': True,
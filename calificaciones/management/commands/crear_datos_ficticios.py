@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from calificaciones.models import Emisor, FactorTributario, Calificacion
+from calificaciones.rut import separar_rut
 from django.contrib.auth.models import User
 
 
@@ -9,14 +10,14 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         # Crear emisores ficticios
         emisores_data = [
-            {'rut': '12.345.678-9', 'nombre': 'Empresa A SpA', 'direccion': 'Av. Principal 1000, Santiago'},
-            {'rut': '23.456.789-0', 'nombre': 'Comercial B Ltda', 'direccion': 'Calle Central 500, Valparaíso'},
-            {'rut': '34.567.890-1', 'nombre': 'Transportes C SA', 'direccion': 'Ruta 5 Norte, Concepción'},
-            {'rut': '45.678.901-2', 'nombre': 'Distribuidora D Hnos', 'direccion': 'Av. Sector Industrial 2050, Los Ángeles'},
-            {'rut': '56.789.012-3', 'nombre': 'Servicios E SpA', 'direccion': 'Pasaje Sur 123, Temuco'},
-            {'rut': '67.890.123-4', 'nombre': 'Retail F SA', 'direccion': 'Mall Centro 1500, Puerto Varas'},
-            {'rut': '78.901.234-5', 'nombre': 'Consultora G Ltda', 'direccion': 'Torre Financiera, Piso 20, Antofagasta'},
-            {'rut': '89.012.345-6', 'nombre': 'Inmobiliaria H SpA', 'direccion': 'Av. Libertad 789, La Serena'},
+            {'rut': '12.345.678-5', 'nombre': 'Empresa A SpA', 'direccion': 'Av. Principal 1000, Santiago'},
+            {'rut': '23.456.789-6', 'nombre': 'Comercial B Ltda', 'direccion': 'Calle Central 500, Valparaíso'},
+            {'rut': '34.567.890-5', 'nombre': 'Transportes C SA', 'direccion': 'Ruta 5 Norte, Concepción'},
+            {'rut': '45.678.901-3', 'nombre': 'Distribuidora D Hnos', 'direccion': 'Av. Sector Industrial 2050, Los Ángeles'},
+            {'rut': '56.789.012-0', 'nombre': 'Servicios E SpA', 'direccion': 'Pasaje Sur 123, Temuco'},
+            {'rut': '67.890.123-7', 'nombre': 'Retail F SA', 'direccion': 'Mall Centro 1500, Puerto Varas'},
+            {'rut': '78.901.234-2', 'nombre': 'Consultora G Ltda', 'direccion': 'Torre Financiera, Piso 20, Antofagasta'},
+            {'rut': '89.012.345-7', 'nombre': 'Inmobiliaria H SpA', 'direccion': 'Av. Libertad 789, La Serena'},
         ]
 
         # Crear factores tributarios
@@ -46,8 +47,9 @@ class Command(BaseCommand):
         created_emisores = 0
         for e_data in emisores_data:
             emisor, created = Emisor.objects.get_or_create(
-                rut=e_data['rut'],
+                rut_numero=separar_rut(e_data['rut'])[0],
                 defaults={
+                    'rut': e_data['rut'],
                     'nombre': e_data['nombre'],
                     'direccion': e_data['direccion'],
                     'activo': True
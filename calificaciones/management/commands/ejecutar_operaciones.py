@@ -0,0 +1,26 @@
+"""Ejecuta las operaciones masivas pendientes (p. ej. las que quedaron sin correr tras un reinicio)."""
+from django.core.management.base import BaseCommand
+
+from calificaciones.models import OperacionMasiva
+from calificaciones.operaciones import ejecutar
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta las operaciones masivas de calificaciones en estado PENDIENTE'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incluir-en-curso', action='store_true',
+                            help='Reintenta también las EN_CURSO (interrumpidas; cada operación es atómica)')
+
+    def handle(self, *args, **options):
+        estados = ['PENDIENTE', 'EN_CURSO'] if options['incluir_en_curso'] else ['PENDIENTE']
+        operaciones = OperacionMasiva.objects.filter(estado__in=estados).select_related(
+            'factor_destino', 'usuario'
+        ).order_by('fecha_creacion')
+        for operacion in operaciones:
+            ejecutar(operacion)
+            estilo = self.style.SUCCESS if operacion.estado == 'TERMINADA' else self.style.ERROR
+            self.stdout.write(estilo(
+                f"{operacion}: {operacion.afectadas} afectadas, {operacion.omitidas} omitidas"
+                + (f" - {operacion.error}" if operacion.error else '')
+            ))
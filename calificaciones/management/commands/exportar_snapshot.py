@@ -0,0 +1,25 @@
+"""Genera el snapshot columnar (.npy) de calificaciones para procesos de riesgo."""
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from calificaciones.snapshot import generar_snapshot
+from proyecto_nuam.db_router import lectura_en_replica
+
+
+class Command(BaseCommand):
+    help = 'Exporta emisor_id/factor_id/fecha de calificaciones como columnas .npy (incremental por defecto)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--completo', action='store_true',
+                            help='Regenera desde cero en vez de aplicar solo los cambios')
+        parser.add_argument('--directorio', type=Path,
+                            help='Directorio de salida (default: settings.SNAPSHOT_DIR)')
+
+    def handle(self, *args, **options):
+        # Exportación de solo lectura: se lee de una réplica si hay alguna al día
+        with lectura_en_replica():
+            manifest = generar_snapshot(completo=options['completo'], directorio=options['directorio'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Snapshot {manifest['snapshot']} ({manifest['modo']}): {manifest['filas']} filas (marca {manifest['marca']})"
+        ))
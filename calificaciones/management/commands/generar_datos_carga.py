@@ -0,0 +1,280 @@
+"""Genera datos sintéticos a escala (emisores, factores, calificaciones y auditoría) para pruebas de carga."""
+import csv
+import io
+import random
+import time
+from datetime import timedelta
+
+import openpyxl
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from calificaciones import cache_listas, perfiles
+from calificaciones.models import Emisor, FactorTributario, Calificacion, CalificacionVersion, HistorialAuditoria
+from calificaciones.rut import RUT_MAXIMO, formatear_rut
+from calificaciones.versiones import sincronizar_versiones
+
+COMENTARIOS = [
+    'Calificación regular',
+    'Requiere seguimiento',
+    'Excelente cumplimiento',
+    'Pendiente actualización',
+    'Riesgo moderado',
+    'Contribuyente con historial limpio',
+]
+CIUDADES = ['Santiago', 'Valparaíso', 'Concepción', 'Temuco', 'Antofagasta', 'Puerto Montt']
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera N emisores (RUT con DV válido), M factores y K calificaciones con su auditoría, '
+        'de forma determinista, más archivos CSV/XLSX de carga masiva del tamaño pedido'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--emisores', type=int, default=10000)
+        parser.add_argument('--factores', type=int, default=50)
+        parser.add_argument('--calificaciones', type=int, default=100000)
+        parser.add_argument('--semilla', type=int, default=42, help='Semilla del generador (default: 42)')
+        parser.add_argument('--rut-inicial', type=int, default=50000000,
+                            help='Primer número de RUT de los emisores generados (default: 50.000.000)')
+        parser.add_argument('--lote', type=int, default=20000, help='Filas por inserción (default: 20000)')
+        parser.add_argument('--usuario', help='Usuario asignado a las calificaciones (default: primer analista)')
+        parser.add_argument('--csv', help='Ruta del archivo CSV de carga masiva a generar')
+        parser.add_argument('--xlsx', help='Ruta del archivo XLSX de carga masiva a generar')
+        parser.add_argument('--filas-archivo', type=int, default=0,
+                            help='Filas de los archivos de carga (pares emisor/factor aún no cargados)')
+        parser.add_argument('--porcentaje-errores', type=float, default=0.0,
+                            help='Porcentaje de filas del archivo con RUT o factor inexistente (default: 0)')
+        parser.add_argument('--limpiar', action='store_true',
+                            help='Elimina antes los datos generados previamente en el mismo rango de RUT')
+
+    def handle(self, *args, **options):
+        n_emisores = options['emisores']
+        n_factores = options['factores']
+        n_calif = options['calificaciones']
+        n_archivo = options['filas_archivo'] if (options['csv'] or options['xlsx']) else 0
+        if n_emisores <= 0 or n_factores <= 0:
+            raise CommandError('Se requiere al menos un emisor y un factor.')
+        # Cada emisor recibe ceil(K/N) + ceil(R/N) factores distintos como máximo
+        por_emisor = -(-n_calif // n_emisores) + -(-n_archivo // n_emisores)
+        if por_emisor > n_factores:
+            raise CommandError(
+                f'No hay suficientes factores: cada emisor necesita {por_emisor} pares distintos '
+                f'para {n_calif} calificaciones + {n_archivo} filas de archivo. Aumenta --factores o --emisores.'
+            )
+
+        self.rng = random.Random(options['semilla'])
+        self.lote = options['lote']
+        self.ahora = timezone.now()
+        rut_inicial = options['rut_inicial']
+        rango_ruts = (rut_inicial, rut_inicial + n_emisores - 1)
+        if rut_inicial < 1 or rango_ruts[1] > RUT_MAXIMO:
+            raise CommandError(f'Los RUT generados deben quedar entre 1 y {RUT_MAXIMO}.')
+        inicio = time.perf_counter()
+
+        if options['limpiar']:
+            self._limpiar(rango_ruts)
+        elif Emisor.objects.filter(rut_numero__range=rango_ruts).exists():
+            raise CommandError('Ya existen emisores en el rango de RUT generado. Usa --limpiar o --rut-inicial.')
+
+        usuario_id = self._usuario_id(options['usuario'])
+        emisor_ids = self._crear_emisores(rut_inicial, n_emisores)
+        factores = self._crear_factores(n_factores)
+        # bulk_create no emite signals: los listados cacheados se invalidan a mano
+        cache_listas.invalidar(cache_listas.EMISORES, cache_listas.FACTORES)
+        self.stdout.write(f'✓ {len(emisor_ids)} emisores y {len(factores)} factores ({time.perf_counter() - inicio:.1f} s)')
+
+        archivos = _ArchivosCarga(options['csv'], options['xlsx'], options['porcentaje_errores'], self.rng)
+        creadas = self._crear_calificaciones(
+            rut_inicial, emisor_ids, factores, usuario_id, n_calif, n_archivo, archivos
+        )
+        archivos.cerrar()
+        sincronizar_versiones(Calificacion.objects.filter(emisor__rut_numero__range=rango_ruts))
+        perfiles.invalidar_todos()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {creadas} calificaciones y {creadas} registros de auditoría '
+            f'({time.perf_counter() - inicio:.1f} s)'
+        ))
+        for ruta in archivos.rutas():
+            self.stdout.write(self.style.SUCCESS(f'✓ Archivo de carga: {ruta} ({archivos.filas} filas)'))
+
+    # ------------------------------------------------------------------
+    def _limpiar(self, rango_ruts):
+        generados = Emisor.objects.filter(rut_numero__range=rango_ruts)
+        Calificacion.objects.filter(emisor__in=generados).delete()
+        HistorialAuditoria.objects.filter(emisor__in=generados).delete()
+        CalificacionVersion.objects.filter(emisor__in=generados).delete()
+        generados.delete()
+
+    def _usuario_id(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username).id
+            except User.DoesNotExist:
+                raise CommandError(f"El usuario '{username}' no existe.")
+        usuario = User.objects.filter(is_staff=True).order_by('id').first() or User.objects.order_by('id').first()
+        return usuario.id if usuario else None
+
+    def _crear_emisores(self, rut_inicial, cantidad):
+        for desde in range(0, cantidad, self.lote):
+            Emisor.objects.bulk_create(
+                [
+                    Emisor(
+                        rut=formatear_rut(rut_inicial + i),
+                        rut_numero=rut_inicial + i,
+                        nombre=f'Emisor Sintético {i + 1:07d}',
+                        direccion=f'Calle {self.rng.randint(1, 9999)}, {self.rng.choice(CIUDADES)}',
+                        activo=True,
+                    )
+                    for i in range(desde, min(desde + self.lote, cantidad))
+                ],
+                batch_size=self.lote,
+            )
+        ids = dict(
+            Emisor.objects.filter(rut_numero__range=(rut_inicial, rut_inicial + cantidad - 1))
+            .values_list('rut_numero', 'id')
+        )
+        return [ids[rut_inicial + i] for i in range(cantidad)]
+
+    def _crear_factores(self, cantidad):
+        codigos = [f'GEN-{j + 1:04d}' for j in range(cantidad)]
+        FactorTributario.objects.bulk_create(
+            [FactorTributario(codigo=codigo, descripcion=f'Factor sintético {codigo}') for codigo in codigos],
+            ignore_conflicts=True,
+        )
+        ids = dict(FactorTributario.objects.filter(codigo__in=codigos).values_list('codigo', 'id'))
+        return [(ids[codigo], codigo) for codigo in codigos]
+
+    def _crear_calificaciones(self, rut_inicial, emisor_ids, factores, usuario_id, n_calif, n_archivo, archivos):
+        """Reparte K calificaciones y las filas de archivo entre los emisores, sin repetir pares."""
+        n_emisores = len(emisor_ids)
+        tabla_calif = _Tabla(Calificacion, [
+            'emisor_id', 'factor_id', 'fecha_asignacion', 'fecha_modificacion', 'usuario_id', 'comentario',
+        ])
+        tabla_audit = _Tabla(HistorialAuditoria, [
+            'accion', 'usuario_id', 'emisor_id', 'factor_anterior', 'factor_nuevo',
+            'comentario_anterior', 'comentario_nuevo', 'fecha',
+        ])
+        creadas = 0
+
+        for indice, emisor_id in enumerate(emisor_ids):
+            k = n_calif // n_emisores + (1 if indice < n_calif % n_emisores else 0)
+            f = n_archivo // n_emisores + (1 if indice < n_archivo % n_emisores else 0)
+            elegidos = self.rng.sample(factores, k + f)
+
+            for factor_id, codigo in elegidos[:k]:
+                fecha = self.ahora - timedelta(seconds=self.rng.randint(0, 365 * 24 * 3600))
+                comentario = self.rng.choice(COMENTARIOS)
+                tabla_calif.agregar((emisor_id, factor_id, fecha, fecha, usuario_id, comentario))
+                tabla_audit.agregar(('CREAR', usuario_id, emisor_id, 'N/A', codigo, None, comentario, fecha))
+            creadas += k
+
+            for _, codigo in elegidos[k:]:
+                archivos.escribir(rut_inicial + indice, codigo, self.rng.choice(COMENTARIOS))
+
+            if len(tabla_calif) >= self.lote:
+                tabla_calif.volcar()
+                tabla_audit.volcar()
+                self.stdout.write(f'  … {creadas} calificaciones')
+
+        tabla_calif.volcar()
+        tabla_audit.volcar()
+        return creadas
+
+
+class _Tabla:
+    """Acumula filas y las inserta por lotes: COPY en PostgreSQL, executemany en el resto."""
+
+    def __init__(self, modelo, columnas):
+        self.tabla = modelo._meta.db_table
+        self.columnas = [modelo._meta.get_field(c).column for c in columnas]
+        self.filas = []
+
+    def __len__(self):
+        return len(self.filas)
+
+    def agregar(self, fila):
+        self.filas.append(fila)
+
+    def volcar(self):
+        if not self.filas:
+            return
+        ops = connection.ops
+        filas = [
+            tuple(ops.adapt_datetimefield_value(v) if hasattr(v, 'tzinfo') else v for v in fila)
+            for fila in self.filas
+        ]
+        with transaction.atomic(), connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                self._copy(cursor, filas)
+            else:
+                marcadores = ', '.join(['%s'] * len(self.columnas))
+                cursor.executemany(
+                    f'INSERT INTO {self.tabla} ({", ".join(self.columnas)}) VALUES ({marcadores})', filas
+                )
+        self.filas = []
+
+    def _copy(self, cursor, filas):
+        sql = f'COPY {self.tabla} ({", ".join(self.columnas)}) FROM STDIN WITH (FORMAT csv)'
+        raw = cursor.cursor
+        if hasattr(raw, 'copy_expert'):  # psycopg2
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(filas)
+            buffer.seek(0)
+            raw.copy_expert(sql, buffer)
+        else:  # psycopg 3
+            with raw.copy(sql.replace('WITH (FORMAT csv)', '')) as copy:
+                for fila in filas:
+                    copy.write_row(fila)
+
+
+class _ArchivosCarga:
+    """Escribe en paralelo los archivos CSV y/o XLSX con el formato de carga masiva."""
+
+    ENCABEZADO = ['RUT', 'Código Factor', 'Comentario']
+
+    def __init__(self, ruta_csv, ruta_xlsx, porcentaje_errores, rng):
+        self.ruta_csv = ruta_csv
+        self.ruta_xlsx = ruta_xlsx
+        self.tasa_errores = porcentaje_errores / 100
+        self.rng = rng
+        self.filas = 0
+        self._csv = self._csv_writer = self._wb = self._ws = None
+        if ruta_csv:
+            self._csv = open(ruta_csv, 'w', newline='', encoding='utf-8')
+            self._csv_writer = csv.writer(self._csv)
+            self._csv_writer.writerow(self.ENCABEZADO)
+        if ruta_xlsx:
+            self._wb = openpyxl.Workbook(write_only=True)
+            self._ws = self._wb.create_sheet()
+            self._ws.append(self.ENCABEZADO)
+
+    def escribir(self, rut_numero, codigo, comentario):
+        rut = formatear_rut(rut_numero)
+        # Mezcla formatos de RUT como en planillas reales
+        if self.rng.random() < 0.3:
+            rut = rut.replace('.', '')
+        if self.tasa_errores and self.rng.random() < self.tasa_errores:
+            if self.rng.random() < 0.5:
+                rut = formatear_rut(rut_numero + 90000000)
+            else:
+                codigo = f'NOEXISTE-{self.rng.randint(1, 999)}'
+        fila = [rut, codigo, comentario]
+        if self._csv_writer:
+            self._csv_writer.writerow(fila)
+        if self._ws:
+            self._ws.append(fila)
+        self.filas += 1
+
+    def rutas(self):
+        return [ruta for ruta in (self.ruta_csv, self.ruta_xlsx) if ruta]
+
+    def cerrar(self):
+        if self._csv:
+            self._csv.close()
+        if self._wb:
+            self._wb.save(self.ruta_xlsx)
@@ -0,0 +1,44 @@
+"""Lee el feed de cambios (outbox) desde un token y escribe un evento JSON por línea."""
+import json
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from calificaciones.outbox import TokenInvalido, leer_cambios
+
+
+class Command(BaseCommand):
+    help = 'Escribe en stdout los cambios de emisores, factores y calificaciones posteriores a un token'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', default=None, help='Token de la última lectura (default: desde el inicio)')
+        parser.add_argument('--archivo-token', default=None,
+                            help='Archivo donde se lee y se guarda el token tras cada lote (consumo incremental)')
+        parser.add_argument('--limite', type=int, default=500, help='Eventos por lote')
+        parser.add_argument('--seguir', action='store_true', help='Sigue esperando cambios nuevos')
+        parser.add_argument('--intervalo', type=float, default=5.0, help='Segundos entre lecturas con --seguir')
+
+    def handle(self, *args, **options):
+        archivo = Path(options['archivo_token']) if options['archivo_token'] else None
+        token = options['desde']
+        if token is None and archivo is not None and archivo.exists():
+            token = archivo.read_text(encoding='utf-8').strip()
+
+        while True:
+            try:
+                lote = leer_cambios(token, max(1, options['limite']))
+            except TokenInvalido as e:
+                raise CommandError(str(e))
+            for evento in lote['eventos']:
+                self.stdout.write(json.dumps(evento, ensure_ascii=False))
+            token = lote['siguiente']
+            if archivo is not None:
+                # El token se guarda después de entregar el lote: ante un corte se repite, no se pierde
+                archivo.write_text(token, encoding='utf-8')
+            if lote['hay_mas']:
+                continue
+            if not options['seguir']:
+                break
+            time.sleep(options['intervalo'])
+        self.stderr.write(f'siguiente: {token}')
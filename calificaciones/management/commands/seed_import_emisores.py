@@ -1,29 +1,30 @@
 """Crea emisores base para pruebas de carga masiva."""
 from django.core.management.base import BaseCommand
 from calificaciones.models import Emisor
+from calificaciones.rut import separar_rut
 from datetime import datetime
 
 RUTS_BASE = [
-    "76.123.456-7",
-    "77.234.567-8",
-    "78.345.678-9",
-    "79.456.789-0",
-    "80.567.890-1",
-    "81.678.901-2",
-    "82.789.012-3",
-    "83.890.123-4",
-    "84.901.234-5",
-    "85.012.345-6",
-    "86.123.456-7",
-    "87.234.567-8",
-    "88.345.678-9",
-    "89.456.789-0",
-    "90.567.890-1",
-    "91.678.901-2",
-    "92.789.012-3",
-    "93.890.123-4",
-    "94.901.234-5",
-    "95.012.345-6",
+    "76.123.456-0",
+    "77.234.567-4",
+    "78.345.678-8",
+    "79.456.789-1",
+    "80.567.890-9",
+    "81.678.901-K",
+    "82.789.012-K",
+    "83.890.123-9",
+    "84.901.234-7",
+    "85.012.345-4",
+    "86.123.456-8",
+    "87.234.567-1",
+    "88.345.678-5",
+    "89.456.789-9",
+    "90.567.890-6",
+    "91.678.901-7",
+    "92.789.012-7",
+    "93.890.123-6",
+    "94.901.234-4",
+    "95.012.345-1",
 ]
 
 class Command(BaseCommand):
@@ -33,8 +34,9 @@ class Command(BaseCommand):
         creados = 0
         for idx, rut in enumerate(RUTS_BASE, start=1):
             obj, created = Emisor.objects.get_or_create(
-                rut=rut,
+                rut_numero=separar_rut(rut)[0],
                 defaults={
+                    "rut": rut,
                     "nombre": f"Emisor Prueba {idx}",
                     "direccion": "Sin dirección",
                     "activo": True,
@@ -0,0 +1,19 @@
+"""Reconcilia el historial temporal con el estado actual de las calificaciones."""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from calificaciones.models import Calificacion
+from calificaciones.versiones import cerrar_versiones_huerfanas, sincronizar_versiones
+
+
+class Command(BaseCommand):
+    help = ('Abre versiones para calificaciones sin versión vigente (o que cambiaron) y cierra las de '
+            'calificaciones eliminadas fuera de la aplicación (admin, SQL directo)')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            cerradas = cerrar_versiones_huerfanas()
+            abiertas = sincronizar_versiones(Calificacion.objects.all())
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {abiertas} versiones abiertas, {cerradas} versiones de calificaciones eliminadas cerradas'
+        ))
@@ -0,0 +1,41 @@
+"""Índice para la búsqueda por prefijo de nombre del autocompletado de emisores.
+
+`nombre__istartswith` se traduce a `UPPER(nombre::text) LIKE UPPER('x%')` en PostgreSQL,
+por lo que se indexa esa misma expresión con `text_pattern_ops`. El prefijo de RUT no
+pasa por aquí: se busca con rangos `rut_numero BETWEEN desde AND hasta` (rut.rangos_prefijo)
+sobre el índice parcial `idx_emisor_rut_activo` de `rut_numero` (migraciones 0006 y 0009).
+"""
+from django.db import migrations
+
+INDICES = {
+    'postgresql': (
+        'CREATE INDEX IF NOT EXISTS idx_emisor_nombre_prefijo '
+        'ON calificaciones_emisor (UPPER(nombre::text) text_pattern_ops)'
+    ),
+    'sqlite': (
+        'CREATE INDEX IF NOT EXISTS idx_emisor_nombre_prefijo '
+        'ON calificaciones_emisor (nombre COLLATE NOCASE)'
+    ),
+}
+
+
+def crear_indice(apps, schema_editor):
+    sql = INDICES.get(schema_editor.connection.vendor)
+    if sql:
+        schema_editor.execute(sql)
+
+
+def eliminar_indice(apps, schema_editor):
+    if schema_editor.connection.vendor in INDICES:
+        schema_editor.execute('DROP INDEX IF EXISTS idx_emisor_nombre_prefijo')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calificaciones', '0004_historialauditoria_accion'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, eliminar_indice),
+    ]
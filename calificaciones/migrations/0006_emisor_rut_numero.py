@@ -0,0 +1,49 @@
+from django.db import migrations, models
+
+from calificaciones.rut import RutInvalido, separar_rut
+
+
+def poblar_rut_numero(apps, schema_editor):
+    """Calcula rut_numero para los emisores existentes.
+
+    Si dos RUT escritos con distinto formato representan el mismo número, solo el
+    primero (por id) recibe la clave; el resto queda en NULL para revisión manual.
+    """
+    Emisor = apps.get_model('calificaciones', 'Emisor')
+    vistos = set()
+    pendientes = []
+    for emisor in Emisor.objects.order_by('id').only('id', 'rut').iterator(chunk_size=2000):
+        try:
+            numero = separar_rut(emisor.rut)[0]
+        except RutInvalido:
+            continue
+        if numero in vistos:
+            continue
+        vistos.add(numero)
+        emisor.rut_numero = numero
+        pendientes.append(emisor)
+        if len(pendientes) >= 2000:
+            Emisor.objects.bulk_update(pendientes, ['rut_numero'])
+            pendientes = []
+    Emisor.objects.bulk_update(pendientes, ['rut_numero'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calificaciones', '0005_emisor_idx_nombre_prefijo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emisor',
+            name='rut_numero',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.RunPython(poblar_rut_numero, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='emisor',
+            name='rut_numero',
+            field=models.PositiveIntegerField(editable=False, null=True, unique=True),
+        ),
+    ]
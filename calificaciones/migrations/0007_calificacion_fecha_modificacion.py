@@ -0,0 +1,29 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def desde_asignacion(apps, schema_editor):
+    """Las filas existentes no se han modificado desde su asignación (no la fecha de esta migración)."""
+    Calificacion = apps.get_model('calificaciones', 'Calificacion')
+    Calificacion.objects.update(fecha_modificacion=models.F('fecha_asignacion'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calificaciones', '0006_emisor_rut_numero'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calificacion',
+            name='fecha_modificacion',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(desde_asignacion, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='calificacion',
+            index=models.Index(fields=['fecha_modificacion'], name='idx_calif_fecha_modif'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-19 12:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calificaciones', '0008_operacionmasiva'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='emisor',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['nombre'], name='idx_emisor_nombre_activo'),
+        ),
+        migrations.AddIndex(
+            model_name='emisor',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['rut_numero'], name='idx_emisor_rut_activo'),
+        ),
+    ]
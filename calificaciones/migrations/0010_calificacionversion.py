@@ -0,0 +1,67 @@
+"""Historial temporal de calificaciones.
+
+En PostgreSQL se agrega un índice GiST sobre (emisor_id, tstzrange(valido_desde, valido_hasta))
+con btree_gist, que es la expresión que usa `CalificacionVersion.objects.as_of()`. La
+versión inicial de cada calificación existente parte en su `fecha_modificacion` (que la
+migración 0007 inicializa con `fecha_asignacion`), así que las consultas a fechas anteriores
+al despliegue también la ven.
+"""
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+VERSIONES = 'calificaciones_calificacionversion'
+
+
+def crear_indice_gist(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS idx_calif_version_vigencia ON {VERSIONES} '
+            "USING gist (emisor_id, tstzrange(valido_desde, valido_hasta, '[)'))"
+        )
+
+
+def eliminar_indice_gist(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS idx_calif_version_vigencia')
+
+
+def versiones_iniciales(apps, schema_editor):
+    schema_editor.execute(
+        f'INSERT INTO {VERSIONES} '
+        '(calificacion_id, emisor_id, factor_id, comentario, usuario_id, valido_desde, valido_hasta) '
+        "SELECT id, emisor_id, factor_id, COALESCE(comentario, ''), usuario_id, fecha_modificacion, NULL "
+        'FROM calificaciones_calificacion'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calificaciones', '0009_emisor_indices_activos'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CalificacionVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('comentario', models.TextField(blank=True, default='')),
+                ('valido_desde', models.DateTimeField()),
+                ('valido_hasta', models.DateTimeField(blank=True, null=True)),
+                ('calificacion', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='versiones', to='calificaciones.calificacion')),
+                ('emisor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='versiones_calificacion', to='calificaciones.emisor')),
+                ('factor', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='calificaciones.factortributario')),
+                ('usuario', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['emisor_id', 'valido_desde'],
+                'indexes': [models.Index(fields=['emisor', 'valido_desde'], name='idx_calif_version_emisor')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('valido_hasta', None)), fields=('calificacion',), name='uniq_calif_version_abierta')],
+            },
+        ),
+        migrations.RunPython(crear_indice_gist, eliminar_indice_gist),
+        migrations.RunPython(versiones_iniciales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-19 13:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calificaciones', '0010_calificacionversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entidad', models.CharField(choices=[('calificacion', 'Calificación'), ('emisor', 'Emisor'), ('factor', 'Factor tributario')], max_length=15)),
+                ('operacion', models.CharField(choices=[('CREAR', 'Crear'), ('ACTUALIZAR', 'Actualizar'), ('ELIMINAR', 'Eliminar')], max_length=10)),
+                ('ids', models.JSONField(default=list)),
+                ('datos', models.JSONField(blank=True, default=dict)),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.8 on 2026-10-19 13:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def cargas_anteriores_terminadas(apps, schema_editor):
+    # Las cargas registradas antes de la cola ya terminaron: no deben ocupar turnos
+    CargaMasiva = apps.get_model('calificaciones', 'CargaMasiva')
+    CargaMasiva.objects.update(estado='TERMINADA')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calificaciones', '0011_eventooutbox'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cargamasiva',
+            name='estado',
+            field=models.CharField(choices=[('EN_COLA', 'En cola'), ('EN_CURSO', 'En curso'), ('TERMINADA', 'Terminada'), ('FALLIDA', 'Fallida')], default='EN_COLA', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='cargamasiva',
+            name='fecha_fin',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='cargamasiva',
+            name='fecha_inicio',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='cargamasiva',
+            name='fecha_latido',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='cargamasiva',
+            name='filas_estimadas',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cargamasiva',
+            name='nombre',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='cargamasiva',
+            name='tamano',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='cargamasiva',
+            name='archivo',
+            field=models.FileField(blank=True, upload_to='uploads/'),
+        ),
+        migrations.AddIndex(
+            model_name='cargamasiva',
+            index=models.Index(fields=['estado', 'fecha'], name='idx_carga_estado'),
+        ),
+        migrations.RunPython(cargas_anteriores_terminadas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-19 13:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calificaciones', '0012_cola_cargas'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bitacoraaccesos',
+            index=models.Index(fields=['fecha'], name='idx_bitacora_fecha'),
+        ),
+        migrations.AddIndex(
+            model_name='historialauditoria',
+            index=models.Index(fields=['fecha'], name='idx_auditoria_fecha'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 13:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calificaciones', '0013_indices_admin'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cargamasiva',
+            name='archivo_errores',
+            field=models.FileField(blank=True, upload_to='cargas/errores/'),
+        ),
+    ]
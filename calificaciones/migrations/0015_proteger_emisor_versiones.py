@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-19 13:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calificaciones', '0014_cargamasiva_archivo_errores'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='calificacionversion',
+            name='emisor',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='versiones_calificacion', to='calificaciones.emisor'),
+        ),
+    ]
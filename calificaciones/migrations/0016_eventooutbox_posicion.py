@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-19 13:44
+
+from django.db import migrations, models
+
+
+def publicar_existentes(apps, schema_editor):
+    """Los eventos existentes ya están confirmados: su posición es su id, así los tokens entregados siguen valiendo."""
+    EventoOutbox = apps.get_model('calificaciones', 'EventoOutbox')
+    EventoOutbox.objects.update(posicion=models.F('id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calificaciones', '0015_proteger_emisor_versiones'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventooutbox',
+            name='posicion',
+            field=models.BigIntegerField(blank=True, editable=False, null=True, unique=True),
+        ),
+        migrations.RunPython(publicar_existentes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='eventooutbox',
+            index=models.Index(condition=models.Q(('posicion', None)), fields=['id'], name='idx_outbox_pendiente'),
+        ),
+    ]
@@ -1,12 +1,18 @@
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import connections, models
+from django.db.models.expressions import RawSQL
 from django.conf import settings
 
+from .rut import RutInvalido, formatear_rut, validar_rut
+
 
 # ================================
 # 1. EMISOR
 # ================================
 class Emisor(models.Model):
     rut = models.CharField(max_length=12, unique=True)
+    # RUT canónico sin DV ni separadores; clave entera para lookups e importaciones
+    rut_numero = models.PositiveIntegerField(unique=True, null=True, editable=False)
     nombre = models.CharField(max_length=255)
     direccion = models.CharField(max_length=255, blank=True, null=True)
     activo = models.BooleanField(default=True)
@@ -14,10 +20,27 @@ class Emisor(models.Model):
 
     class Meta:
         ordering = ["nombre"]
+        indexes = [
+            # Parciales: el listado (activo, ordenado por nombre) y las importaciones solo recorren activos
+            models.Index(fields=["nombre"], name="idx_emisor_nombre_activo", condition=models.Q(activo=True)),
+            models.Index(fields=["rut_numero"], name="idx_emisor_rut_activo", condition=models.Q(activo=True)),
+        ]
 
     def __str__(self):
         return f"{self.nombre} ({self.rut})"
 
+    def clean(self):
+        try:
+            self.rut = formatear_rut(validar_rut(self.rut))
+        except RutInvalido as e:
+            raise ValidationError({'rut': str(e)})
+
+    def save(self, *args, **kwargs):
+        # Toda escritura por el ORM (admin, shell, comandos) exige un RUT con DV válido
+        self.rut_numero = validar_rut(self.rut)
+        self.rut = formatear_rut(self.rut_numero)
+        super().save(*args, **kwargs)
+
 
 # ================================
 # 2. FACTOR TRIBUTARIO
@@ -41,6 +64,8 @@ class Calificacion(models.Model):
     emisor = models.ForeignKey(Emisor, on_delete=models.CASCADE, related_name="calificaciones")
     factor = models.ForeignKey(FactorTributario, on_delete=models.PROTECT)
     fecha_asignacion = models.DateTimeField(auto_now_add=True)
+    # Marca de cambio para exportaciones incrementales; los .update() deben fijarla a mano
+    fecha_modificacion = models.DateTimeField(auto_now=True)
     usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
     comentario = models.TextField(blank=True, null=True)
 
@@ -51,6 +76,7 @@ class Calificacion(models.Model):
             models.Index(fields=["emisor", "fecha_asignacion"], name="idx_calif_emisor_fecha"),
             models.Index(fields=["factor", "fecha_asignacion"], name="idx_calif_factor_fecha"),
             models.Index(fields=["fecha_asignacion"], name="idx_calif_fecha"),
+            models.Index(fields=["fecha_modificacion"], name="idx_calif_fecha_modif"),
         ]
 
     def __str__(self):
@@ -78,6 +104,9 @@ class HistorialAuditoria(models.Model):
 
     class Meta:
         ordering = ["-fecha"]
+        indexes = [
+            models.Index(fields=["fecha"], name="idx_auditoria_fecha"),
+        ]
 
     def __str__(self):
         return f"Auditoría {self.emisor} ({self.fecha})"
@@ -87,14 +116,35 @@ class HistorialAuditoria(models.Model):
 # 5. CARGA MASIVA
 # ================================
 class CargaMasiva(models.Model):
-    archivo = models.FileField(upload_to="uploads/")
+    """Una carga masiva y su turno en la cola de cargas (ver cola_cargas.py)."""
+    ESTADO_CHOICES = [
+        ('EN_COLA', 'En cola'),
+        ('EN_CURSO', 'En curso'),
+        ('TERMINADA', 'Terminada'),
+        ('FALLIDA', 'Fallida'),
+    ]
+    # Los archivos de carga se procesan desde el temporal de la subida y no se guardan
+    archivo = models.FileField(upload_to="uploads/", blank=True)
+    nombre = models.CharField(max_length=255, blank=True)
+    tamano = models.BigIntegerField(default=0)
+    filas_estimadas = models.IntegerField(default=0)
+    estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default='EN_COLA')
     fecha = models.DateTimeField(auto_now_add=True)
+    fecha_inicio = models.DateTimeField(null=True, blank=True)
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+    # Lo renueva la carga mientras espera o avanza; una carga sin latido reciente se da por muerta
+    fecha_latido = models.DateTimeField(null=True, blank=True)
     usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
     registros_procesados = models.IntegerField(default=0)
     registros_erroneos = models.IntegerField(default=0)
+    # CSV (fila, error) con todas las filas rechazadas (ver importacion.ReporteErrores)
+    archivo_errores = models.FileField(upload_to="cargas/errores/", blank=True)
 
     class Meta:
         ordering = ["-fecha"]
+        indexes = [
+            models.Index(fields=["estado", "fecha"], name="idx_carga_estado"),
+        ]
 
     def __str__(self):
         return f"Carga {self.id} - {self.fecha}"
@@ -126,6 +176,138 @@ class BitacoraAccesos(models.Model):
 
     class Meta:
         ordering = ["-fecha"]
+        indexes = [
+            models.Index(fields=["fecha"], name="idx_bitacora_fecha"),
+        ]
 
     def __str__(self):
         return f"Acceso {self.usuario} - {self.fecha}"
+
+
+# ================================
+# 8. OPERACIONES MASIVAS
+# ================================
+class OperacionMasiva(models.Model):
+    """Eliminación o reasignación de factor sobre las calificaciones que calzan con un filtro."""
+    TIPO_CHOICES = [
+        ('ELIMINAR', 'Eliminar'),
+        ('REASIGNAR', 'Reasignar factor'),
+    ]
+    ESTADO_CHOICES = [
+        ('PENDIENTE', 'Pendiente'),
+        ('EN_CURSO', 'En curso'),
+        ('TERMINADA', 'Terminada'),
+        ('FALLIDA', 'Fallida'),
+    ]
+    tipo = models.CharField(max_length=10, choices=TIPO_CHOICES)
+    # {'factor': id, 'emisores': [ids], 'ruts': [...], 'desde': 'AAAA-MM-DD', 'hasta': 'AAAA-MM-DD'}
+    filtro = models.JSONField(default=dict)
+    factor_destino = models.ForeignKey(FactorTributario, on_delete=models.PROTECT, null=True, blank=True)
+    estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default='PENDIENTE')
+    total = models.IntegerField(default=0)
+    afectadas = models.IntegerField(default=0)
+    omitidas = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-fecha_creacion"]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} #{self.id} ({self.get_estado_display()})"
+
+
+# ================================
+# 9. VERSIONES DE CALIFICACIONES (historial temporal)
+# ================================
+class CalificacionVersionQuerySet(models.QuerySet):
+    def as_of(self, fecha):
+        """Versiones vigentes en `fecha`: valido_desde <= fecha < valido_hasta (abierta si es NULL)."""
+        if connections[self.db].vendor == 'postgresql':
+            # Misma expresión que el índice GiST idx_calif_version_vigencia, para que lo use
+            tabla = connections[self.db].ops.quote_name(self.model._meta.db_table)
+            return self.filter(RawSQL(
+                f"tstzrange({tabla}.valido_desde, {tabla}.valido_hasta, '[)') @> %s::timestamptz",
+                [fecha], output_field=models.BooleanField(),
+            ))
+        return self.filter(valido_desde__lte=fecha).filter(
+            models.Q(valido_hasta__gt=fecha) | models.Q(valido_hasta=None)
+        )
+
+
+class CalificacionVersion(models.Model):
+    """Estado de una calificación durante [valido_desde, valido_hasta); la vigente tiene valido_hasta NULL.
+
+    Se mantiene desde las vías de escritura con `versiones.sincronizar_versiones` y
+    `versiones.cerrar_versiones`. Las referencias a calificación y factor no tienen FK en la
+    BD: la historia sobrevive a la eliminación de ambos. El emisor está protegido: uno con
+    historia no se puede eliminar (solo dar de baja lógica).
+    """
+    calificacion = models.ForeignKey(
+        Calificacion, on_delete=models.DO_NOTHING, db_constraint=False, related_name="versiones"
+    )
+    emisor = models.ForeignKey(Emisor, on_delete=models.PROTECT, related_name="versiones_calificacion")
+    factor = models.ForeignKey(FactorTributario, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+")
+    comentario = models.TextField(blank=True, default="")
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
+    valido_desde = models.DateTimeField()
+    valido_hasta = models.DateTimeField(null=True, blank=True)
+
+    objects = CalificacionVersionQuerySet.as_manager()
+
+    class Meta:
+        ordering = ["emisor_id", "valido_desde"]
+        indexes = [
+            models.Index(fields=["emisor", "valido_desde"], name="idx_calif_version_emisor"),
+        ]
+        constraints = [
+            # Una sola versión abierta por calificación (también sirve para cerrarla por id)
+            models.UniqueConstraint(
+                fields=["calificacion"], condition=models.Q(valido_hasta=None), name="uniq_calif_version_abierta"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.emisor_id} → {self.factor_id} [{self.valido_desde}, {self.valido_hasta or '∞'})"
+
+
+# ================================
+# 10. OUTBOX DE CAMBIOS (feed para sistemas externos)
+# ================================
+class EventoOutbox(models.Model):
+    """Cambio de emisores, factores o calificaciones, escrito en la misma transacción que el cambio.
+
+    El cursor del feed (`outbox.leer_cambios`) es `posicion`, que se asigna después de
+    confirmado el evento (`outbox.publicar_pendientes`) y por eso sigue el orden de
+    confirmación, no el de inserción como el id. Las escrituras de a una dejan un evento por
+    fila; las masivas, uno por lote con todos los ids del lote.
+    """
+    ENTIDAD_CHOICES = [
+        ('calificacion', 'Calificación'),
+        ('emisor', 'Emisor'),
+        ('factor', 'Factor tributario'),
+    ]
+    OPERACION_CHOICES = [
+        ('CREAR', 'Crear'),
+        ('ACTUALIZAR', 'Actualizar'),
+        ('ELIMINAR', 'Eliminar'),
+    ]
+    entidad = models.CharField(max_length=15, choices=ENTIDAD_CHOICES)
+    operacion = models.CharField(max_length=10, choices=OPERACION_CHOICES)
+    ids = models.JSONField(default=list)
+    # Contexto del cambio: origen (formulario, carga_masiva, operacion_masiva, ...) y datos de filas eliminadas
+    datos = models.JSONField(default=dict, blank=True)
+    fecha = models.DateTimeField(auto_now_add=True)
+    # NULL mientras el evento no se publica en el feed
+    posicion = models.BigIntegerField(null=True, blank=True, unique=True, editable=False)
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [
+            models.Index(fields=["id"], name="idx_outbox_pendiente", condition=models.Q(posicion=None)),
+        ]
+
+    def __str__(self):
+        return f"#{self.id} {self.get_operacion_display()} {self.entidad} ({len(self.ids)})"
@@ -0,0 +1,97 @@
+"""Pub/sub en proceso para notificar a los navegadores por server-sent events (SSE).
+
+Cada conexión SSE (`sse.aplicacion_eventos`) se suscribe a uno o más canales con una cola acotada
+de SSE_COLA_MAXIMA mensajes; `publicar()` se puede llamar desde cualquier hilo (vistas
+sync, hilos de operaciones masivas) y reparte el mensaje dentro del event loop de los
+suscriptores. Si un cliente lento llena su cola se descartan sus mensajes más antiguos y
+se le avisa con un evento `desfase` para que recargue.
+
+Una conexión ociosa es solo una corrutina esperando su cola: no ocupa hilos ni conexiones
+a la BD. El pub/sub vive en memoria del proceso: con varios procesos ASGI, cada navegador
+recibe solo lo publicado en el proceso que atiende su conexión.
+
+Canales:
+
+- CAMBIOS: un mensaje `cambio` por evento de outbox confirmado (ver outbox.registrar).
+- canal_usuario(id): mensajes `progreso` de las cargas masivas del usuario.
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+
+CAMBIOS = 'cambios'
+
+
+def canal_usuario(usuario_id):
+    return f'usuario:{usuario_id}'
+
+
+class Suscripcion:
+    """Cola acotada de mensajes (tipo, datos JSON) de un cliente, atada al event loop que la creó."""
+
+    def __init__(self, canales, loop):
+        self.canales = frozenset(canales)
+        self.loop = loop
+        self.cola = asyncio.Queue(maxsize=settings.SSE_COLA_MAXIMA)
+        self.perdidos = 0
+
+    def _entregar(self, mensaje):
+        if self.cola.full():
+            self.cola.get_nowait()
+            self.perdidos += 1
+        self.cola.put_nowait(mensaje)
+
+
+_lock = threading.Lock()
+_suscripciones = defaultdict(set)
+
+
+def suscribir(canales):
+    """Crea una suscripción en el event loop actual (llamar desde código async)."""
+    suscripcion = Suscripcion(canales, asyncio.get_running_loop())
+    with _lock:
+        for canal in suscripcion.canales:
+            _suscripciones[canal].add(suscripcion)
+    return suscripcion
+
+
+def desuscribir(suscripcion):
+    with _lock:
+        for canal in suscripcion.canales:
+            suscriptores = _suscripciones.get(canal)
+            if suscriptores is not None:
+                suscriptores.discard(suscripcion)
+                if not suscriptores:
+                    del _suscripciones[canal]
+
+
+def suscriptores(canal):
+    with _lock:
+        return len(_suscripciones.get(canal, ()))
+
+
+def _repartir(destinos, mensaje):
+    for suscripcion in destinos:
+        suscripcion._entregar(mensaje)
+
+
+def publicar(canal, tipo, datos):
+    """Envía un mensaje a los suscriptores del canal; sin suscriptores no hace nada."""
+    with _lock:
+        destinos = list(_suscripciones.get(canal, ()))
+    if not destinos:
+        return
+    mensaje = (tipo, json.dumps(datos, default=str, ensure_ascii=False))
+    por_loop = defaultdict(list)
+    for suscripcion in destinos:
+        por_loop[suscripcion.loop].append(suscripcion)
+    for loop, suscripciones_loop in por_loop.items():
+        try:
+            # Una sola llamada por loop, aunque haya miles de suscriptores
+            loop.call_soon_threadsafe(_repartir, suscripciones_loop, mensaje)
+        except RuntimeError:
+            # Loop ya cerrado (proceso terminando)
+            pass
@@ -0,0 +1,249 @@
+"""Operaciones masivas: eliminar o reasignar factor de calificaciones por filtro, y
+dar de baja o reactivar emisores por lista de RUTs.
+
+Cada operación se resuelve en sentencias de conjunto dentro de una transacción: la
+auditoría se escribe con un único ``INSERT INTO ... SELECT`` sobre las mismas filas del
+filtro, y luego un solo ``UPDATE`` o ``DELETE``. Nada recorre las filas en Python.
+
+Las operaciones que afectan más de ``OPERACIONES_MASIVAS_UMBRAL`` filas se ejecutan en
+segundo plano (un hilo del proceso); su avance queda en `OperacionMasiva`. Las que
+queden pendientes, por ejemplo tras un reinicio, se retoman con
+``python manage.py ejecutar_operaciones``.
+"""
+import datetime
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import CharField, DateTimeField, Exists, F, IntegerField, OuterRef, Value
+from django.db.models.functions import Cast
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from . import cache_listas, outbox, perfiles
+from .models import Calificacion, Emisor, FactorTributario, HistorialAuditoria, OperacionMasiva
+from .rut import normalizar_ruts
+from .sql import insertar_select
+from .versiones import cerrar_versiones, sincronizar_versiones
+
+
+class FiltroInvalido(ValueError):
+    """Filtro vacío o con valores que no se pueden interpretar."""
+
+
+def _ids(valores, nombre):
+    if not isinstance(valores, list):
+        raise FiltroInvalido(f"'{nombre}' debe ser una lista")
+    try:
+        return [int(valor) for valor in valores]
+    except (TypeError, ValueError):
+        raise FiltroInvalido(f"'{nombre}' debe contener ids numéricos")
+
+
+def _fecha(valor, nombre, fin_de_dia=False):
+    fecha = parse_date(str(valor)) if valor else None
+    if fecha is None:
+        raise FiltroInvalido(f"'{nombre}' debe tener formato AAAA-MM-DD")
+    if fin_de_dia:
+        fecha += datetime.timedelta(days=1)
+    return timezone.make_aware(datetime.datetime.combine(fecha, datetime.time.min))
+
+
+def filtrar(filtro):
+    """Queryset de las calificaciones que calzan con el filtro (al menos un criterio)."""
+    if not isinstance(filtro, dict) or not any(filtro.get(clave) for clave in ('factor', 'emisores', 'ruts', 'desde', 'hasta')):
+        # Sin criterios el filtro abarcaría la tabla completa
+        raise FiltroInvalido('Indique al menos un criterio: factor, emisores, ruts, desde o hasta')
+
+    queryset = Calificacion.objects.order_by()
+    if filtro.get('factor'):
+        queryset = queryset.filter(factor_id=_ids([filtro['factor']], 'factor')[0])
+    if filtro.get('emisores'):
+        queryset = queryset.filter(emisor_id__in=_ids(filtro['emisores'], 'emisores'))
+    if filtro.get('ruts'):
+        if not isinstance(filtro['ruts'], list):
+            raise FiltroInvalido("'ruts' debe ser una lista")
+        numeros = normalizar_ruts(filtro['ruts'])
+        invalidos = [rut for rut, numero in zip(filtro['ruts'], numeros) if numero is None]
+        if invalidos:
+            raise FiltroInvalido(f"RUT {invalidos[0]} inválido")
+        queryset = queryset.filter(emisor__rut_numero__in=numeros)
+    if filtro.get('desde'):
+        queryset = queryset.filter(fecha_asignacion__gte=_fecha(filtro['desde'], 'desde'))
+    if filtro.get('hasta'):
+        # 'hasta' es inclusivo: abarca el día completo
+        queryset = queryset.filter(fecha_asignacion__lt=_fecha(filtro['hasta'], 'hasta', fin_de_dia=True))
+    return queryset
+
+
+def _movibles(queryset, factor_destino):
+    """Filas reasignables: una por emisor (la de menor id) de los que aún no tienen el factor destino.
+
+    Un emisor solo puede tener una calificación por factor: si el filtro abarca varias
+    filas de un mismo emisor, las demás se omiten.
+    """
+    candidatas = queryset.exclude(factor_id=factor_destino.id).exclude(
+        emisor_id__in=Calificacion.objects.filter(factor_id=factor_destino.id).values('emisor_id')
+    )
+    return candidatas.exclude(Exists(candidatas.filter(emisor_id=OuterRef('emisor_id'), pk__lt=OuterRef('pk'))))
+
+
+def _factor_destino(tipo, factor_destino_id):
+    if tipo not in dict(OperacionMasiva.TIPO_CHOICES):
+        raise FiltroInvalido(f"Tipo de operación desconocido: {tipo}")
+    if tipo != 'REASIGNAR':
+        return None
+    try:
+        return FactorTributario.objects.get(pk=_ids([factor_destino_id], 'factor_destino')[0])
+    except FactorTributario.DoesNotExist:
+        raise FiltroInvalido(f"Factor destino {factor_destino_id} no encontrado")
+
+
+def simular(tipo, filtro, factor_destino_id=None):
+    """Dry-run: cuántas filas calzan con el filtro y cuántas se omitirían (pares duplicados)."""
+    factor_destino = _factor_destino(tipo, factor_destino_id)
+    queryset = filtrar(filtro)
+    total = queryset.count()
+    if tipo == 'REASIGNAR':
+        return {'total': total, 'omitidas': total - _movibles(queryset, factor_destino).count()}
+    return {'total': total, 'omitidas': 0}
+
+
+def _auditar(queryset, usuario, accion, factor_nuevo, comentario_nuevo, ahora):
+    """Inserta una fila de auditoría por calificación del queryset con un solo INSERT ... SELECT."""
+    columnas = {
+        'accion': Value(accion, output_field=CharField()),
+        # Cast explícito: un NULL sin tipo en el SELECT no se puede insertar en una columna entera (PostgreSQL)
+        'usuario': Cast(Value(usuario.id if usuario else None), IntegerField()),
+        'emisor': F('emisor_id'),
+        'factor_anterior': F('factor__codigo'),
+        'factor_nuevo': Value(factor_nuevo, output_field=CharField()),
+        'comentario_anterior': F('comentario'),
+        'comentario_nuevo': Value(comentario_nuevo, output_field=CharField()),
+        'fecha': Value(ahora, output_field=DateTimeField()),
+    }
+    return insertar_select(HistorialAuditoria, queryset, columnas)
+
+
+def ejecutar(operacion):
+    """Ejecuta la operación en una transacción y deja el resultado en el registro."""
+    operacion.estado = 'EN_CURSO'
+    operacion.save(update_fields=['estado'])
+    try:
+        queryset = filtrar(operacion.filtro)
+        with transaction.atomic():
+            if operacion.tipo == 'REASIGNAR':
+                destino = operacion.factor_destino
+                total = queryset.count()
+                movibles = _movibles(queryset, destino)
+                comentario = f'Reasignación masiva #{operacion.id}'
+                ahora = timezone.now()
+                _auditar(movibles, operacion.usuario, 'ASIGNAR', destino.codigo, comentario, ahora)
+                afectadas = movibles.update(
+                    factor_id=destino.id, usuario=operacion.usuario, fecha_modificacion=ahora
+                )
+                # Las filas movidas son, de cada emisor auditado por esta operación, la del factor
+                # destino (hay una sola por emisor); no las que otras escrituras tocaron a la vez
+                auditados = HistorialAuditoria.objects.filter(
+                    fecha=ahora, accion='ASIGNAR', comentario_nuevo=comentario,
+                ).values('emisor_id')
+                reasignadas = Calificacion.objects.filter(factor_id=destino.id, emisor_id__in=auditados)
+                sincronizar_versiones(reasignadas)
+                outbox.registrar_queryset(outbox.CALIFICACION, 'ACTUALIZAR', reasignadas,
+                                          origen='operacion_masiva', operacion_masiva=operacion.id)
+                omitidas = total - afectadas
+            else:
+                _auditar(queryset, operacion.usuario, 'ELIMINAR', 'ELIMINADO',
+                         f'Eliminación masiva #{operacion.id}', timezone.now())
+                cerrar_versiones(queryset)
+                outbox.registrar_queryset(outbox.CALIFICACION, 'ELIMINAR', queryset,
+                                          origen='operacion_masiva', operacion_masiva=operacion.id)
+                afectadas = queryset.delete()[0]
+                omitidas = 0
+            # El filtro puede abarcar cualquier cantidad de emisores
+            perfiles.invalidar_todos()
+    except Exception as e:
+        operacion.estado = 'FALLIDA'
+        operacion.error = str(e)
+    else:
+        operacion.estado = 'TERMINADA'
+        operacion.afectadas = afectadas
+        operacion.omitidas = omitidas
+        # El conteo definitivo es el de la ejecución (puede diferir del estimado al crearla)
+        operacion.total = afectadas + omitidas
+    operacion.fecha_fin = timezone.now()
+    operacion.save(update_fields=['estado', 'error', 'afectadas', 'omitidas', 'total', 'fecha_fin'])
+    return operacion
+
+
+def _ejecutar_en_segundo_plano(operacion_id):
+    try:
+        ejecutar(OperacionMasiva.objects.select_related('factor_destino', 'usuario').get(pk=operacion_id))
+    finally:
+        connection.close()
+
+
+def crear(tipo, filtro, usuario, factor_destino_id=None):
+    """Valida y registra una operación; la ejecuta ahora o en segundo plano según su tamaño.
+
+    Devuelve (operacion, en_segundo_plano).
+    """
+    factor_destino = _factor_destino(tipo, factor_destino_id)
+    total = filtrar(filtro).count()
+    operacion = OperacionMasiva.objects.create(
+        tipo=tipo, filtro=filtro, factor_destino=factor_destino, usuario=usuario, total=total,
+    )
+    if total <= settings.OPERACIONES_MASIVAS_UMBRAL:
+        return ejecutar(operacion), False
+
+    # El hilo arranca al confirmar la transacción, para que vea el registro recién creado
+    transaction.on_commit(
+        lambda: threading.Thread(target=_ejecutar_en_segundo_plano, args=(operacion.id,), daemon=True).start()
+    )
+    return operacion, True
+
+
+def estado(operacion):
+    return {
+        'id': operacion.id,
+        'tipo': operacion.tipo,
+        'filtro': operacion.filtro,
+        'factor_destino': operacion.factor_destino_id,
+        'estado': operacion.estado,
+        'total': operacion.total,
+        'afectadas': operacion.afectadas,
+        'omitidas': operacion.omitidas,
+        'error': operacion.error,
+        'fecha_creacion': operacion.fecha_creacion,
+        'fecha_fin': operacion.fecha_fin,
+    }
+
+
+def cambiar_estado_emisores(ruts, activo):
+    """Baja lógica (activo=False) o reactivación de los emisores de `ruts` con un solo UPDATE.
+
+    Devuelve {'actualizados', 'sin_cambios', 'no_encontrados'}; los RUT inválidos o sin
+    emisor se listan en 'no_encontrados'.
+    """
+    if not isinstance(ruts, list) or not ruts:
+        raise FiltroInvalido("'ruts' debe ser una lista no vacía")
+    pares = list(zip(ruts, normalizar_ruts(ruts)))
+    no_encontrados = [str(rut) for rut, numero in pares if numero is None]
+    numeros = {numero: rut for rut, numero in pares if numero is not None}
+
+    emisores = Emisor.objects.filter(rut_numero__in=numeros)
+    with transaction.atomic():
+        existentes = set(emisores.values_list('rut_numero', flat=True))
+        cambiados = list(emisores.exclude(activo=activo).values_list('pk', flat=True))
+        actualizados = Emisor.objects.filter(pk__in=cambiados).update(activo=activo)
+        if actualizados:
+            outbox.registrar(outbox.EMISOR, 'ACTUALIZAR', cambiados, origen='estado_masivo')
+            perfiles.invalidar(cambiados)
+    if actualizados:
+        cache_listas.invalidar(cache_listas.EMISORES)
+    no_encontrados += [str(rut) for numero, rut in numeros.items() if numero not in existentes]
+    return {
+        'actualizados': actualizados,
+        'sin_cambios': len(existentes) - actualizados,
+        'no_encontrados': no_encontrados,
+    }
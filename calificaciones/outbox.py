@@ -0,0 +1,137 @@
+"""Outbox transaccional y feed de cambios para sistemas externos.
+
+Cada vía de escritura deja un `EventoOutbox` dentro de su propia transacción, de modo
+que el evento existe si y solo si el cambio se confirmó:
+
+- save()/delete() de emisores, factores y calificaciones: un evento por fila (signals y
+  vistas de formulario).
+- Cargas masivas y operaciones masivas: un evento por lote, con los ids del lote.
+
+Al confirmarse, cada evento se avisa también a los navegadores conectados por SSE
+(canal notificaciones.CAMBIOS), solo con su resumen.
+
+Los consumidores leen con `leer_cambios(token)`: devuelve los eventos posteriores al
+token, en orden de `posicion`, y el token para la siguiente lectura. Los ids se asignan al
+insertar y no al confirmar: una transacción larga (una operación masiva, un lote grande)
+confirma eventos con ids menores que otros ya entregados. Por eso el cursor no es el id
+sino `posicion`, que `publicar_pendientes()` asigna a los eventos ya confirmados, en
+orden, bajo un lock que se suelta recién al confirmar la asignación: ninguna posición
+nueva queda por debajo de una ya visible para un consumidor.
+"""
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Max, Min
+
+from . import notificaciones
+from .models import EventoOutbox
+
+CALIFICACION = 'calificacion'
+EMISOR = 'emisor'
+FACTOR = 'factor'
+
+
+# Clave del advisory lock de PostgreSQL que serializa la publicación entre procesos
+_LLAVE_PUBLICACION = 460047
+_lock_publicacion = threading.Lock()
+
+
+class TokenInvalido(ValueError):
+    """Token de feed que no corresponde a ninguno entregado por `leer_cambios`."""
+
+
+def registrar(entidad, operacion, ids, **datos):
+    """Escribe un evento con los ids afectados; debe llamarse dentro de la transacción del cambio."""
+    evento = EventoOutbox.objects.create(entidad=entidad, operacion=operacion, ids=list(ids), datos=datos)
+    resumen = {
+        'id': evento.id, 'entidad': entidad, 'operacion': operacion,
+        'cantidad': len(evento.ids), 'origen': datos.get('origen'),
+    }
+    transaction.on_commit(lambda: notificaciones.publicar(notificaciones.CAMBIOS, 'cambio', resumen))
+    return evento
+
+
+def registrar_ids(entidad, operacion, ids, **datos):
+    """Un evento por cada OUTBOX_IDS_POR_EVENTO ids ya conocidos (p. ej. devueltos por el INSERT); devuelve cuántos."""
+    ids = sorted(ids)
+    paso = settings.OUTBOX_IDS_POR_EVENTO
+    for inicio in range(0, len(ids), paso):
+        registrar(entidad, operacion, ids[inicio:inicio + paso], **datos)
+    return (len(ids) + paso - 1) // paso
+
+
+def registrar_queryset(entidad, operacion, queryset, **datos):
+    """Un evento por cada OUTBOX_IDS_POR_EVENTO filas del queryset (recorridas por pk); devuelve cuántos."""
+    eventos = 0
+    ultimo = None
+    while True:
+        pendientes = queryset.order_by('pk')
+        if ultimo is not None:
+            pendientes = pendientes.filter(pk__gt=ultimo)
+        ids = list(pendientes.values_list('pk', flat=True)[:settings.OUTBOX_IDS_POR_EVENTO])
+        if not ids:
+            return eventos
+        registrar(entidad, operacion, ids, **datos)
+        eventos += 1
+        if len(ids) < settings.OUTBOX_IDS_POR_EVENTO:
+            return eventos
+        ultimo = ids[-1]
+
+
+def _cursor(token):
+    if token in (None, ''):
+        return 0
+    try:
+        cursor = int(token)
+    except (TypeError, ValueError):
+        raise TokenInvalido(f'Token inválido: {token!r}')
+    if cursor < 0:
+        raise TokenInvalido(f'Token inválido: {token!r}')
+    return cursor
+
+
+def publicar_pendientes():
+    """Asigna `posicion` a los eventos confirmados que aún no la tienen; devuelve cuántos.
+
+    Las posiciones nuevas parten sobre la mayor ya asignada y conservan el orden de id entre
+    los publicados juntos. Los que se confirmen durante la asignación quedan para la siguiente.
+    """
+    with _lock_publicacion, transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_xact_lock(%s)', [_LLAVE_PUBLICACION])
+        primero = EventoOutbox.objects.filter(posicion=None).aggregate(primero=Min('id'))['primero']
+        if primero is None:
+            return 0
+        ultima = EventoOutbox.objects.aggregate(ultima=Max('posicion'))['ultima'] or 0
+        return EventoOutbox.objects.filter(posicion=None, id__gte=primero).update(
+            posicion=F('id') + (ultima - primero + 1)
+        )
+
+
+def serializar(evento):
+    return {
+        'token': str(evento.posicion),
+        'entidad': evento.entidad,
+        'operacion': evento.operacion,
+        'ids': evento.ids,
+        'datos': evento.datos,
+        'fecha': evento.fecha.isoformat(),
+    }
+
+
+def leer_cambios(token=None, limite=100):
+    """Eventos posteriores a `token` (todos si es None) en lotes de hasta `limite`.
+
+    Devuelve {'eventos', 'siguiente', 'hay_mas'}: `siguiente` es el token a enviar en la
+    próxima lectura (el mismo si no hubo eventos nuevos).
+    """
+    cursor = _cursor(token)
+    publicar_pendientes()
+    eventos = list(EventoOutbox.objects.filter(posicion__gt=cursor).order_by('posicion')[:limite])
+    return {
+        'eventos': [serializar(evento) for evento in eventos],
+        'siguiente': str(eventos[-1].posicion if eventos else cursor),
+        'hay_mas': len(eventos) == limite,
+    }
@@ -0,0 +1,169 @@
+"""Perfil de un emisor: sus datos, todas sus calificaciones y su historial reciente, en una consulta.
+
+En PostgreSQL y SQLite el perfil sale de una sola sentencia que arma las listas con
+agregación JSON en la BD (`json_agg`/`json_build_object` o `json_group_array`/`json_object`);
+en otros motores, de tres consultas del ORM. El resultado se guarda en cache por emisor.
+
+Invalidación, al confirmarse la transacción del cambio:
+
+- `invalidar(emisor_ids)`: escrituras que conocen los emisores afectados (signals de
+  calificaciones, auditoría y emisores; vistas de eliminación; lotes de las cargas masivas).
+- `invalidar_todos()`: escrituras de conjunto sobre cualquier emisor (operaciones masivas,
+  cambios de factores). Sube una generación, como en cache_listas.
+"""
+import datetime
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Calificacion, Emisor, FactorTributario, HistorialAuditoria
+
+_CLAVE_GENERACION = 'perfiles:generacion'
+
+CAMPOS_CALIFICACION = ('id', 'factor', 'descripcion', 'fecha', 'comentario', 'usuario')
+CAMPOS_HISTORIAL = ('accion', 'fecha', 'usuario', 'factor_anterior', 'factor_nuevo',
+                    'comentario_anterior', 'comentario_nuevo')
+
+# Funciones de agregación JSON por motor: (agregado de una lista, objeto)
+_JSON = {
+    'postgresql': ('json_agg', 'json_build_object'),
+    'sqlite': ('json_group_array', 'json_object'),
+}
+
+
+def _generacion():
+    return cache.get_or_set(_CLAVE_GENERACION, time.time_ns, timeout=None)
+
+
+def _clave(emisor_id, generacion, con_historial):
+    # El historial es solo para analistas: cada variante tiene su propia entrada
+    return f"perfiles:{generacion}:{emisor_id}:{'historial' if con_historial else 'basico'}"
+
+
+def invalidar(emisor_ids):
+    """Borra de la cache el perfil de los emisores, al confirmarse la transacción en curso."""
+    emisor_ids = set(emisor_ids)
+    if emisor_ids:
+        transaction.on_commit(lambda: cache.delete_many([
+            _clave(i, _generacion(), con_historial) for i in emisor_ids for con_historial in (True, False)
+        ]))
+
+
+def invalidar_todos():
+    def subir():
+        try:
+            cache.incr(_CLAVE_GENERACION)
+        except ValueError:
+            cache.set(_CLAVE_GENERACION, time.time_ns(), timeout=None)
+    transaction.on_commit(subir)
+
+
+def _sql_perfil(conexion):
+    agregado, objeto = _JSON[conexion.vendor]
+    q = conexion.ops.quote_name
+    emisor = q(Emisor._meta.db_table)
+    calificacion = q(Calificacion._meta.db_table)
+    factor = q(FactorTributario._meta.db_table)
+    auditoria = q(HistorialAuditoria._meta.db_table)
+    usuario = q(Calificacion._meta.get_field('usuario').related_model._meta.db_table)
+    # Las listas salen de subconsultas ordenadas: el agregado respeta ese orden
+    return f"""
+        SELECT e.id, e.rut, e.nombre, e.direccion, e.activo,
+            (SELECT {agregado}({objeto}(
+                'id', c.id, 'factor', c.factor, 'descripcion', c.descripcion, 'fecha', c.fecha,
+                'comentario', c.comentario, 'usuario', c.usuario))
+             FROM (SELECT c.id, f.codigo AS factor, f.descripcion, c.fecha_asignacion AS fecha,
+                          c.comentario, u.username AS usuario
+                   FROM {calificacion} c
+                   JOIN {factor} f ON f.id = c.factor_id
+                   LEFT JOIN {usuario} u ON u.id = c.usuario_id
+                   WHERE c.emisor_id = e.id
+                   ORDER BY f.codigo) c),
+            (SELECT {agregado}({objeto}(
+                'accion', h.accion, 'fecha', h.fecha, 'usuario', h.usuario,
+                'factor_anterior', h.factor_anterior, 'factor_nuevo', h.factor_nuevo,
+                'comentario_anterior', h.comentario_anterior, 'comentario_nuevo', h.comentario_nuevo))
+             FROM (SELECT h.accion, h.fecha, u.username AS usuario, h.factor_anterior, h.factor_nuevo,
+                          h.comentario_anterior, h.comentario_nuevo
+                   FROM {auditoria} h
+                   LEFT JOIN {usuario} u ON u.id = h.usuario_id
+                   WHERE h.emisor_id = e.id
+                   ORDER BY h.fecha DESC, h.id DESC
+                   LIMIT %s) h)
+        FROM {emisor} e
+        WHERE e.id = %s
+    """
+
+
+def _lista_json(valor):
+    if valor is None:
+        return []
+    lista = json.loads(valor) if isinstance(valor, str) else valor
+    for elemento in lista:
+        # Misma representación de fechas (ISO 8601) en todos los motores
+        fecha = parse_datetime(elemento['fecha']) if isinstance(elemento['fecha'], str) else None
+        if fecha is not None:
+            # SQLite guarda la hora en UTC sin zona
+            if timezone.is_naive(fecha):
+                fecha = timezone.make_aware(fecha, datetime.timezone.utc)
+            elemento['fecha'] = fecha.isoformat()
+    return lista
+
+
+def _consultar_agregado(emisor_id, eventos):
+    with connection.cursor() as cursor:
+        cursor.execute(_sql_perfil(connection), [eventos, emisor_id])
+        fila = cursor.fetchone()
+    if fila is None:
+        return None
+    id_, rut, nombre, direccion, activo, calificaciones, historial = fila
+    return {
+        'id': id_, 'rut': rut, 'nombre': nombre, 'direccion': direccion, 'activo': bool(activo),
+        'calificaciones': _lista_json(calificaciones),
+        'historial': _lista_json(historial),
+    }
+
+
+def _consultar_orm(emisor_id, eventos):
+    datos = Emisor.objects.filter(pk=emisor_id).values('id', 'rut', 'nombre', 'direccion', 'activo').first()
+    if datos is None:
+        return None
+    calificaciones = Calificacion.objects.filter(emisor_id=emisor_id).order_by('factor__codigo').values_list(
+        'id', 'factor__codigo', 'factor__descripcion', 'fecha_asignacion', 'comentario', 'usuario__username',
+    )
+    datos['calificaciones'] = [
+        dict(zip(CAMPOS_CALIFICACION, fila), fecha=fila[3].isoformat()) for fila in calificaciones
+    ]
+    historial = HistorialAuditoria.objects.filter(emisor_id=emisor_id).order_by('-fecha', '-id').values_list(
+        'accion', 'fecha', 'usuario__username', 'factor_anterior', 'factor_nuevo',
+        'comentario_anterior', 'comentario_nuevo',
+    )[:eventos]
+    datos['historial'] = [dict(zip(CAMPOS_HISTORIAL, fila), fecha=fila[1].isoformat()) for fila in historial]
+    return datos
+
+
+def perfil(emisor_id, con_historial=True):
+    """Perfil del emisor (None si no existe), desde la cache o la BD primaria.
+
+    Trae sus calificaciones ordenadas por código de factor y, con `con_historial`, los
+    últimos PERFIL_HISTORIAL_EVENTOS eventos de auditoría, del más reciente al más antiguo.
+    """
+    clave = _clave(emisor_id, _generacion(), con_historial)
+    datos = cache.get(clave)
+    if datos is None:
+        eventos = settings.PERFIL_HISTORIAL_EVENTOS if con_historial else 0
+        if connection.vendor in _JSON:
+            datos = _consultar_agregado(emisor_id, eventos)
+        else:
+            datos = _consultar_orm(emisor_id, eventos)
+        if datos is None:
+            return None
+        if not con_historial:
+            del datos['historial']
+        cache.set(clave, datos, settings.PERFIL_CACHE_SEGUNDOS)
+    return datos
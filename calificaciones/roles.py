@@ -0,0 +1,88 @@
+"""Roles de la aplicación (corredor, analista, admin) resueltos una vez por request.
+
+El rol combina los flags de Django (is_superuser, is_staff), que llegan con el usuario en
+cada request, y los grupos (GRUPO_ADMIN, GRUPO_ANALISTA), que requieren una consulta. Los
+grupos se guardan en la sesión junto con su generación: los signals de calificaciones.signals
+suben la generación en la cache cuando cambian los grupos de un usuario (o cualquier
+grupo), y la sesión se vuelve a leer de la BD recién entonces, o a más tardar tras
+ROLES_SESION_SEGUNDOS: con una cache por proceso la generación no llega a los demás, y
+una revocación de grupo no puede quedar vigente indefinidamente. Dentro del request el
+resultado queda en `request` y lo comparten los decoradores, las vistas y los templates
+(variable `roles`, vía el context processor).
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+GRUPO_ADMIN = 'Administrador'
+GRUPO_ANALISTA = 'Analista'
+
+ADMIN = 'admin'
+ANALISTA = 'analista'
+CORREDOR = 'corredor'
+
+_CLAVE_SESION = 'roles_grupos'
+
+
+class Roles:
+    def __init__(self, usuario, grupos):
+        self.grupos = frozenset(grupos)
+        self.es_admin = usuario.is_superuser or GRUPO_ADMIN in self.grupos
+        self.es_analista = self.es_admin or usuario.is_staff or GRUPO_ANALISTA in self.grupos
+        if self.es_admin:
+            self.nombre = ADMIN
+        elif self.es_analista:
+            self.nombre = ANALISTA
+        else:
+            self.nombre = CORREDOR
+
+    def tiene_grupo(self, nombre):
+        return nombre in self.grupos
+
+
+def _claves_generacion(usuario_id):
+    return 'roles:generacion', f'roles:generacion:{usuario_id}'
+
+
+def _generacion(usuario_id):
+    claves = _claves_generacion(usuario_id)
+    valores = cache.get_many(claves)
+    return [valores.get(clave, 0) for clave in claves]
+
+
+def invalidar(usuario_id=None):
+    """Descarta los grupos guardados en sesión de un usuario (de todos si no se indica)."""
+    clave = _claves_generacion(usuario_id)[0 if usuario_id is None else 1]
+    try:
+        cache.incr(clave)
+    except ValueError:
+        cache.set(clave, 1, timeout=None)
+
+
+def _grupos(request, usuario):
+    sesion = getattr(request, 'session', None)
+    generacion = _generacion(usuario.pk)
+    guardado = sesion.get(_CLAVE_SESION) if sesion is not None else None
+    ahora = time.time()
+    if (guardado and guardado['usuario'] == usuario.pk and guardado['generacion'] == generacion
+            and ahora < guardado.get('vence', 0)):
+        return guardado['grupos']
+
+    grupos = list(usuario.groups.values_list('name', flat=True))
+    if sesion is not None:
+        sesion[_CLAVE_SESION] = {
+            'usuario': usuario.pk, 'generacion': generacion, 'grupos': grupos,
+            'vence': ahora + settings.ROLES_SESION_SEGUNDOS,
+        }
+    return grupos
+
+
+def roles_de(request):
+    """Roles del usuario del request, calculados a lo sumo una vez por request."""
+    roles = getattr(request, '_roles', None)
+    if roles is None:
+        usuario = request.user
+        grupos = _grupos(request, usuario) if usuario.is_authenticated else []
+        roles = request._roles = Roles(usuario, grupos)
+    return roles
@@ -0,0 +1,86 @@
+"""Normalización y validación de RUT chileno (dígito verificador módulo 11).
+
+Compartido por `EmisorForm`, el modelo `Emisor` y los importadores de carga masiva,
+de modo que un mismo RUT escrito como `12.345.678-5`, `12345678-5` o `123456785`
+se resuelve siempre al mismo número entero (`Emisor.rut_numero`).
+"""
+import re
+
+_SEPARADORES = str.maketrans('', '', '.- \t')
+# Hasta 8 dígitos sin DV: en formato canónico (99.999.999-9) cabe en Emisor.rut (12 caracteres)
+_PATRON = re.compile(r'^(\d{1,8})([0-9K])$')
+RUT_MAXIMO = 99_999_999
+
+
+class RutInvalido(ValueError):
+    """El valor no tiene formato de RUT o su dígito verificador no coincide."""
+
+
+def calcular_dv(numero):
+    """Calcula el dígito verificador ('0'-'9' o 'K') de un RUT sin DV."""
+    total, factor = 0, 2
+    while numero:
+        total += (numero % 10) * factor
+        numero //= 10
+        factor = 2 if factor == 7 else factor + 1
+    resto = 11 - total % 11
+    if resto == 11:
+        return '0'
+    if resto == 10:
+        return 'K'
+    return str(resto)
+
+
+def separar_rut(valor):
+    """Devuelve (número, dv) de un RUT en cualquier formato, sin validar el DV."""
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    limpio = str(valor or '').strip().upper().translate(_SEPARADORES)
+    match = _PATRON.match(limpio)
+    if not match:
+        raise RutInvalido(f'Formato de RUT inválido: {valor}')
+    return int(match.group(1)), match.group(2)
+
+
+def validar_rut(valor):
+    """Devuelve el número del RUT si el formato y el dígito verificador son correctos."""
+    numero, dv = separar_rut(valor)
+    if calcular_dv(numero) != dv:
+        raise RutInvalido(f'Dígito verificador inválido: {valor}')
+    return numero
+
+
+def formatear_rut(numero):
+    """Formato canónico de despliegue: 12.345.678-5."""
+    return f"{numero:,}".replace(',', '.') + f"-{calcular_dv(numero)}"
+
+
+def rangos_prefijo(prefijo):
+    """Rangos (desde, hasta) de los números de RUT cuyos dígitos empiezan con `prefijo`.
+
+    Uno por cada largo posible (hasta 8 dígitos), para buscar por prefijo sobre la
+    columna entera `rut_numero` en vez del texto con puntos de `rut`.
+    """
+    digitos = str(prefijo).translate(_SEPARADORES)
+    if not digitos.isdigit() or len(digitos) > 8:
+        return []
+    base = int(digitos)
+    return [
+        (base * 10 ** extra, (base + 1) * 10 ** extra - 1)
+        for extra in range(9 - len(digitos))
+    ]
+
+
+def normalizar_ruts(valores):
+    """Normaliza una columna completa de RUTs (un lote de filas de una carga).
+
+    Devuelve, en el mismo orden, el número de cada RUT válido o None si es inválido.
+    Los valores repetidos, frecuentes en planillas, se validan una sola vez.
+    """
+    resueltos = {}
+    for valor in set(valores):
+        try:
+            resueltos[valor] = validar_rut(valor)
+        except RutInvalido:
+            resueltos[valor] = None
+    return [resueltos[valor] for valor in valores]
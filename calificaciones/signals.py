@@ -1,6 +1,9 @@
-from django.db.models.signals import pre_save, post_save
+from django.contrib.auth.models import Group, User
+from django.db.models.signals import m2m_changed, pre_save, post_save, post_delete
 from django.dispatch import receiver
-from .models import Calificacion, HistorialAuditoria
+from . import cache_listas, outbox, perfiles, roles
+from .models import Calificacion, Emisor, FactorTributario, HistorialAuditoria
+from .versiones import sincronizar_versiones
 
 @receiver(pre_save, sender=Calificacion)
 def calificacion_pre_save(sender, instance, **kwargs):
@@ -15,6 +18,9 @@ def calificacion_pre_save(sender, instance, **kwargs):
 
 @receiver(post_save, sender=Calificacion)
 def calificacion_post_save(sender, instance, created, **kwargs):
+    sincronizar_versiones(Calificacion.objects.filter(pk=instance.pk))
+    outbox.registrar(outbox.CALIFICACION, 'CREAR' if created else 'ACTUALIZAR', [instance.pk])
+    perfiles.invalidar([instance.emisor_id])
     factor_anterior = getattr(instance, '_original_factor', None)
     factor_nuevo = instance.factor
     if created:
@@ -32,3 +38,44 @@ def calificacion_post_save(sender, instance, created, **kwargs):
                 factor_anterior=str(factor_anterior) if factor_anterior else None,
                 factor_nuevo=str(factor_nuevo),
             )
+
+@receiver(post_save, sender=HistorialAuditoria)
+def auditoria_registrada(sender, instance, **kwargs):
+    perfiles.invalidar([instance.emisor_id])
+
+def _operacion(kwargs):
+    if kwargs['signal'] is post_delete:
+        return 'ELIMINAR'
+    return 'CREAR' if kwargs['created'] else 'ACTUALIZAR'
+
+# Calificacion no tiene receptor de post_delete a propósito: Django cargaría cada fila en
+# los DELETE de conjunto. Las vistas que eliminan registran el evento de outbox a mano.
+@receiver([post_save, post_delete], sender=Emisor)
+def emisor_modificado(sender, instance, **kwargs):
+    cache_listas.invalidar(cache_listas.EMISORES)
+    perfiles.invalidar([instance.pk])
+    outbox.registrar(outbox.EMISOR, _operacion(kwargs), [instance.pk])
+
+@receiver([post_save, post_delete], sender=FactorTributario)
+def factor_modificado(sender, instance, **kwargs):
+    cache_listas.invalidar(cache_listas.FACTORES)
+    # El código y la descripción del factor aparecen en el perfil de cualquier emisor
+    perfiles.invalidar_todos()
+    outbox.registrar(outbox.FACTOR, _operacion(kwargs), [instance.pk])
+
+@receiver(m2m_changed, sender=User.groups.through)
+def grupos_de_usuario_modificados(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        roles.invalidar(instance.pk)
+    elif pk_set:
+        for usuario_id in pk_set:
+            roles.invalidar(usuario_id)
+    else:
+        # group.user_set.clear(): no se informan los usuarios afectados
+        roles.invalidar()
+
+@receiver([post_save, post_delete], sender=Group)
+def grupo_modificado(sender, **kwargs):
+    roles.invalidar()
@@ -0,0 +1,267 @@
+"""Snapshot columnar de la relación emisor × factor (calificaciones vigentes).
+
+Cada columna se escribe como un archivo `.npy` independiente (formato NumPy 1.0),
+ordenado por id, para que los procesos de riesgo lo lean sin copia.
+
+Cada snapshot se escribe completo en su propio directorio (`v<marca>/`) y se publica
+reemplazando `manifest.json` de forma atómica: el manifest dice qué directorio es el
+vigente, así que quien lo lee una vez y abre las columnas de ese directorio nunca mezcla
+columnas de dos snapshots:
+
+    manifest = json.load(open('snapshots/manifest.json'))
+    ids = numpy.load('snapshots/' + manifest['columnas']['id']['archivo'], mmap_mode='r')
+
+Se conservan los últimos VERSIONES_CONSERVADAS directorios, para que un lector que leyó
+el manifest justo antes de publicar otro alcance a abrir las columnas.
+
+Por defecto un snapshot se genera incrementalmente desde el anterior: se leen de la BD
+solo las filas con `fecha_modificacion` desde la marca anterior (menos MARGEN_INCREMENTAL)
+y las eliminaciones que registró el outbox desde la posición anterior, y se fusionan con
+las columnas del snapshot anterior. Los archivos se reescriben siempre (cada snapshot es
+inmutable), pero la consulta abarca solo lo que cambió.
+
+No se requiere NumPy para generarlo: el encabezado `.npy` se escribe a mano y los
+datos salen de `array.array`.
+"""
+import ast
+import bisect
+import json
+import os
+import shutil
+import struct
+import sys
+import tempfile
+from array import array
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import router
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import outbox
+from .models import Calificacion, EventoOutbox
+
+# nombre -> (descr NumPy, typecode de array.array)
+COLUMNAS = {
+    'id': ('<i8', 'q'),
+    'emisor_id': ('<i4', 'i'),
+    'factor_id': ('<i4', 'i'),
+    'fecha_asignacion': ('<M8[s]', 'q'),
+}
+MANIFEST = 'manifest.json'
+VERSION = 3
+# Directorios de snapshot que se conservan (el vigente y los anteriores más recientes)
+VERSIONES_CONSERVADAS = 3
+# Solapamiento al releer cambios, para no perder transacciones que confirmaron tarde
+# (o que una réplica atrasada aún no tenía)
+MARGEN_INCREMENTAL = timedelta(minutes=5)
+LOTE_LECTURA = 20000
+
+_MAGIC = b'\x93NUMPY\x01\x00'
+
+
+def directorio_snapshot():
+    return Path(settings.SNAPSHOT_DIR)
+
+
+def escribir_npy(ruta, descr, datos):
+    """Escribe un array 1-D en formato .npy 1.0 (encabezado alineado a 64 bytes)."""
+    encabezado = f"{{'descr': '{descr}', 'fortran_order': False, 'shape': ({len(datos)},), }}"
+    relleno = 64 - (len(_MAGIC) + 2 + len(encabezado) + 1) % 64
+    encabezado = (encabezado + ' ' * relleno + '\n').encode('latin1')
+    if sys.byteorder == 'big':
+        datos = array(datos.typecode, datos)
+        datos.byteswap()
+    with open(ruta, 'wb') as f:
+        f.write(_MAGIC + struct.pack('<H', len(encabezado)) + encabezado)
+        datos.tofile(f)
+
+
+def leer_npy(ruta, typecode):
+    """Lee un .npy escrito por `escribir_npy` a un array.array (sin NumPy)."""
+    with open(ruta, 'rb') as f:
+        if f.read(len(_MAGIC)) != _MAGIC:
+            raise ValueError(f'{ruta} no es un archivo .npy 1.0')
+        largo, = struct.unpack('<H', f.read(2))
+        encabezado = ast.literal_eval(f.read(largo).decode('latin1'))
+        datos = array(typecode)
+        datos.fromfile(f, encabezado['shape'][0])
+    if sys.byteorder == 'big':
+        datos.byteswap()
+    return datos
+
+
+def leer_manifest(directorio=None):
+    ruta = (directorio or directorio_snapshot()) / MANIFEST
+    if not ruta.exists():
+        return None
+    with open(ruta, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def snapshots(directorio=None):
+    """Nombres de los directorios de snapshot publicados, del más antiguo al más reciente."""
+    directorio = directorio or directorio_snapshot()
+    if not directorio.exists():
+        return []
+    return sorted(d.name for d in directorio.iterdir() if d.is_dir() and d.name.startswith('v'))
+
+
+def ruta_columna(snapshot, nombre, directorio=None):
+    """Ruta de una columna de un snapshot publicado, o None si no existe."""
+    if nombre not in COLUMNAS or snapshot not in snapshots(directorio):
+        return None
+    ruta = (directorio or directorio_snapshot()) / snapshot / f'{nombre}.npy'
+    return ruta if ruta.exists() else None
+
+
+def _columnas_vacias():
+    return {nombre: array(typecode) for nombre, (_, typecode) in COLUMNAS.items()}
+
+
+def _agregar_fila(columnas, fila):
+    id_, emisor_id, factor_id, fecha = fila
+    columnas['id'].append(id_)
+    columnas['emisor_id'].append(emisor_id)
+    columnas['factor_id'].append(factor_id)
+    columnas['fecha_asignacion'].append(int(fecha.timestamp()))
+
+
+def _filas(queryset):
+    return queryset.order_by('id').values_list(
+        'id', 'emisor_id', 'factor_id', 'fecha_asignacion'
+    ).iterator(chunk_size=LOTE_LECTURA)
+
+
+def _completo():
+    columnas = _columnas_vacias()
+    for fila in _filas(Calificacion.objects.all()):
+        _agregar_fila(columnas, fila)
+    return columnas
+
+
+def _eventos_outbox():
+    # El cursor y las eliminaciones se leen de la primaria: publicar_pendientes escribe ahí
+    return EventoOutbox.objects.using(router.db_for_write(EventoOutbox))
+
+
+def _posicion_outbox():
+    """Publica los eventos confirmados y devuelve la última posición asignada."""
+    outbox.publicar_pendientes()
+    return _eventos_outbox().aggregate(ultima=Max('posicion'))['ultima'] or 0
+
+
+def _eliminadas(desde, hasta):
+    """Ids de calificaciones eliminadas según los eventos del outbox en (desde, hasta]."""
+    listas = _eventos_outbox().filter(
+        entidad=outbox.CALIFICACION, operacion='ELIMINAR', posicion__gt=desde, posicion__lte=hasta,
+    ).values_list('ids', flat=True)
+    return {id_ for ids in listas.iterator() for id_ in ids}
+
+
+def _copiar(columnas, anteriores, desde, hasta, descartadas):
+    """Copia las filas [desde, hasta) del snapshot anterior, salvo las posiciones `descartadas` (ordenadas)."""
+    inicio = desde
+    for posicion in descartadas[bisect.bisect_left(descartadas, desde):bisect.bisect_left(descartadas, hasta)]:
+        for nombre in COLUMNAS:
+            columnas[nombre].extend(anteriores[nombre][inicio:posicion])
+        inicio = posicion + 1
+    for nombre in COLUMNAS:
+        columnas[nombre].extend(anteriores[nombre][inicio:hasta])
+
+
+def _incremental(directorio, previo, posicion):
+    """Columnas del snapshot `previo` con los cambios posteriores a su marca aplicados.
+
+    Las filas modificadas reemplazan (o se intercalan, por id) a las del snapshot anterior.
+    Las eliminadas se descartan aunque aparezcan entre las modificadas: los ids no se
+    reutilizan, así que una fila eliminada que una réplica atrasada aún muestra no vuelve.
+    """
+    anteriores = {
+        nombre: leer_npy(directorio / previo['columnas'][nombre]['archivo'], typecode)
+        for nombre, (_, typecode) in COLUMNAS.items()
+    }
+    ids_previos = anteriores['id']
+    eliminadas = _eliminadas(previo['outbox'], posicion)
+    modificadas = Calificacion.objects.filter(
+        fecha_modificacion__gte=parse_datetime(previo['marca']) - MARGEN_INCREMENTAL,
+    )
+    descartadas = []
+    for id_ in sorted(eliminadas):
+        i = bisect.bisect_left(ids_previos, id_)
+        if i < len(ids_previos) and ids_previos[i] == id_:
+            descartadas.append(i)
+
+    columnas = _columnas_vacias()
+    copiadas = 0
+    for fila in _filas(modificadas):
+        i = bisect.bisect_left(ids_previos, fila[0], copiadas)
+        _copiar(columnas, anteriores, copiadas, i, descartadas)
+        # La versión anterior de una fila modificada se reemplaza
+        copiadas = i + 1 if i < len(ids_previos) and ids_previos[i] == fila[0] else i
+        if fila[0] not in eliminadas:
+            _agregar_fila(columnas, fila)
+    _copiar(columnas, anteriores, copiadas, len(ids_previos), descartadas)
+    return columnas
+
+
+def _descartar_antiguos(directorio, vigente):
+    """Borra los snapshots que exceden VERSIONES_CONSERVADAS y las columnas sueltas del formato 1."""
+    for nombre in snapshots(directorio)[:-VERSIONES_CONSERVADAS]:
+        if nombre != vigente:
+            shutil.rmtree(directorio / nombre, ignore_errors=True)
+    for nombre in COLUMNAS:
+        (directorio / f'{nombre}.npy').unlink(missing_ok=True)
+
+
+def generar_snapshot(completo=False, directorio=None):
+    """Genera un snapshot en un directorio nuevo, lo publica y devuelve su manifest.
+
+    Es incremental desde el snapshot vigente salvo con `completo` o si no hay uno utilizable.
+    """
+    directorio = directorio or directorio_snapshot()
+    directorio.mkdir(parents=True, exist_ok=True)
+    # La posición del outbox se toma antes de leer: lo que se confirme después entra en el siguiente
+    posicion = _posicion_outbox()
+    inicio = timezone.now()
+    snapshot = f'v{inicio:%Y%m%dT%H%M%S%f}'
+
+    previo = None if completo else leer_manifest(directorio)
+    if previo and previo.get('version') == VERSION and previo['snapshot'] in snapshots(directorio):
+        modo = 'incremental'
+        columnas = _incremental(directorio, previo, posicion)
+    else:
+        modo = 'completo'
+        columnas = _completo()
+
+    # Se escribe en un directorio temporal y se renombra entero: nunca queda uno a medias
+    temporal = Path(tempfile.mkdtemp(prefix=f'.{snapshot}.', dir=directorio))
+    for nombre, (descr, _) in COLUMNAS.items():
+        escribir_npy(temporal / f'{nombre}.npy', descr, columnas[nombre])
+    # mkdtemp lo crea solo para el dueño; los lectores pueden ser otros usuarios
+    os.chmod(temporal, 0o755)
+    os.rename(temporal, directorio / snapshot)
+
+    manifest = {
+        'version': VERSION,
+        'snapshot': snapshot,
+        'modo': modo,
+        'marca': inicio.isoformat(),
+        'outbox': posicion,
+        'generado': timezone.now().isoformat(),
+        'filas': len(columnas['id']),
+        'columnas': {
+            nombre: {'archivo': f'{snapshot}/{nombre}.npy', 'dtype': descr}
+            for nombre, (descr, _) in COLUMNAS.items()
+        },
+    }
+    # Publicación: un solo os.replace del manifest cambia todas las columnas a la vez
+    temporal = directorio / f'.{MANIFEST}.{snapshot}.tmp'
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temporal, directorio / MANIFEST)
+    _descartar_antiguos(directorio, snapshot)
+    return manifest
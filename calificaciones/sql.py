@@ -0,0 +1,55 @@
+"""SQL de conjunto que el ORM no expresa directamente."""
+from django.db import connections, router
+
+
+def insertar_select(modelo, queryset, columnas):
+    """``INSERT INTO <modelo> (...) SELECT ...`` con una expresión del queryset por columna.
+
+    `columnas` mapea nombres de campo de `modelo` a expresiones evaluadas sobre `queryset`;
+    devuelve las filas insertadas. Los valores constantes que puedan ser NULL deben llevar
+    Cast: PostgreSQL no inserta un NULL sin tipo del SELECT en una columna no textual.
+    """
+    conexion = connections[queryset.db]
+    seleccion = queryset.order_by().annotate(**{f'_{nombre}': expresion for nombre, expresion in columnas.items()})
+    sql, params = seleccion.values_list(*(f'_{nombre}' for nombre in columnas)).query.sql_with_params()
+
+    opts = modelo._meta
+    destino = ', '.join(conexion.ops.quote_name(opts.get_field(nombre).column) for nombre in columnas)
+    with conexion.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {conexion.ops.quote_name(opts.db_table)} ({destino}) {sql}', params)
+        return cursor.rowcount
+
+
+def insertar_ignorando(objetos):
+    """``INSERT ... ON CONFLICT DO NOTHING RETURNING <pk>`` de instancias nuevas de un mismo modelo.
+
+    Devuelve los ids de las filas que sí se insertaron; las que chocan con una restricción
+    única (p. ej. creadas entretanto por otra escritura) se omiten. A diferencia de
+    `bulk_create(ignore_conflicts=True)`, que no devuelve ids, permite saber exactamente
+    qué filas escribió esta sentencia. PostgreSQL y SQLite 3.35+.
+    """
+    if not objetos:
+        return []
+    modelo = type(objetos[0])
+    opts = modelo._meta
+    conexion = connections[router.db_for_write(modelo)]
+    q = conexion.ops.quote_name
+    campos = [campo for campo in opts.concrete_fields if not campo.primary_key]
+    filas = [
+        [campo.get_db_prep_save(campo.pre_save(objeto, True), conexion) for campo in campos]
+        for objeto in objetos
+    ]
+    # Lotes dentro del máximo de parámetros por sentencia del motor (999 en SQLite)
+    por_sentencia = max(1, (conexion.features.max_query_params or 65535) // len(campos))
+    marcadores = '(' + ', '.join(['%s'] * len(campos)) + ')'
+    sql = (
+        f"INSERT INTO {q(opts.db_table)} ({', '.join(q(campo.column) for campo in campos)}) VALUES {{}} "
+        f"ON CONFLICT DO NOTHING RETURNING {q(opts.pk.column)}"
+    )
+    ids = []
+    with conexion.cursor() as cursor:
+        for inicio in range(0, len(filas), por_sentencia):
+            bloque = filas[inicio:inicio + por_sentencia]
+            cursor.execute(sql.format(', '.join([marcadores] * len(bloque))), [valor for fila in bloque for valor in fila])
+            ids.extend(fila[0] for fila in cursor.fetchall())
+    return ids
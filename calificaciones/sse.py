@@ -0,0 +1,91 @@
+"""Endpoint ASGI de server-sent events (ver notificaciones.py), montado en proyecto_nuam.asgi.
+
+Se atiende fuera de la pila de Django a propósito: el handler ASGI de Django asigna a cada
+request un hilo para el middleware sync (sesión, auth, mensajes) que queda tomado mientras
+dure la respuesta, y una conexión SSE dura horas. Aquí solo la autenticación (cookie de
+sesión) pasa por el ORM en un hilo compartido; después la conexión es una corrutina que
+espera su cola y la desconexión del cliente.
+
+Eventos: `cambio` (resumen de un evento de outbox confirmado), `progreso` (cargas masivas
+del usuario) y `desfase` (se descartaron mensajes por cola llena: conviene recargar).
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import auth
+from django.db import close_old_connections
+from django.http import HttpRequest, parse_cookie
+from django.utils.module_loading import import_string
+
+from . import notificaciones
+
+CABECERAS = [
+    (b'content-type', b'text/event-stream; charset=utf-8'),
+    (b'cache-control', b'no-cache'),
+    # Sin buffer en nginx: cada evento sale apenas se publica
+    (b'x-accel-buffering', b'no'),
+]
+
+
+def _usuario_de_sesion(clave_sesion):
+    """Id del usuario autenticado en la sesión, o None (sesión vencida, usuario inactivo, ...)."""
+    try:
+        request = HttpRequest()
+        request.session = import_string(settings.SESSION_ENGINE + '.SessionStore')(clave_sesion)
+        usuario = auth.get_user(request)
+        return usuario.pk if usuario.is_authenticated else None
+    finally:
+        close_old_connections()
+
+
+async def _rechazar(send, status, mensaje):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'text/plain; charset=utf-8')]})
+    await send({'type': 'http.response.body', 'body': mensaje.encode()})
+
+
+async def _esperar_desconexion(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def aplicacion_eventos(scope, receive, send):
+    cabeceras = dict(scope.get('headers', ()))
+    clave_sesion = parse_cookie(cabeceras.get(b'cookie', b'').decode('latin-1')).get(settings.SESSION_COOKIE_NAME)
+    usuario_id = await sync_to_async(_usuario_de_sesion, thread_sensitive=False)(clave_sesion) if clave_sesion else None
+    if usuario_id is None:
+        await _rechazar(send, 403, 'Inicia sesión para recibir notificaciones.')
+        return
+
+    suscripcion = notificaciones.suscribir([notificaciones.CAMBIOS, notificaciones.canal_usuario(usuario_id)])
+    desconexion = asyncio.ensure_future(_esperar_desconexion(receive))
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': CABECERAS})
+        # El navegador reconecta solo tras un corte; `retry` fija la espera
+        await send({'type': 'http.response.body', 'body': b'retry: 5000\n\n', 'more_body': True})
+        while True:
+            mensaje = asyncio.ensure_future(suscripcion.cola.get())
+            await asyncio.wait({mensaje, desconexion}, timeout=settings.SSE_HEARTBEAT_SEGUNDOS,
+                               return_when=asyncio.FIRST_COMPLETED)
+            if desconexion.done():
+                mensaje.cancel()
+                return
+            if not mensaje.done():
+                mensaje.cancel()
+                # Comentario SSE: mantiene viva la conexión a través de proxies
+                cuerpo = ': ping\n\n'
+            else:
+                tipo, datos = mensaje.result()
+                cuerpo = ''
+                if suscripcion.perdidos:
+                    cuerpo = f'event: desfase\ndata: {suscripcion.perdidos}\n\n'
+                    suscripcion.perdidos = 0
+                cuerpo += f'event: {tipo}\ndata: {datos}\n\n'
+            await send({'type': 'http.response.body', 'body': cuerpo.encode(), 'more_body': True})
+    except OSError:
+        # Cliente desconectado a mitad de un envío
+        pass
+    finally:
+        desconexion.cancel()
+        notificaciones.desuscribir(suscripcion)
@@ -0,0 +1,245 @@
+"""Subidas de archivos de carga masiva a disco, con huella SHA-256 y límite de tamaño.
+
+Dos caminos, ambos sin copiar el archivo completo en memoria:
+
+- Formulario clásico (`subida_a_disco`): el archivo se escribe a un temporal con
+  `CargaUploadHandler`, que mientras recibe calcula el SHA-256, cuenta las líneas y
+  corta la subida apenas supera `CARGA_MASIVA_MAX_MB`.
+- Subida reanudable por bloques (`SubidaReanudable`): el navegador envía el archivo en
+  trozos con su offset; si la conexión se corta, consulta cuánto llegó y sigue desde ahí.
+  Los archivos parciales viven en `SUBIDAS_DIR` y se purgan tras `SUBIDAS_EXPIRACION_HORAS`.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin flock, los bloques se serializan solo dentro del proceso
+    fcntl = None
+
+from django.conf import settings
+from django.core.files.uploadhandler import SkipFile, TemporaryFileUploadHandler
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+
+EXTENSIONES = ('.xlsx', '.csv')
+TAMANO_BLOQUE = 1024 * 1024
+
+
+_lock_bloques = threading.Lock()
+
+
+@contextmanager
+def _bloqueo_exclusivo(archivo):
+    """Lock exclusivo sobre el archivo abierto (flock, entre procesos) mientras dura el bloque."""
+    if fcntl is None:
+        with _lock_bloques:
+            yield
+        return
+    fcntl.flock(archivo.fileno(), fcntl.LOCK_EX)
+    try:
+        yield
+    finally:
+        fcntl.flock(archivo.fileno(), fcntl.LOCK_UN)
+
+
+def limite_bytes():
+    return settings.CARGA_MASIVA_MAX_MB * 1024 * 1024
+
+
+class Huella:
+    """SHA-256, bytes y líneas de un archivo, calculados bloque a bloque."""
+
+    def __init__(self):
+        self._sha = hashlib.sha256()
+        self.bytes = 0
+        self.lineas = 0
+        self._ultimo = b''
+
+    def actualizar(self, bloque):
+        self._sha.update(bloque)
+        self.bytes += len(bloque)
+        self.lineas += bloque.count(b'\n')
+        if bloque:
+            self._ultimo = bloque[-1:]
+
+    @property
+    def sha256(self):
+        return self._sha.hexdigest()
+
+    def filas_csv(self):
+        """Filas de datos de un CSV: líneas sin contar el encabezado (ni un salto final)."""
+        lineas = self.lineas + (1 if self.bytes and self._ultimo != b'\n' else 0)
+        return max(lineas - 1, 0)
+
+    @classmethod
+    def de_archivo(cls, ruta):
+        huella = cls()
+        with open(ruta, 'rb') as f:
+            for bloque in iter(lambda: f.read(TAMANO_BLOQUE), b''):
+                huella.actualizar(bloque)
+        return huella
+
+
+class CargaUploadHandler(TemporaryFileUploadHandler):
+    """Escribe el archivo a un temporal calculando su huella; descarta los que exceden el límite.
+
+    Al terminar, el archivo subido queda con `sha256` y `filas` (filas de datos si es CSV,
+    None en otro caso). Si se descarta, `request.carga_rechazada` trae el motivo.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.huella = Huella()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.huella.actualizar(raw_data)
+        if self.huella.bytes > limite_bytes():
+            self.request.carga_rechazada = (
+                f'El archivo {self.file_name} supera el tamaño máximo permitido '
+                f'de {settings.CARGA_MASIVA_MAX_MB} MB.'
+            )
+            raise SkipFile()
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        archivo = super().file_complete(file_size)
+        archivo.sha256 = self.huella.sha256
+        archivo.filas = self.huella.filas_csv() if self.file_name.lower().endswith('.csv') else None
+        return archivo
+
+
+def subida_a_disco(vista):
+    """Hace que la vista reciba sus archivos con `CargaUploadHandler` (nunca en memoria).
+
+    Los upload handlers deben cambiarse antes de que se lea request.POST, y la
+    verificación CSRF lo lee: por eso la vista se exime y se protege recién por dentro.
+    """
+    protegida = csrf_protect(vista)
+
+    @csrf_exempt
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        request.upload_handlers = [CargaUploadHandler(request)]
+        return protegida(request, *args, **kwargs)
+    return envoltura
+
+
+class SubidaInvalida(ValueError):
+    """Bloque fuera de orden, subida que excede lo declarado o archivo no permitido."""
+
+
+class SubidaReanudable:
+    """Archivo que se recibe por bloques en SUBIDAS_DIR: `<id>.part` + `<id>.json` (metadatos)."""
+
+    def __init__(self, subida_id, meta):
+        self.id = subida_id = str(subida_id)
+        self.meta = meta
+        directorio = directorio_subidas()
+        self.ruta = directorio / f'{subida_id}.part'
+        self._ruta_meta = directorio / f'{subida_id}.json'
+
+    @classmethod
+    def crear(cls, usuario, nombre, tamano):
+        nombre = os.path.basename(str(nombre or ''))
+        if not nombre.lower().endswith(EXTENSIONES):
+            raise SubidaInvalida(f"Formato no permitido. Use {' o '.join(EXTENSIONES)}")
+        if not isinstance(tamano, int) or tamano <= 0:
+            raise SubidaInvalida('Tamaño de archivo inválido')
+        if tamano > limite_bytes():
+            raise SubidaInvalida(
+                f'El archivo supera el tamaño máximo permitido de {settings.CARGA_MASIVA_MAX_MB} MB.'
+            )
+        purgar_subidas_vencidas()
+        subida = cls(str(uuid.uuid4()), {
+            'nombre': nombre, 'tamano': tamano, 'usuario_id': usuario.id, 'creada': time.time(),
+        })
+        directorio_subidas().mkdir(parents=True, exist_ok=True)
+        subida.ruta.touch()
+        subida._ruta_meta.write_text(json.dumps(subida.meta), encoding='utf-8')
+        return subida
+
+    @classmethod
+    def obtener(cls, subida_id, usuario):
+        """Devuelve la subida del usuario, o None si no existe (o es de otro usuario)."""
+        try:
+            subida_id = str(uuid.UUID(str(subida_id)))
+        except ValueError:
+            return None
+        ruta_meta = directorio_subidas() / f'{subida_id}.json'
+        try:
+            meta = json.loads(ruta_meta.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return None
+        if meta.get('usuario_id') != usuario.id:
+            return None
+        return cls(subida_id, meta)
+
+    @property
+    def recibido(self):
+        return self.ruta.stat().st_size
+
+    @property
+    def completa(self):
+        return self.recibido == self.meta['tamano']
+
+    def estado(self):
+        return {'id': self.id, 'nombre': self.meta['nombre'], 'tamano': self.meta['tamano'], 'recibido': self.recibido}
+
+    def agregar(self, offset, stream):
+        """Agrega un bloque leído de `stream` en `offset`; devuelve los bytes recibidos en total.
+
+        El offset se verifica y el bloque se escribe con el archivo bloqueado: dos reintentos
+        del mismo bloque (p. ej. tras un timeout del cliente) no pueden agregarlo dos veces.
+        """
+        with open(self.ruta, 'ab') as f, _bloqueo_exclusivo(f):
+            inicio = recibido = os.fstat(f.fileno()).st_size
+            if offset != recibido:
+                raise SubidaInvalida(f'Offset {offset} no coincide con lo recibido ({recibido})')
+            restante = self.meta['tamano'] - recibido
+            for bloque in iter(lambda: stream.read(TAMANO_BLOQUE), b''):
+                if len(bloque) > restante:
+                    # Se descarta el bloque completo: el cliente reintenta desde `inicio`
+                    f.truncate(inicio)
+                    raise SubidaInvalida('El bloque excede el tamaño declarado del archivo')
+                f.write(bloque)
+                restante -= len(bloque)
+                recibido += len(bloque)
+            # Escrito antes de soltar el lock, para que el siguiente vea el tamaño final
+            f.flush()
+        return recibido
+
+    def abrir(self):
+        return open(self.ruta, 'rb')
+
+    def eliminar(self):
+        for ruta in (self.ruta, self._ruta_meta):
+            try:
+                ruta.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def directorio_subidas():
+    return Path(settings.SUBIDAS_DIR)
+
+
+def purgar_subidas_vencidas():
+    """Elimina las subidas parciales sin actividad por más de SUBIDAS_EXPIRACION_HORAS."""
+    directorio = directorio_subidas()
+    if not directorio.exists():
+        return
+    limite = time.time() - settings.SUBIDAS_EXPIRACION_HORAS * 3600
+    for ruta in directorio.glob('*.part'):
+        try:
+            if ruta.stat().st_mtime < limite:
+                ruta.unlink()
+                ruta.with_suffix('.json').unlink(missing_ok=True)
+        except FileNotFoundError:
+            pass
@@ -1,3 +1,1091 @@
-from django.test import TestCase
+"""Guardas de regresión N+1: cantidad de consultas SQL de cada ruta de calificaciones.urls.
 
-# Create your tests here.
+Cada ruta con nombre se visita con datos sembrados a dos tamaños; si la cantidad de
+consultas crece con las filas, el test falla mostrando el SQL de la corrida grande.
+Las rutas nuevas con parámetros deben agregarse a ARGUMENTOS_RUTAS.
+"""
+import asyncio
+import io
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+
+from proyecto_nuam import db_router
+
+from . import (
+    cache_listas, cola_cargas, conteos, notificaciones, outbox, perfiles, roles, snapshot, sse,
+    urls as calificaciones_urls,
+)
+from .models import (
+    BitacoraAccesos, CargaMasiva, Calificacion, CalificacionVersion, Emisor, EventoOutbox, FactorTributario,
+    HistorialAuditoria,
+)
+from .rut import RutInvalido, calcular_dv, formatear_rut, normalizar_ruts, validar_rut
+
+TAMANO_CHICO = 3
+TAMANO_GRANDE = 30
+
+# nombre de ruta -> función(datos) que devuelve los kwargs para reverse()
+ARGUMENTOS_RUTAS = {
+    'emisor_update': lambda d: {'pk': d['emisor'].pk},
+    'emisor_delete': lambda d: {'pk': d['emisor'].pk},
+    'detalle_emisor': lambda d: {'id': d['emisor'].pk},
+    'perfil_emisor': lambda d: {'id': d['emisor'].pk},
+    'factor_update': lambda d: {'pk': d['factor'].pk},
+    'factor_delete': lambda d: {'pk': d['factor'].pk},
+    'detalle_factor': lambda d: {'id': d['factor'].pk},
+    'calificacion_update': lambda d: {'pk': d['calificacion'].pk},
+    'calificacion_delete': lambda d: {'pk': d['calificacion'].pk},
+    'detalle_calificacion_api': lambda d: {'id': d['calificacion'].pk},
+    'eliminar_usuario': lambda d: {'user_id': d['corredor'].pk},
+    'snapshot_columna': lambda d: {'snapshot': 'v0', 'columna': 'emisor_id'},
+    'subida_bloque': lambda d: {'subida_id': '00000000-0000-0000-0000-000000000000'},
+    'subida_procesar': lambda d: {'subida_id': '00000000-0000-0000-0000-000000000000'},
+    'operacion_masiva_estado': lambda d: {'pk': 0},
+    'carga_errores': lambda d: {'pk': 0},
+}
+
+# Changelists del admin de tablas grandes (sin N+1 de FKs en list_display)
+ADMIN_LISTADOS = ['calificacion', 'historialauditoria', 'bitacoraaccesos', 'calificacionversion']
+
+
+def rutas_con_nombre():
+    return [
+        patron for patron in calificaciones_urls.urlpatterns
+        if isinstance(patron, URLPattern) and patron.name
+    ]
+
+
+@override_settings(
+    SNAPSHOT_DIR=tempfile.gettempdir() + '/nuam-tests-snapshot',
+    SUBIDAS_DIR=tempfile.gettempdir() + '/nuam-tests-subidas',
+    # Se cuentan las consultas de la primaria: sin réplicas aunque DATABASE_REPLICA_URLS esté definida
+    DATABASE_REPLICAS=[],
+    # Sin cache de tablas: se mide la consulta y el render de los listados
+    LISTAS_CACHE_SEGUNDOS=0,
+)
+class ConsultasConstantesTests(TestCase):
+    """La cantidad de consultas de cada vista no debe depender de la cantidad de filas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin123')
+        cls.corredor = User.objects.create_user('corredor', 'corredor@example.com', 'corredor123')
+        cls.sembrados = 0
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def sembrar_hasta(self, total):
+        """Agrega emisores, factores, calificaciones, auditoría y usuarios hasta `total` de cada uno."""
+        nuevos = range(self.sembrados, total)
+        usuarios = User.objects.bulk_create(
+            [User(username=f'usuario{i}', is_staff=bool(i % 2)) for i in nuevos]
+        )
+        emisores = Emisor.objects.bulk_create([
+            Emisor(rut=formatear_rut(10000000 + i), rut_numero=10000000 + i, nombre=f'Emisor {i}')
+            for i in nuevos
+        ])
+        factores = FactorTributario.objects.bulk_create([
+            FactorTributario(codigo=f'FT-{i:03d}', descripcion=f'Factor {i}') for i in nuevos
+        ])
+        Calificacion.objects.bulk_create([
+            Calificacion(emisor=emisor, factor=factor, usuario=usuario, comentario='Comentario')
+            for emisor, factor, usuario in zip(emisores, factores, usuarios)
+        ])
+        HistorialAuditoria.objects.bulk_create([
+            HistorialAuditoria(usuario=usuario, emisor=emisor, factor_nuevo=factor.codigo)
+            for emisor, factor, usuario in zip(emisores, factores, usuarios)
+        ])
+        BitacoraAccesos.objects.bulk_create([BitacoraAccesos(usuario=usuario) for usuario in usuarios])
+        self.sembrados = total
+
+    def datos(self):
+        return {
+            'emisor': Emisor.objects.order_by('id').first(),
+            'factor': FactorTributario.objects.order_by('id').first(),
+            'calificacion': Calificacion.objects.order_by('id').first(),
+            'corredor': self.corredor,
+        }
+
+    def contar_consultas(self, url):
+        # Primera visita para calentar caches (sesión, content types); se mide la segunda
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.get(url)
+        return consultas
+
+    def medir_rutas(self):
+        datos = self.datos()
+        mediciones = {}
+        for patron in rutas_con_nombre():
+            argumentos = ARGUMENTOS_RUTAS.get(patron.name, lambda d: {})(datos)
+            mediciones[patron.name] = self.contar_consultas(reverse(patron.name, kwargs=argumentos))
+        for modelo in ADMIN_LISTADOS:
+            nombre = f'admin:calificaciones_{modelo}_changelist'
+            mediciones[nombre] = self.contar_consultas(reverse(nombre))
+        return mediciones
+
+    def test_todas_las_rutas_con_parametros_tienen_argumentos(self):
+        faltantes = [
+            patron.name for patron in rutas_con_nombre()
+            if patron.pattern.converters and patron.name not in ARGUMENTOS_RUTAS
+        ]
+        self.assertEqual(faltantes, [], 'Agrega estas rutas a ARGUMENTOS_RUTAS')
+
+    @override_settings(CONTEO_EXACTO_MAX=5)
+    def test_paginador_del_admin_cuenta_exacto_solo_hasta_el_limite(self):
+        self.sembrar_hasta(TAMANO_CHICO)
+        self.assertEqual(conteos.PaginadorEstimado(Calificacion.objects.all(), 10).count, TAMANO_CHICO)
+        self.sembrar_hasta(TAMANO_GRANDE)
+        self.assertIsNone(conteos.contar_hasta(Calificacion.objects.all(), 5))
+        # Sin estimación del planificador (SQLite) se termina contando exacto
+        self.assertEqual(conteos.PaginadorEstimado(Calificacion.objects.all(), 10).count, TAMANO_GRANDE)
+
+    @override_settings(CONTEO_EXACTO_MAX=5)
+    def test_conteo_de_tabla_grande_desde_cache_y_tipo_en_la_ui(self):
+        cache.clear()
+        self.sembrar_hasta(TAMANO_GRANDE)
+        conteos.actualizar_exacto(Calificacion)
+        Calificacion.objects.filter(pk=Calificacion.objects.order_by('id').first().pk).delete()
+
+        conteo = conteos.contar(Calificacion.objects.all())
+        self.assertEqual((conteo.valor, conteo.tipo), (TAMANO_GRANDE, conteos.CACHE))
+        # Con filtro no sirve el total guardado
+        filtrado = conteos.contar(Calificacion.objects.filter(comentario='Comentario'))
+        self.assertEqual((filtrado.valor, filtrado.exacto), (TAMANO_GRANDE - 1, True))
+        self.assertContains(self.client.get(reverse('calificacion_list')), f'Total: {TAMANO_GRANDE} registros')
+
+    @override_settings(LISTAS_POR_PAGINA=10)
+    def test_listados_grandes_renderizan_una_pagina(self):
+        self.sembrar_hasta(TAMANO_GRANDE)
+        for ruta, variable in (('calificacion_list', 'calificaciones'), ('lista_auditoria', 'historial')):
+            respuesta = self.client.get(reverse(ruta), {'pagina': 3})
+            self.assertEqual(len(respuesta.context[variable]), 10)
+            self.assertContains(respuesta, 'Página 3 de 3')
+            # Una página fuera de rango muestra la última
+            self.assertEqual(self.client.get(reverse(ruta), {'pagina': 99}).context[variable].number, 3)
+
+    def test_consultas_no_crecen_con_los_datos(self):
+        self.sembrar_hasta(TAMANO_CHICO)
+        chico = self.medir_rutas()
+        self.sembrar_hasta(TAMANO_GRANDE)
+        grande = self.medir_rutas()
+
+        for nombre, consultas in grande.items():
+            with self.subTest(ruta=nombre):
+                if len(consultas) != len(chico[nombre]):
+                    sql = '\n'.join(f"  {q['sql']}" for q in consultas.captured_queries[:40])
+                    self.fail(
+                        f'{nombre}: {len(chico[nombre])} consultas con {TAMANO_CHICO} filas y '
+                        f'{len(consultas)} con {TAMANO_GRANDE}. SQL de la corrida grande:\n{sql}'
+                    )
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class RutTests(TestCase):
+    """Dígito verificador módulo 11, formato canónico y rechazo de RUT inválidos."""
+
+    def test_dv_formato_y_normalizacion(self):
+        self.assertEqual(calcular_dv(12345678), '5')
+        self.assertEqual(calcular_dv(1000005), 'K')
+        self.assertEqual(calcular_dv(1000013), '0')
+        self.assertEqual(formatear_rut(12345678), '12.345.678-5')
+        self.assertEqual(formatear_rut(1000005), '1.000.005-K')
+        for valor in ('12.345.678-5', '12345678-5', '123456785', ' 12.345.678 - 5 ', 123456785):
+            self.assertEqual(validar_rut(valor), 12345678)
+        self.assertEqual(validar_rut('1.000.005-k'), 1000005)
+        self.assertEqual(normalizar_ruts(['12345678-5', 'x', '12345678-5']), [12345678, None, 12345678])
+
+    def test_rechazos(self):
+        for valor in ('12.345.678-6', '1.000.005-0', '123.456.789-2', '12A45678-5', '', None, '5'):
+            with self.assertRaises(RutInvalido, msg=valor):
+                validar_rut(valor)
+
+    def test_emisor_exige_dv_valido_y_guarda_formato_canonico(self):
+        from django.core.exceptions import ValidationError
+
+        emisor = Emisor.objects.create(rut='12345678-5', nombre='Emisor')
+        self.assertEqual((emisor.rut, emisor.rut_numero), ('12.345.678-5', 12345678))
+        with self.assertRaises(RutInvalido):
+            Emisor.objects.create(rut='12.345.679-5', nombre='Otro')
+        with self.assertRaises(ValidationError):
+            Emisor(rut='12.345.679-5', nombre='Otro').full_clean()
+
+    def test_autocompletar_por_prefijo_numerico(self):
+        for numero in (12345678, 1234567, 2345678):
+            Emisor.objects.create(rut=formatear_rut(numero), nombre=f'Emisor {numero}')
+        self.client.force_login(User.objects.create_user('usuario', 'usuario@example.com', 'usuario123'))
+        url = reverse('emisor_autocompletar')
+
+        def buscar(termino):
+            return [r['text'] for r in self.client.get(url, {'q': termino}).json()['results']]
+
+        self.assertEqual(buscar('12345'), ['Emisor 1234567 (1.234.567-4)', 'Emisor 12345678 (12.345.678-5)'])
+        self.assertEqual(buscar('12.345.678'), ['Emisor 12345678 (12.345.678-5)'])
+        self.assertEqual(buscar('2345'), ['Emisor 2345678 (2.345.678-8)'])
+        self.assertEqual(buscar('99'), [])
+
+
+@override_settings(DATABASE_REPLICAS=['replica_prueba'], DB_REPLICA_MAX_LAG=10, DB_REPLICA_LAG_CACHE=3600)
+class RouterReplicaTests(TestCase):
+    """Ruteo de lecturas: réplica solo en vistas marcadas, primaria tras escribir o con retraso alto.
+
+    'replica_prueba' no es una BD real: su retraso se fija en la cache del router, y una
+    lectura que llegara a ella fallaría con ConnectionDoesNotExist.
+    """
+
+    def setUp(self):
+        self.router = db_router.ReplicaRouter()
+        self.fijar_retraso(0)
+
+    def tearDown(self):
+        db_router._retrasos.clear()
+
+    def fijar_retraso(self, segundos):
+        db_router._retrasos['replica_prueba'] = (time.monotonic(), segundos)
+
+    def test_lee_de_la_replica_solo_dentro_de_lectura_en_replica(self):
+        self.assertIsNone(self.router.db_for_read(Emisor))
+        with db_router.lectura_en_replica():
+            self.assertEqual(self.router.db_for_read(Emisor), 'replica_prueba')
+            # Sesiones y usuarios siempre de la primaria
+            self.assertIsNone(self.router.db_for_read(User))
+
+    def test_retraso_sobre_el_maximo_usa_la_primaria(self):
+        self.fijar_retraso(60)
+        with db_router.lectura_en_replica():
+            self.assertEqual(self.router.db_for_read(Emisor), 'default')
+
+    def test_tras_escribir_el_request_lee_de_la_primaria(self):
+        token = db_router.estado_request.set({'primaria': False, 'escribio': False})
+        try:
+            with db_router.lectura_en_replica():
+                self.assertEqual(self.router.db_for_read(Emisor), 'replica_prueba')
+                self.assertEqual(self.router.db_for_write(Emisor), 'default')
+                self.assertEqual(self.router.db_for_read(Emisor), 'default')
+        finally:
+            db_router.estado_request.reset(token)
+
+    def test_request_siguiente_a_una_escritura_queda_en_la_primaria(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin123')
+        self.client.force_login(admin)
+        respuesta = self.client.post(reverse('emisor_create'), {'rut': '76.123.456-0', 'nombre': 'Nuevo'})
+        self.assertIn('nuam_primaria', respuesta.cookies)
+        # Con la cookie, la vista de solo lectura no toca la réplica (inexistente)
+        self.assertEqual(self.client.get(reverse('lista_emisores')).status_code, 200)
+
+
+class CacheListasTests(TestCase):
+    """Las tablas de emisores y factores se sirven de la cache hasta la siguiente escritura."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin123')
+        cls.corredor = User.objects.create_user('corredor', 'corredor@example.com', 'corredor123')
+        cls.emisor = Emisor.objects.create(rut=formatear_rut(10000000), rut_numero=10000000, nombre='Emisor A')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def consultas_emisores(self, url):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(url)
+        return respuesta, [q['sql'] for q in consultas.captured_queries if 'calificaciones_emisor' in q['sql']]
+
+    def test_acierto_no_consulta_emisores(self):
+        url = reverse('lista_emisores')
+        _, primera = self.consultas_emisores(url)
+        respuesta, segunda = self.consultas_emisores(url)
+        self.assertTrue(primera)
+        self.assertEqual(segunda, [])
+        self.assertContains(respuesta, 'Emisor A')
+
+    def test_escritura_invalida_y_rol_separa_la_cache(self):
+        url = reverse('lista_emisores')
+        self.assertContains(self.client.get(url), reverse('emisor_update', args=[self.emisor.pk]))
+
+        Emisor.objects.filter(pk=self.emisor.pk).update(nombre='Emisor B')
+        self.assertContains(self.client.get(url), 'Emisor A')
+        with self.captureOnCommitCallbacks(execute=True):
+            cache_listas.invalidar(cache_listas.EMISORES)
+        self.assertContains(self.client.get(url), 'Emisor B')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.emisor.nombre = 'Emisor C'
+            self.emisor.save()
+        self.client.force_login(self.corredor)
+        respuesta = self.client.get(url)
+        self.assertContains(respuesta, 'Emisor C')
+        self.assertNotContains(respuesta, reverse('emisor_update', args=[self.emisor.pk]))
+
+    def test_invalidacion_al_confirmar(self):
+        antes = cache_listas.generacion(cache_listas.EMISORES)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.emisor.nombre = 'Emisor D'
+            self.emisor.save()
+            # Sin confirmar: un request concurrente aún usa la generación anterior
+            self.assertEqual(cache_listas.generacion(cache_listas.EMISORES), antes)
+        self.assertEqual(cache_listas.generacion(cache_listas.EMISORES), antes)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(cache_listas.generacion(cache_listas.EMISORES), antes)
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class HistorialTemporalTests(TestCase):
+    """Versiones de calificaciones: consultas a una fecha y protección del emisor."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin123')
+        cls.emisor = Emisor.objects.create(rut=formatear_rut(50000000), nombre='Emisor H')
+        cls.factor = FactorTributario.objects.create(codigo='FT-H', descripcion='Factor')
+
+    def test_emisor_con_historial_solo_se_da_de_baja(self):
+        from django.db.models import ProtectedError
+
+        calificacion = Calificacion.objects.create(emisor=self.emisor, factor=self.factor, usuario=self.admin)
+        Calificacion.objects.filter(pk=calificacion.pk).delete()
+        with self.assertRaises(ProtectedError):
+            Emisor.objects.get(pk=self.emisor.pk).delete()
+
+        self.client.force_login(self.admin)
+        self.client.post(reverse('emisor_delete', args=[self.emisor.pk]))
+        self.emisor.refresh_from_db()
+        self.assertFalse(self.emisor.activo)
+        self.assertTrue(CalificacionVersion.objects.filter(emisor=self.emisor).exists())
+
+    def test_cambio_de_emisor_mueve_la_version(self):
+        otro = Emisor.objects.create(rut=formatear_rut(50000001), nombre='Emisor H2')
+        calificacion = Calificacion.objects.create(emisor=self.emisor, factor=self.factor, usuario=self.admin)
+        antes = timezone.now()
+        calificacion.emisor = otro
+        calificacion.save()
+
+        ahora = timezone.now()
+        self.assertFalse(CalificacionVersion.objects.as_of(ahora).filter(emisor=self.emisor).exists())
+        self.assertEqual(CalificacionVersion.objects.as_of(ahora).get(emisor=otro).calificacion_id, calificacion.pk)
+        self.assertTrue(CalificacionVersion.objects.as_of(antes).filter(emisor=self.emisor).exists())
+        self.assertFalse(CalificacionVersion.objects.as_of(antes).filter(emisor=otro).exists())
+
+    def test_consulta_a_una_fecha(self):
+        from .versiones import cerrar_versiones
+
+        calificacion = Calificacion.objects.create(emisor=self.emisor, factor=self.factor, usuario=self.admin,
+                                                   comentario='v1')
+        calificacion.comentario = 'v2'
+        calificacion.save()
+        calificacion.save()  # sin cambios: no abre otra versión
+        primera, segunda = CalificacionVersion.objects.filter(calificacion_id=calificacion.pk).order_by('valido_desde')
+        self.assertEqual(primera.valido_hasta, segunda.valido_desde)
+        cerrar_versiones(Calificacion.objects.filter(pk=calificacion.pk))
+        Calificacion.objects.filter(pk=calificacion.pk).delete()
+        segunda.refresh_from_db()
+
+        def vigentes(fecha):
+            return list(CalificacionVersion.objects.as_of(fecha).values_list('comentario', flat=True))
+
+        micro = timedelta(microseconds=1)
+        self.assertEqual(vigentes(primera.valido_desde - micro), [])
+        self.assertEqual(vigentes(primera.valido_desde), ['v1'])
+        self.assertEqual(vigentes(segunda.valido_desde - micro), ['v1'])
+        self.assertEqual(vigentes(segunda.valido_desde), ['v2'])
+        self.assertEqual(vigentes(segunda.valido_hasta), [])
+
+        self.client.force_login(self.admin)
+        url = reverse('api_calificaciones_vigentes')
+        respuesta = self.client.get(url, {'fecha': primera.valido_desde.isoformat(), 'emisor': self.emisor.pk})
+        self.assertEqual([fila['comentario'] for fila in respuesta.json()['resultados']], ['v1'])
+        manana = (timezone.localdate() + timedelta(days=1)).isoformat()
+        self.assertEqual(self.client.get(url, {'fecha': manana}).json()['resultados'], [])
+        self.assertEqual(self.client.get(url, {'fecha': 'ayer'}).status_code, 400)
+
+    def test_borrados_del_admin_cierran_versiones_y_dejan_evento(self):
+        una, dos, tres = (
+            Calificacion.objects.create(emisor=emisor, factor=self.factor, usuario=self.admin)
+            for emisor in [self.emisor] + [
+                Emisor.objects.create(rut=formatear_rut(50000000 + i), nombre=f'Emisor H{i}') for i in (2, 3)
+            ]
+        )
+        self.client.force_login(self.admin)
+
+        self.client.post(reverse('admin:calificaciones_calificacion_delete', args=[una.pk]), {'post': 'yes'})
+        self.client.post(reverse('admin:calificaciones_calificacion_changelist'), {
+            'action': 'delete_selected', 'post': 'yes', '_selected_action': [dos.pk, tres.pk],
+        })
+
+        ids = [una.pk, dos.pk, tres.pk]
+        self.assertFalse(Calificacion.objects.filter(pk__in=ids).exists())
+        self.assertFalse(CalificacionVersion.objects.filter(calificacion_id__in=ids, valido_hasta__isnull=True).exists())
+        eventos = EventoOutbox.objects.filter(entidad=outbox.CALIFICACION, operacion='ELIMINAR').order_by('id')
+        self.assertEqual([sorted(e.ids) for e in eventos], [[una.pk], sorted([dos.pk, tres.pk])])
+
+@override_settings(DATABASE_REPLICAS=[])
+class OperacionesMasivasTests(TestCase):
+    """Reasignar por filtro deja a lo más una fila por emisor en el factor destino."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('usuario', 'usuario@example.com', 'usuario123')
+        cls.emisores = [Emisor.objects.create(rut=formatear_rut(60000000 + i), nombre=f'Emisor {i}') for i in range(2)]
+        cls.f1, cls.f2, cls.f3 = [
+            FactorTributario.objects.create(codigo=f'FT-R{i}', descripcion=f'Factor {i}') for i in range(1, 4)
+        ]
+        for factor in (cls.f1, cls.f2):
+            Calificacion.objects.create(emisor=cls.emisores[0], factor=factor, usuario=cls.usuario)
+        # El segundo emisor ya tiene el factor destino
+        for factor in (cls.f1, cls.f3):
+            Calificacion.objects.create(emisor=cls.emisores[1], factor=factor, usuario=cls.usuario)
+
+    def test_reasignar_varias_filas_de_un_emisor_al_mismo_factor(self):
+        from .operaciones import crear, simular
+
+        filtro = {'emisores': [self.emisores[0].id]}
+        self.assertEqual(simular('REASIGNAR', filtro, self.f3.id), {'total': 2, 'omitidas': 1})
+        operacion, _ = crear('REASIGNAR', filtro, self.usuario, self.f3.id)
+        self.assertEqual((operacion.estado, operacion.afectadas, operacion.omitidas), ('TERMINADA', 1, 1), operacion.error)
+        self.assertEqual(
+            sorted(Calificacion.objects.filter(emisor=self.emisores[0]).values_list('factor__codigo', flat=True)),
+            ['FT-R2', 'FT-R3'],
+        )
+        movida = Calificacion.objects.get(emisor=self.emisores[0], factor=self.f3)
+        self.assertEqual(EventoOutbox.objects.filter(datos__operacion_masiva=operacion.id).get().ids, [movida.pk])
+
+        filtro = {'factor': self.f1.id}
+        self.assertEqual(simular('REASIGNAR', filtro, self.f3.id), {'total': 1, 'omitidas': 1})
+        operacion, _ = crear('REASIGNAR', filtro, self.usuario, self.f3.id)
+        self.assertEqual((operacion.estado, operacion.afectadas, operacion.omitidas), ('TERMINADA', 0, 1))
+
+
+@override_settings(DATABASE_REPLICAS=[], PERFIL_HISTORIAL_EVENTOS=2)
+class PerfilEmisorTests(TestCase):
+    """El perfil sale de una consulta, se sirve de la cache y se invalida al calificar."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('usuario', 'usuario@example.com', 'usuario123')
+        cls.emisor = Emisor.objects.create(rut=formatear_rut(40000000), rut_numero=40000000, nombre='Emisor P')
+        cls.factores = [
+            FactorTributario.objects.create(codigo=f'FT-P{i}', descripcion=f'Factor {i}') for i in range(3)
+        ]
+        for factor in cls.factores[:2]:
+            Calificacion.objects.create(emisor=cls.emisor, factor=factor, usuario=cls.usuario)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_una_consulta_cache_e_invalidacion(self):
+        with self.assertNumQueries(1):
+            datos = perfiles.perfil(self.emisor.pk)
+        self.assertEqual([c['factor'] for c in datos['calificaciones']], ['FT-P0', 'FT-P1'])
+        self.assertEqual(datos['calificaciones'][0]['usuario'], 'usuario')
+        self.assertEqual(len(datos['historial']), 2)
+        with self.assertNumQueries(0):
+            self.assertEqual(perfiles.perfil(self.emisor.pk), datos)
+        self.assertEqual(perfiles._consultar_orm(self.emisor.pk, 2), datos)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Calificacion.objects.create(emisor=self.emisor, factor=self.factores[2], usuario=self.usuario)
+        self.assertEqual(len(perfiles.perfil(self.emisor.pk)['calificaciones']), 3)
+
+        self.client.force_login(self.usuario)
+        respuesta = self.client.get(reverse('perfil_emisor', args=[self.emisor.pk]))
+        self.assertEqual(respuesta.json()['nombre'], 'Emisor P')
+        self.assertEqual(self.client.get(reverse('perfil_emisor', args=[0])).status_code, 404)
+
+    def test_historial_solo_para_analistas(self):
+        # Primero el analista, para que su perfil (con historial) quede en la cache
+        analista = User.objects.create_user('analista', 'analista@example.com', 'analista123', is_staff=True)
+        self.client.force_login(analista)
+        self.assertEqual(len(self.client.get(reverse('perfil_emisor', args=[self.emisor.pk])).json()['historial']), 2)
+
+        self.client.force_login(self.usuario)
+        datos = self.client.get(reverse('perfil_emisor', args=[self.emisor.pk])).json()
+        self.assertNotIn('historial', datos)
+        self.assertEqual(len(datos['calificaciones']), 2)
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class RolesTests(TestCase):
+    """Los grupos se leen una vez por sesión y se vuelven a leer al cambiar."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('usuario', 'usuario@example.com', 'usuario123')
+        cls.analistas = Group.objects.create(name=roles.GRUPO_ANALISTA)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.usuario)
+
+    def consultas_grupos(self, url):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(url)
+        return respuesta, [q['sql'] for q in consultas.captured_queries if 'auth_user_groups' in q['sql']]
+
+    def test_grupo_analista_se_cachea_en_sesion_e_invalida(self):
+        url = reverse('lista_auditoria')
+        respuesta, grupos = self.consultas_grupos(url)
+        self.assertEqual(respuesta.status_code, 403)
+        self.assertEqual(len(grupos), 1)
+        self.assertEqual(self.consultas_grupos(url)[1], [])
+
+        self.usuario.groups.add(self.analistas)
+        respuesta, grupos = self.consultas_grupos(url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(len(grupos), 1)
+        self.assertContains(respuesta, 'Analista')
+
+        self.analistas.user_set.remove(self.usuario)
+        self.assertEqual(self.consultas_grupos(url)[0].status_code, 403)
+
+    def test_grupos_en_sesion_vencen_sin_aviso_de_la_cache(self):
+        from unittest import mock
+
+        url = reverse('lista_auditoria')
+        self.usuario.groups.add(self.analistas)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        # Revocación hecha en otro proceso: el aviso no llega a esta cache
+        with mock.patch.object(roles, 'invalidar'):
+            self.analistas.user_set.remove(self.usuario)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        with mock.patch.object(roles.time, 'time', return_value=time.time() + settings.ROLES_SESION_SEGUNDOS + 1):
+            respuesta, grupos = self.consultas_grupos(url)
+        self.assertEqual(respuesta.status_code, 403)
+        self.assertEqual(len(grupos), 1)
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class SnapshotTests(TestCase):
+    """Cada snapshot va a su directorio y se publica de una vez con el manifest."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin123')
+        emisor = Emisor.objects.create(rut=formatear_rut(60000000), nombre='Emisor')
+        factor = FactorTributario.objects.create(codigo='FT-S', descripcion='Factor')
+        cls.calificacion = Calificacion.objects.create(emisor=emisor, factor=factor, usuario=cls.admin)
+
+    def setUp(self):
+        directorio = tempfile.mkdtemp(prefix='nuam-tests-snapshot-')
+        self.addCleanup(shutil.rmtree, directorio, ignore_errors=True)
+        self.enterContext(override_settings(SNAPSHOT_DIR=directorio))
+        self.directorio = snapshot.directorio_snapshot()
+
+    def test_publicacion_por_manifest_y_snapshots_anteriores_legibles(self):
+        self.client.force_login(self.admin)
+        primero = self.client.post(reverse('snapshot_calificaciones')).json()
+        url_anterior = primero['columnas']['id']['url']
+        Calificacion.objects.create(emisor=self.calificacion.emisor,
+                                    factor=FactorTributario.objects.create(codigo='FT-S2', descripcion='Otro'),
+                                    usuario=self.admin)
+        for _ in range(snapshot.VERSIONES_CONSERVADAS):
+            vigente = snapshot.generar_snapshot()
+
+        self.assertEqual(snapshot.leer_manifest(), vigente)
+        ids = snapshot.leer_npy(self.directorio / vigente['columnas']['id']['archivo'], 'q')
+        self.assertEqual(len(ids), 2)
+        self.assertEqual(len(snapshot.snapshots()), snapshot.VERSIONES_CONSERVADAS)
+        # El primero ya se descartó; el anterior al vigente sigue disponible
+        self.assertEqual(self.client.get(url_anterior).status_code, 404)
+        anterior = snapshot.snapshots()[-2]
+        respuesta = self.client.get(reverse('snapshot_columna', args=[anterior, 'id']))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(self.client.get(reverse('snapshot_columna', args=['..', 'id'])).status_code, 404)
+
+    def test_incremental_igual_a_completo(self):
+        emisor = self.calificacion.emisor
+        factores = [FactorTributario.objects.create(codigo=f'FT-I{i}', descripcion='F') for i in range(6)]
+        filas = [Calificacion.objects.create(emisor=emisor, factor=f, usuario=self.admin) for f in factores[:4]]
+        Calificacion.objects.update(fecha_modificacion=timezone.now() - timedelta(days=1))
+        self.assertEqual(snapshot.generar_snapshot(completo=True)['modo'], 'completo')
+
+        Calificacion.objects.create(emisor=emisor, factor=factores[4], usuario=self.admin)
+        filas[1].factor = factores[5]
+        filas[1].save()
+        self.client.force_login(self.admin)
+        for fila in (filas[0], filas[2]):
+            self.client.post(reverse('calificacion_delete', args=[fila.pk]))
+
+        manifest = snapshot.generar_snapshot()
+        self.assertEqual(manifest['modo'], 'incremental')
+        esperado = snapshot._completo()
+        for nombre, (_, typecode) in snapshot.COLUMNAS.items():
+            columna = snapshot.leer_npy(self.directorio / manifest['columnas'][nombre]['archivo'], typecode)
+            self.assertEqual(columna, esperado[nombre], nombre)
+        self.assertEqual(manifest['filas'], 4)
+
+
+class OutboxTests(TestCase):
+    """Las escrituras dejan eventos en el outbox y el feed los entrega por token."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin123')
+        cls.factor = FactorTributario.objects.create(codigo='FT-OB', descripcion='Factor')
+        cls.emisores = Emisor.objects.bulk_create([
+            Emisor(rut=formatear_rut(20000000 + i), rut_numero=20000000 + i, nombre=f'Emisor {i}')
+            for i in range(3)
+        ])
+
+    def test_carga_masiva_deja_un_evento_por_lote(self):
+        from .importacion import procesar_csv_calificaciones
+
+        inicio = outbox.leer_cambios()['siguiente']
+        contenido = 'RUT,Código Factor,Comentario\n' + ''.join(f'{e.rut},FT-OB,c\n' for e in self.emisores)
+        procesar_csv_calificaciones(io.BytesIO(contenido.encode()), self.admin, chunk_size=2)
+
+        cambios = outbox.leer_cambios(inicio)
+        self.assertEqual([len(e['ids']) for e in cambios['eventos']], [2, 1])
+        self.assertEqual(
+            sorted(i for e in cambios['eventos'] for i in e['ids']),
+            sorted(Calificacion.objects.values_list('pk', flat=True)),
+        )
+        self.assertEqual(outbox.leer_cambios(cambios['siguiente'])['eventos'], [])
+
+    def test_lote_solo_registra_sus_propias_filas(self):
+        from .importacion import procesar_csv_calificaciones
+
+        # Fila escrita "a la vez" por otra vía, con fecha_modificacion posterior al inicio de la carga
+        otro = Emisor.objects.create(rut=formatear_rut(20000099), nombre='Otro')
+        ajena = Calificacion.objects.create(emisor=otro, factor=self.factor, usuario=self.admin)
+        Calificacion.objects.filter(pk=ajena.pk).update(fecha_modificacion=timezone.now() + timedelta(hours=1))
+        versiones = CalificacionVersion.objects.count()
+
+        inicio = outbox.leer_cambios()['siguiente']
+        for modo in ('insertar', 'actualizar'):
+            contenido = 'RUT,Código Factor,Comentario\n' + ''.join(f'{e.rut},FT-OB,{modo}\n' for e in self.emisores)
+            procesar_csv_calificaciones(io.BytesIO(contenido.encode()), self.admin, chunk_size=2, modo=modo)
+
+        ids = [i for e in outbox.leer_cambios(inicio, limite=100)['eventos'] for i in e['ids']]
+        propias = sorted(Calificacion.objects.exclude(pk=ajena.pk).values_list('pk', flat=True))
+        self.assertEqual(sorted(ids), sorted(propias * 2))
+        # Una versión al crear y otra al cambiar el comentario, solo para las filas de la carga
+        self.assertEqual(CalificacionVersion.objects.count() - versiones, 2 * len(propias))
+
+    def test_evento_confirmado_tarde_no_se_salta(self):
+        from django.db.models import Max
+
+        inicio = outbox.leer_cambios()['siguiente']
+        tarde = outbox.registrar(outbox.EMISOR, 'ACTUALIZAR', [1])
+        temprano = outbox.registrar(outbox.EMISOR, 'ACTUALIZAR', [2])
+        # Publicación mientras la transacción de `tarde` (id menor) aún no se confirmaba
+        ultima = EventoOutbox.objects.aggregate(ultima=Max('posicion'))['ultima'] or 0
+        EventoOutbox.objects.filter(pk=temprano.pk).update(posicion=ultima + 1)
+
+        primera = outbox.leer_cambios(inicio)
+        self.assertEqual([e['ids'] for e in primera['eventos']], [[2], [1]])
+        self.assertEqual(outbox.leer_cambios(primera['siguiente'])['eventos'], [])
+        segunda = outbox.leer_cambios(str(ultima + 1))
+        self.assertEqual([e['ids'] for e in segunda['eventos']], [[1]])
+        self.assertGreater(int(segunda['siguiente']), ultima + 1)
+        self.assertLess(tarde.pk, temprano.pk)
+
+    def test_feed_por_token(self):
+        self.client.force_login(self.admin)
+        FactorTributario.objects.create(codigo='FT-OB2', descripcion='Otro')
+        primera = self.client.get(reverse('feed_cambios'), {'limite': 1}).json()
+        self.assertTrue(primera['hay_mas'])
+        segunda = self.client.get(reverse('feed_cambios'), {'desde': primera['siguiente']}).json()
+        self.assertEqual([e['operacion'] for e in primera['eventos'] + segunda['eventos']],
+                         list(EventoOutbox.objects.values_list('operacion', flat=True)))
+        self.assertEqual(self.client.get(reverse('feed_cambios'), {'desde': 'x'}).status_code, 400)
+
+
+@override_settings(SSE_COLA_MAXIMA=2)
+class NotificacionesTests(TestCase):
+    """Pub/sub en proceso: publicación desde otros hilos y colas acotadas por cliente."""
+
+    def test_publicar_desde_otro_hilo_y_descartar_antiguos(self):
+        async def escenario():
+            suscripcion = notificaciones.suscribir(['prueba'])
+            try:
+                for i in range(3):
+                    hilo = threading.Thread(target=notificaciones.publicar, args=('prueba', 'cambio', {'i': i}))
+                    hilo.start()
+                    hilo.join()
+                await asyncio.sleep(0.05)
+                recibidos = [suscripcion.cola.get_nowait() for _ in range(suscripcion.cola.qsize())]
+                return recibidos, suscripcion.perdidos
+            finally:
+                notificaciones.desuscribir(suscripcion)
+
+        recibidos, perdidos = asyncio.run(escenario())
+        self.assertEqual(recibidos, [('cambio', '{"i": 1}'), ('cambio', '{"i": 2}')])
+        self.assertEqual(perdidos, 1)
+        self.assertEqual(notificaciones.suscriptores('prueba'), 0)
+
+    def test_eventos_sin_sesion_responde_403(self):
+        enviados = []
+
+        async def send(mensaje):
+            enviados.append(mensaje)
+
+        async def receive():
+            return {'type': 'http.disconnect'}
+
+        asyncio.run(sse.aplicacion_eventos({'type': 'http', 'path': reverse('eventos'), 'headers': []}, receive, send))
+        self.assertEqual(enviados[0]['status'], 403)
+
+
+@override_settings(CARGAS_MAX_CONCURRENTES=2, CARGAS_CAPACIDAD_BD=10, CARGAS_RESERVA_INTERACTIVA=8,
+                   CARGAS_FILAS_POR_SEGUNDO=100, CARGAS_INTERVALO_SEGUNDOS=0)
+class ColaCargasTests(TestCase):
+    """Tope de cargas simultáneas, equidad entre usuarios, archivos chicos primero y espera estimada."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ana = User.objects.create_user('ana', 'ana@example.com', 'ana123')
+        cls.beto = User.objects.create_user('beto', 'beto@example.com', 'beto123')
+
+    def carga(self, usuario, filas, estado='EN_COLA', hace=0):
+        carga = CargaMasiva.objects.create(usuario=usuario, filas_estimadas=filas, estado=estado,
+                                           fecha_latido=timezone.now())
+        CargaMasiva.objects.filter(pk=carga.pk).update(fecha=timezone.now() - timedelta(seconds=hace))
+        return carga
+
+    def test_admision_equitativa_y_chicos_primero(self):
+        self.carga(self.ana, 500, estado='EN_CURSO')
+        ana_chica = self.carga(self.ana, 10)
+        beto_grande = self.carga(self.beto, 1000)
+        beto_chica = self.carga(self.beto, 100)
+
+        # Ana ya ocupa un turno: el libre es para Beto, y de Beto primero su archivo chico
+        self.assertEqual(cola_cargas.estado_cola(ana_chica)['posicion'], 2)
+        cola_cargas._admitir()
+        self.assertEqual(CargaMasiva.objects.filter(estado='EN_CURSO').count(), 2)
+        self.assertEqual(cola_cargas.estado_cola(beto_chica)['estado'], 'EN_CURSO')
+
+        estado = cola_cargas.estado_cola(ana_chica)
+        self.assertEqual(estado['posicion'], 1)
+        # 500 + 100 filas en curso por delante, a 100 filas/s por turno con 2 turnos
+        self.assertEqual(estado['espera_estimada'], 3)
+        self.assertEqual(cola_cargas.estado_cola(beto_grande)['posicion'], 2)
+
+    @override_settings(CARGAS_ENVEJECIMIENTO_SEGUNDOS=60)
+    def test_carga_que_espera_demasiado_pasa_adelante(self):
+        grande = self.carga(self.ana, 1000, hace=120)
+        self.carga(self.beto, 10)
+        self.assertEqual(cola_cargas.estado_cola(grande)['posicion'], 1)
+
+    def test_turno_libera_cargas_sin_latido_y_termina(self):
+        for usuario in (self.ana, self.beto):
+            muerta = self.carga(usuario, 100, estado='EN_CURSO')
+            CargaMasiva.objects.filter(pk=muerta.pk).update(fecha_latido=timezone.now() - timedelta(hours=1))
+
+        with cola_cargas.turno(self.ana, 'datos.csv', 1000, filas=10) as carga:
+            self.assertEqual(cola_cargas.estado_cola(carga)['estado'], 'EN_CURSO')
+            cola_cargas.avanzar(carga, 10, 0)
+        carga.refresh_from_db()
+        self.assertEqual((carga.estado, carga.registros_procesados), ('TERMINADA', 10))
+        self.assertEqual(CargaMasiva.objects.filter(estado='FALLIDA').count(), 2)
+
+        self.client.force_login(self.ana)
+        self.assertEqual(self.client.get(reverse('cola_cargas_estado')).status_code, 403)
+
+    def test_lote_de_carga_dada_por_muerta_se_revierte(self):
+        from .importacion import procesar_csv_calificaciones
+
+        emisor = Emisor.objects.create(rut=formatear_rut(40000000), nombre='Emisor')
+        FactorTributario.objects.create(codigo='FT-COLA', descripcion='Factor')
+        archivo = io.BytesIO(f'RUT,Código Factor,Comentario\n{emisor.rut},FT-COLA,x\n'.encode())
+
+        with self.assertRaises(cola_cargas.TurnoPerdido):
+            with cola_cargas.turno(self.ana, 'datos.csv', 100, filas=1) as carga:
+                # Otro proceso la dio por muerta mientras se preparaba el primer lote
+                CargaMasiva.objects.filter(pk=carga.pk).update(estado='FALLIDA')
+                procesar_csv_calificaciones(archivo, self.ana, al_avanzar=lambda avance: cola_cargas.avanzar(
+                    carga, avance['procesadas'], avance['errores']))
+        self.assertFalse(Calificacion.objects.exists())
+        self.assertFalse(EventoOutbox.objects.filter(entidad=outbox.CALIFICACION).exists())
+
+
+@override_settings(MEDIA_ROOT=tempfile.gettempdir() + '/nuam-tests-media', DATABASE_REPLICAS=[])
+class ReporteErroresTests(TestCase):
+    """Las filas rechazadas de una carga van a un CSV descargable, no a mensajes de sesión."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin123')
+        cls.otro = User.objects.create_user('otro', 'otro@example.com', 'otro123')
+        cls.emisor = Emisor.objects.create(rut=formatear_rut(30000000), nombre='Emisor')
+        FactorTributario.objects.create(codigo='FT-ERR', descripcion='Factor')
+
+    def test_carga_con_errores_deja_reporte_completo(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        malas = 150
+        contenido = 'RUT,Código Factor,Comentario\n' + f'{self.emisor.rut},FT-ERR,ok\n'
+        contenido += ''.join(f'{self.emisor.rut},FT-NO{i},x\n' for i in range(malas))
+        self.client.force_login(self.admin)
+        respuesta = self.client.post(reverse('carga_masiva_calificaciones'), {
+            'archivo': SimpleUploadedFile('carga.csv', contenido.encode()), 'modo': 'insertar',
+        }, follow=True)
+
+        avisos = [str(m) for m in respuesta.context['messages'] if m.level_tag == 'warning']
+        self.assertEqual(len(avisos), 1)
+        self.assertIn(f'{malas} filas con errores', avisos[0])
+        carga = CargaMasiva.objects.get()
+        self.assertEqual((carga.estado, carga.registros_erroneos), ('TERMINADA', malas))
+
+        descarga = self.client.get(reverse('carga_errores', args=[carga.pk]))
+        lineas = b''.join(descarga.streaming_content).decode().splitlines()
+        self.assertEqual(len(lineas), malas + 1)
+        self.assertEqual(lineas[1], '3,Factor FT-NO0 no encontrado')
+
+        self.client.force_login(self.otro)
+        self.assertEqual(self.client.get(reverse('carga_errores', args=[carga.pk])).status_code, 403)
+
+
+def _validar_por_fila(filas, emisores_map, factores_map, existentes):
+    """Validación fila a fila de los importadores anteriores a `validar_lote`, como referencia."""
+    nuevas, errores = [], []
+    for numero, rut, codigo, comentario in filas:
+        try:
+            rut_numero = validar_rut(rut)
+        except RutInvalido:
+            errores.append({'fila': numero, 'mensaje': f"RUT {str(rut).strip()} inválido"})
+            continue
+        emisor_id = emisores_map.get(rut_numero)
+        if not emisor_id:
+            errores.append({'fila': numero, 'mensaje': f"Emisor con RUT {str(rut).strip()} no encontrado"})
+            continue
+        factor_id = factores_map.get(codigo)
+        if not factor_id:
+            errores.append({'fila': numero, 'mensaje': f"Factor {codigo} no encontrado"})
+            continue
+        if (emisor_id, factor_id) in existentes:
+            continue
+        existentes.add((emisor_id, factor_id))
+        nuevas.append((emisor_id, factor_id, comentario))
+    return nuevas, errores
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class ImportacionTests(TestCase):
+    """Validación por lotes, lectura de XLSX y modo upsert de las cargas masivas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin123')
+        cls.emisores = [Emisor.objects.create(rut=formatear_rut(n), nombre=f'E{n}') for n in (70000000, 70000001)]
+        cls.factores = [FactorTributario.objects.create(codigo=c, descripcion=c) for c in ('FT-A', 'FT-B')]
+        Calificacion.objects.create(emisor=cls.emisores[0], factor=cls.factores[0], usuario=cls.admin,
+                                    comentario='igual')
+        Calificacion.objects.create(emisor=cls.emisores[1], factor=cls.factores[0], usuario=cls.admin,
+                                    comentario='antes')
+
+    def csv(self, filas):
+        contenido = 'RUT,Código Factor,Comentario\n' + ''.join(f'{r},{c},{m}\n' for r, c, m in filas)
+        return io.BytesIO(contenido.encode())
+
+    def test_validar_lote_mismos_mensajes_que_por_fila(self):
+        from .importacion import en_lotes, maps_emisores_factores, validar_lote
+
+        rut_a, rut_b = self.emisores[0].rut, '70000001' + calcular_dv(70000001)
+        filas = [
+            (2, rut_a, 'FT-B', 'nueva'),
+            (3, 'abc', 'FT-A', ''),
+            (4, '70000000-0', 'FT-A', ''),  # DV incorrecto
+            (5, formatear_rut(1234567), 'FT-A', ''),  # RUT válido sin emisor
+            (6, rut_b, 'FT-X', ''),
+            (7, rut_b.replace('-', ''), 'FT-B', 'primera'),
+            (8, rut_b, 'FT-B', 'repetida'),
+            (9, 70000000.0, 'FT-A', 'ya existe'),
+            (10, ' 7.000.000-1 ', 'FT-B', ''),
+        ]
+        emisores_map, factores_map = maps_emisores_factores()
+        esperado = _validar_por_fila(filas, emisores_map, factores_map,
+                                     set(Calificacion.objects.values_list('emisor_id', 'factor_id')))
+
+        for tamano in (len(filas), 3, 1):
+            existentes = set(Calificacion.objects.values_list('emisor_id', 'factor_id'))
+            nuevas, errores, total = [], [], 0
+            for lote in en_lotes(filas, tamano):
+                n, e, t = validar_lote(*map(list, zip(*lote)), emisores_map, factores_map, existentes, 100)
+                nuevas += n
+                errores += e
+                total += t
+            self.assertEqual((nuevas, errores, total), (*esperado, len(esperado[1])))
+
+        # El cupo corta la lista de errores pero no el total
+        _, errores, total = validar_lote(*map(list, zip(*filas)), emisores_map, factores_map, set(), 2)
+        self.assertEqual((errores, total), (esperado[1][:2], len(esperado[1])))
+
+    def xlsx(self, filas):
+        import openpyxl
+
+        libro = openpyxl.Workbook()
+        hoja = libro.active
+        for numero, valores in filas.items():
+            for columna, valor in enumerate(valores, start=1):
+                hoja.cell(row=numero, column=columna, value=valor)
+        archivo = io.BytesIO()
+        libro.save(archivo)
+        archivo.seek(0)
+        return archivo
+
+    def test_lector_xlsx_en_streaming_igual_a_openpyxl(self):
+        from .xlsx import leer_filas_xlsx
+
+        archivo = self.xlsx({
+            1: ['RUT', 'Código Factor', 'Comentario'],
+            2: [self.emisores[0].rut, 'FT-A', 'texto con ñ'],
+            3: [70000001, 'FT-B', None],
+            # fila 4 vacía
+            5: [None, 'FT-A', 1.5, None, True],
+            6: ['x' * 300, '', 'igual'],
+            7: ['x' * 300, 'FT-B', 'igual'],
+        })
+        for desde in (1, 2, 4):
+            archivo.seek(0)
+            stream = list(leer_filas_xlsx(archivo, desde, backend='stream'))
+            archivo.seek(0)
+            self.assertEqual(stream, list(leer_filas_xlsx(archivo, desde, backend='openpyxl')))
+        self.assertEqual(stream[0], (None,) * 5)
+
+    def test_lector_xlsx_pasa_a_openpyxl_a_mitad_de_hoja(self):
+        from unittest import mock
+
+        from . import xlsx
+
+        archivo = self.xlsx({numero: [f'r{numero}', numero] for numero in range(1, 7)})
+        original = xlsx._filas_stream
+
+        def falla_tras_dos_filas(archivo, desde_fila):
+            filas = original(archivo, desde_fila)
+            yield next(filas)
+            yield next(filas)
+            raise xlsx.XlsxNoSoportado('celda no soportada')
+
+        with mock.patch.object(xlsx, '_filas_stream', falla_tras_dos_filas):
+            filas = list(xlsx.leer_filas_xlsx(archivo, desde_fila=2, backend='stream'))
+        self.assertEqual(filas, [(f'r{numero}', numero) for numero in range(2, 7)])
+
+    def test_upsert_cuenta_creadas_actualizadas_y_sin_cambios(self):
+        from .importacion import MODO_ACTUALIZAR, procesar_csv_calificaciones
+
+        rut_a, rut_b = self.emisores[0].rut, self.emisores[1].rut
+        archivo = self.csv([
+            (rut_a, 'FT-A', 'igual'),      # sin cambios
+            (rut_b, 'FT-A', 'despues'),    # actualizada
+            (rut_a, 'FT-B', 'nueva'),      # creada
+            (rut_a, 'FT-B', 'repetida'),   # repetida en el archivo: se ignora
+            (rut_b, 'FT-X', ''),           # error
+        ])
+        ediciones = HistorialAuditoria.objects.filter(accion='EDITAR').count()
+        resultado = procesar_csv_calificaciones(archivo, self.admin, chunk_size=2, modo=MODO_ACTUALIZAR)
+
+        self.assertEqual(
+            (resultado['creadas'], resultado['actualizadas'], resultado['sin_cambios'], resultado['errores_totales']),
+            (1, 1, 1, 1),
+        )
+        comentarios = dict(Calificacion.objects.values_list('factor__codigo', 'comentario').filter(
+            emisor=self.emisores[0]))
+        self.assertEqual(comentarios, {'FT-A': 'igual', 'FT-B': 'nueva'})
+        self.assertEqual(Calificacion.objects.get(emisor=self.emisores[1]).comentario, 'despues')
+        self.assertEqual(HistorialAuditoria.objects.filter(accion='EDITAR').count(), ediciones + 1)
+        versiones = CalificacionVersion.objects.filter(emisor=self.emisores[1]).order_by('valido_desde')
+        self.assertEqual([(v.comentario, v.valido_hasta is None) for v in versiones],
+                         [('antes', False), ('despues', True)])
+
+        # Repetir la carga no cambia nada
+        archivo.seek(0)
+        resultado = procesar_csv_calificaciones(archivo, self.admin, modo=MODO_ACTUALIZAR)
+        self.assertEqual((resultado['creadas'], resultado['actualizadas'], resultado['sin_cambios']), (0, 0, 3))
+
+    def test_emisor_dado_de_baja_no_recibe_cargas(self):
+        from .importacion import procesar_csv_calificaciones
+        from .operaciones import cambiar_estado_emisores
+
+        rut_a = self.emisores[0].rut
+        self.assertEqual(cambiar_estado_emisores([rut_a, rut_a.replace('.', ''), '1-9', 'abc'], False),
+                         {'actualizados': 1, 'sin_cambios': 0, 'no_encontrados': ['abc', '1-9']})
+        self.assertEqual(cambiar_estado_emisores([rut_a], False)['sin_cambios'], 1)
+
+        resultado = procesar_csv_calificaciones(self.csv([(rut_a, 'FT-B', '')]), self.admin)
+        self.assertEqual(resultado['creadas'], 0)
+        self.assertEqual(resultado['errores'], [{'fila': 2, 'mensaje': f'Emisor con RUT {rut_a} no encontrado'}])
+
+
+@override_settings(SUBIDAS_DIR=tempfile.gettempdir() + '/nuam-tests-subidas', CARGA_MASIVA_MAX_MB=1)
+class SubidaReanudableTests(TestCase):
+    """Subidas por bloques: offset esperado, tope declarado y límite de tamaño."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ana = User.objects.create_user('ana', 'ana@example.com', 'ana123')
+
+    def test_bloques_en_orden_y_dentro_del_tamano(self):
+        from .subidas import SubidaInvalida, SubidaReanudable
+
+        with self.assertRaises(SubidaInvalida):
+            SubidaReanudable.crear(self.ana, 'carga.csv', 2 * 1024 * 1024)
+        with self.assertRaises(SubidaInvalida):
+            SubidaReanudable.crear(self.ana, 'carga.exe', 10)
+
+        subida = SubidaReanudable.crear(self.ana, '../carga.csv', 10)
+        self.addCleanup(subida.eliminar)
+        self.assertEqual(subida.meta['nombre'], 'carga.csv')
+        self.assertEqual(subida.agregar(0, io.BytesIO(b'12345')), 5)
+        with self.assertRaises(SubidaInvalida):
+            subida.agregar(0, io.BytesIO(b'12345'))
+        with self.assertRaises(SubidaInvalida):
+            subida.agregar(5, io.BytesIO(b'6789012'))
+        # El bloque rechazado no deja bytes a medias
+        self.assertEqual(subida.recibido, 5)
+        subida.agregar(5, io.BytesIO(b'67890'))
+        self.assertTrue(SubidaReanudable.obtener(subida.id, self.ana).completa)
+        self.assertIsNone(SubidaReanudable.obtener(subida.id, User(id=self.ana.id + 1)))
+
+    def test_mismo_bloque_en_paralelo_se_agrega_una_vez(self):
+        from .subidas import SubidaInvalida, SubidaReanudable
+
+        subida = SubidaReanudable.crear(self.ana, 'carga.csv', 10)
+        self.addCleanup(subida.eliminar)
+        leyendo, seguir = threading.Event(), threading.Event()
+
+        class BloqueLento(io.BytesIO):
+            """Entrega el bloque y espera antes de terminar, como una conexión lenta."""
+
+            def read(self, *args):
+                datos = super().read(*args)
+                if not datos:
+                    leyendo.set()
+                    seguir.wait(5)
+                return datos
+
+        resultados = []
+
+        def agregar(stream):
+            try:
+                resultados.append(subida.agregar(0, stream))
+            except SubidaInvalida:
+                resultados.append('rechazado')
+
+        primero = threading.Thread(target=agregar, args=(BloqueLento(b'1234567890'),))
+        primero.start()
+        leyendo.wait(5)
+        # El reintento llega mientras el primero sigue escribiendo: espera el lock y ve el offset nuevo
+        segundo = threading.Thread(target=agregar, args=(io.BytesIO(b'1234567890'),))
+        segundo.start()
+        segundo.join(0.2)
+        seguir.set()
+        primero.join()
+        segundo.join()
+        self.assertEqual(resultados, [10, 'rechazado'])
+        self.assertEqual(subida.recibido, 10)
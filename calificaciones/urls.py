@@ -15,6 +15,9 @@ urlpatterns = [
     path("emisores/<int:pk>/editar/", views.emisor_update, name="emisor_update"),
     path("emisores/<int:pk>/eliminar/", views.emisor_delete, name="emisor_delete"),
     path("emisores/detalle/<int:id>/", views.detalle_emisor, name="detalle_emisor"),
+    path("emisores/<int:id>/perfil/", views.perfil_emisor, name="perfil_emisor"),
+    path("emisores/autocompletar/", views.emisor_autocompletar, name="emisor_autocompletar"),
+    path("emisores/estado/", views.emisores_estado_masivo, name="emisores_estado_masivo"),
 
     # ==============================
     # 2. FACTORES (CRUD Completo)
@@ -42,6 +45,7 @@ urlpatterns = [
     # ==============================
     path("calificaciones/carga-masiva/", views.carga_masiva_calificaciones, name="carga_masiva_calificaciones"),
     path("api/carga-masiva/", views.api_carga_masiva, name="api_carga_masiva"),
+    path("calificaciones/cargas/<int:pk>/errores.csv", views.carga_errores, name="carga_errores"),
     
     # ==============================
     # 5. AUDITORÍA
@@ -54,4 +58,42 @@ urlpatterns = [
     path("usuarios/", views.gestion_usuarios, name="gestion_usuarios"),
     path("usuarios/crear/", views.crear_usuario, name="crear_usuario"),
     path("usuarios/eliminar/<int:user_id>/", views.eliminar_usuario, name="eliminar_usuario"),
-]
\ No newline at end of file
+
+    # ==============================
+    # 7. API DE CONSULTA (async)
+    # ==============================
+    path("json/emisores/", views.api_emisores, name="api_emisores"),
+    path("json/factores/", views.api_factores, name="api_factores"),
+    path("json/calificaciones/", views.api_calificaciones, name="api_calificaciones"),
+    path("json/calificaciones/vigentes/", views.api_calificaciones_vigentes, name="api_calificaciones_vigentes"),
+
+    # ==============================
+    # 8. SNAPSHOT COLUMNAR
+    # ==============================
+    path("calificaciones/snapshot/", views.snapshot_calificaciones, name="snapshot_calificaciones"),
+    path("calificaciones/snapshot/<str:snapshot>/<str:columna>.npy", views.snapshot_columna, name="snapshot_columna"),
+
+    # ==============================
+    # 9. SUBIDAS REANUDABLES (carga masiva por bloques)
+    # ==============================
+    path("calificaciones/subidas/", views.subida_iniciar, name="subida_iniciar"),
+    path("calificaciones/subidas/<uuid:subida_id>/", views.subida_bloque, name="subida_bloque"),
+    path("calificaciones/subidas/<uuid:subida_id>/procesar/", views.subida_procesar, name="subida_procesar"),
+    path("calificaciones/cargas/", views.cola_cargas_estado, name="cola_cargas_estado"),
+
+    # ==============================
+    # 10. OPERACIONES MASIVAS (eliminar / reasignar por filtro)
+    # ==============================
+    path("calificaciones/operaciones/", views.operacion_masiva_crear, name="operacion_masiva_crear"),
+    path("calificaciones/operaciones/<int:pk>/", views.operacion_masiva_estado, name="operacion_masiva_estado"),
+
+    # ==============================
+    # 11. FEED DE CAMBIOS (outbox)
+    # ==============================
+    path("cambios/", views.feed_cambios, name="feed_cambios"),
+
+    # ==============================
+    # 12. NOTIFICACIONES EN VIVO (SSE)
+    # ==============================
+    path("eventos/", views.eventos, name="eventos"),
+]
@@ -0,0 +1,60 @@
+"""Mantenimiento del historial temporal (`CalificacionVersion`) desde las vías de escritura.
+
+Cada vía de escritura, dentro de su transacción, llama a:
+
+- `sincronizar_versiones(queryset)` después de crear o modificar calificaciones: cierra las
+  versiones abiertas que ya no coinciden con la fila (emisor, factor o comentario distintos) en la
+  `fecha_modificacion` de la fila, y abre una versión desde esa fecha para cada fila sin
+  versión abierta. Es idempotente: las filas sin cambios no generan versiones nuevas.
+- `cerrar_versiones(queryset)` antes de eliminar calificaciones.
+
+Ambas son sentencias de conjunto (un UPDATE y un INSERT ... SELECT), sin importar cuántas
+filas abarque el queryset.
+"""
+from django.db.models import DateTimeField, Exists, F, OuterRef, Subquery, TextField, Value
+from django.db.models.functions import Cast, Coalesce
+from django.utils import timezone
+
+from .models import Calificacion, CalificacionVersion
+from .sql import insertar_select
+
+
+def sincronizar_versiones(calificaciones):
+    """Deja una versión abierta igual al estado actual de cada calificación del queryset."""
+    ahora = timezone.now()
+    ids = calificaciones.values('pk')
+    abiertas = CalificacionVersion.objects.filter(valido_hasta=None)
+
+    coincide = Calificacion.objects.annotate(_comentario=Coalesce('comentario', Value(''), output_field=TextField())).filter(
+        pk=OuterRef('calificacion_id'), emisor_id=OuterRef('emisor_id'), factor_id=OuterRef('factor_id'),
+        _comentario=OuterRef('comentario'),
+    )
+    fecha_cambio = Calificacion.objects.filter(pk=OuterRef('calificacion_id')).values('fecha_modificacion')[:1]
+    abiertas.filter(calificacion_id__in=ids).exclude(Exists(coincide)).update(
+        valido_hasta=Coalesce(Subquery(fecha_cambio), Value(ahora, output_field=DateTimeField())),
+    )
+
+    sin_version = calificaciones.exclude(Exists(abiertas.filter(calificacion_id=OuterRef('pk'))))
+    return insertar_select(CalificacionVersion, sin_version, {
+        'calificacion': F('pk'),
+        'emisor': F('emisor_id'),
+        'factor': F('factor_id'),
+        'comentario': Coalesce('comentario', Value(''), output_field=TextField()),
+        'usuario': F('usuario_id'),
+        'valido_desde': F('fecha_modificacion'),
+        'valido_hasta': Cast(Value(None), DateTimeField()),
+    })
+
+
+def cerrar_versiones(calificaciones, ahora=None):
+    """Cierra en `ahora` las versiones abiertas de las calificaciones (antes de eliminarlas)."""
+    return CalificacionVersion.objects.filter(
+        valido_hasta=None, calificacion_id__in=calificaciones.values('pk'),
+    ).update(valido_hasta=ahora or timezone.now())
+
+
+def cerrar_versiones_huerfanas(ahora=None):
+    """Cierra las versiones abiertas de calificaciones que ya no existen (borradas fuera de las vías de escritura)."""
+    return CalificacionVersion.objects.filter(valido_hasta=None).exclude(
+        Exists(Calificacion.objects.filter(pk=OuterRef('calificacion_id')))
+    ).update(valido_hasta=ahora or timezone.now())
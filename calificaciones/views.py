@@ -1,13 +1,38 @@
+import datetime
 import json
-import openpyxl
+import logging
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
-from django.db.models import ProtectedError
+from django.http import FileResponse, Http404, JsonResponse
+from django.urls import reverse
+from django.utils.html import format_html
+from django.db.models import Q
 from django.db import transaction
-from .models import Emisor, FactorTributario, Calificacion, HistorialAuditoria
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from proyecto_nuam.db_router import lectura_en_replica
+from .models import (
+    CargaMasiva, Emisor, FactorTributario, Calificacion, CalificacionVersion, HistorialAuditoria, OperacionMasiva,
+)
+from . import cache_listas, cola_cargas, conteos, notificaciones, outbox, perfiles
 from .forms import EmisorForm, FactorForm, CalificacionForm, CargaMasivaForm
+from .importacion import (
+    MODO_INSERTAR, MODOS, ReporteErrores, en_lotes, insertar_lote, maps_emisores_factores,
+    procesar_csv_calificaciones, procesar_excel_calificaciones,
+)
+from .operaciones import (
+    cambiar_estado_emisores, crear as crear_operacion, estado as estado_operacion, simular,
+)
+from .roles import roles_de
+from .rut import RutInvalido, normalizar_ruts, rangos_prefijo, validar_rut
+from .versiones import cerrar_versiones
+from .subidas import Huella, SubidaReanudable, subida_a_disco
+from .xlsx import leer_filas_xlsx
+from .snapshot import generar_snapshot, leer_manifest, ruta_columna
+
+logger = logging.getLogger(__name__)
 
 # ==========================================
 # 0. DASHBOARD
@@ -21,13 +46,13 @@ def dashboard(request):
 # 1. DECORADORES Y AYUDAS
 # ==========================================
 
-def require_group(user, group_name):
-    return user.is_authenticated and user.groups.filter(name=group_name).exists()
+def require_group(request, group_name):
+    return request.user.is_authenticated and roles_de(request).tiene_grupo(group_name)
 
 def analyst_required(view_func):
     def _wrapped(request, *args, **kwargs):
-        # Si es superusuario o tiene is_staff (Analista), pasa.
-        if request.user.is_superuser or request.user.is_staff:
+        # Si es superusuario, tiene is_staff o el grupo Analista, pasa.
+        if roles_de(request).es_analista:
             return view_func(request, *args, **kwargs)
         else:
             return render(
@@ -42,26 +67,88 @@ def analyst_required(view_func):
             )
     return _wrapped
 
+def paginar(request, queryset):
+    """Página `?pagina=` del queryset (LIMIT/OFFSET de LISTAS_POR_PAGINA filas) con su paginador.
+
+    El total sale de conteos.contar(): exacto hasta CONTEO_EXACTO_MAX, estimado sobre eso.
+    """
+    paginador = conteos.PaginadorEstimado(queryset, settings.LISTAS_POR_PAGINA)
+    return paginador.get_page(request.GET.get('pagina')), paginador
+
 # ==========================================
 # 2. GESTIÓN DE EMISORES
 # ==========================================
 
 @login_required
 def lista_emisores(request):
-    # Filtra solo los activos (baja lógica)
-    emisores = Emisor.objects.filter(activo=True)
-    return render(request, 'calificaciones/lista_emisores.html', {'emisores': emisores})
+    # Filtra solo los activos (baja lógica). La tabla sale de la cache si no hubo escrituras;
+    # se renderiza desde la primaria para no guardar datos atrasados de una réplica.
+    tabla = cache_listas.tabla(
+        cache_listas.EMISORES, request, 'calificaciones/_tabla_emisores.html',
+        {'emisores': Emisor.objects.filter(activo=True)},
+    )
+    return render(request, 'calificaciones/lista_emisores.html', {'tabla': tabla})
 
 @login_required
-def detalle_emisor(request, id):
+@lectura_en_replica
+async def detalle_emisor(request, id):
     try:
-        emisor = Emisor.objects.values("id", "rut", "nombre", "direccion").get(id=id)
+        emisor = await Emisor.objects.values("id", "rut", "nombre", "direccion").aget(id=id)
         return JsonResponse(emisor, safe=False)
     except Emisor.DoesNotExist:
         return JsonResponse({"error": "Emisor no encontrado"}, status=404)
 
+@login_required
+def perfil_emisor(request, id):
+    """Emisor con sus calificaciones y, para Analista, su historial reciente (ver calificaciones/perfiles.py).
+
+    Lee de la primaria: la cache se invalida al confirmarse cada cambio y no debe
+    rellenarse con datos atrasados de una réplica.
+    """
+    # El historial de auditoría es solo para Analista, como lista_auditoria
+    datos = perfiles.perfil(id, con_historial=roles_de(request).es_analista)
+    if datos is None:
+        return JsonResponse({"error": "Emisor no encontrado"}, status=404)
+    return JsonResponse(datos)
+
+AUTOCOMPLETAR_MIN_CARACTERES = 2
+AUTOCOMPLETAR_LIMITE = 20
+
+@login_required
+@lectura_en_replica
+async def emisor_autocompletar(request):
+    """Búsqueda por prefijo de RUT o nombre para el selector de emisores (formato select2)."""
+    termino = (request.GET.get('q') or '').strip()
+    if len(termino) < AUTOCOMPLETAR_MIN_CARACTERES:
+        return JsonResponse({"results": []})
+
+    emisores = Emisor.objects.filter(activo=True)
+    if '-' in termino:
+        # RUT completo: búsqueda exacta por la clave numérica, sin importar el formato
+        try:
+            emisores = emisores.filter(rut_numero=validar_rut(termino))
+        except RutInvalido:
+            return JsonResponse({"results": []})
+    elif termino[0].isdigit():
+        # rut se guarda con puntos (12.345.678-5): el prefijo se busca sobre el número
+        rangos = Q()
+        for desde, hasta in rangos_prefijo(termino):
+            rangos |= Q(rut_numero__range=(desde, hasta))
+        if not rangos:
+            return JsonResponse({"results": []})
+        emisores = emisores.filter(rangos).order_by("rut_numero")
+    else:
+        emisores = emisores.filter(nombre__istartswith=termino).order_by("nombre")
+
+    resultados = [
+        {"id": e["id"], "text": f"{e['nombre']} ({e['rut']})"}
+        async for e in emisores.values("id", "rut", "nombre")[:AUTOCOMPLETAR_LIMITE]
+    ]
+    return JsonResponse({"results": resultados})
+
 @login_required
 @analyst_required
+@transaction.atomic
 def emisor_create(request):
     if request.method == "POST":
         form = EmisorForm(request.POST)
@@ -75,6 +162,7 @@ def emisor_create(request):
 
 @login_required
 @analyst_required
+@transaction.atomic
 def emisor_update(request, pk):
     emisor = get_object_or_404(Emisor, pk=pk)
     if request.method == "POST":
@@ -89,22 +177,47 @@ def emisor_update(request, pk):
 
 @login_required
 @analyst_required
+@transaction.atomic
 def emisor_delete(request, pk):
     emisor = get_object_or_404(Emisor, pk=pk)
-    # Baja lógica si tiene calificaciones
-    tiene_calif = Calificacion.objects.filter(emisor=emisor).exists()
+    # Baja lógica si tiene calificaciones o las tuvo (su historial temporal lo protege)
+    tiene_historial = (
+        Calificacion.objects.filter(emisor=emisor).exists()
+        or emisor.versiones_calificacion.exists()
+    )
     
     if request.method == "POST":
-        if tiene_calif:
-            emisor.activo = False
-            emisor.save()
+        if tiene_historial:
+            # Solo se escribe la columna activo (save() reescribiría la fila completa)
+            Emisor.objects.filter(pk=emisor.pk).update(activo=False)
+            outbox.registrar(outbox.EMISOR, 'ACTUALIZAR', [emisor.pk])
+            cache_listas.invalidar(cache_listas.EMISORES)
+            perfiles.invalidar([emisor.pk])
             messages.warning(request, "El emisor tiene historial. Se realizó una baja lógica.")
         else:
             emisor.delete()
             messages.success(request, "Emisor eliminado permanentemente.")
         return redirect("lista_emisores")
     
-    return render(request, "calificaciones/confirm_delete.html", {"obj": emisor, "logical": tiene_calif})
+    return render(request, "calificaciones/confirm_delete.html", {"obj": emisor, "logical": tiene_historial})
+
+@login_required
+def emisores_estado_masivo(request):
+    """POST JSON {ruts: [...], activo: false|true}: baja lógica o reactivación de varios emisores."""
+    if request.method != "POST":
+        return JsonResponse({"error": "Método no permitido"}, status=405)
+    prohibido = _solo_analista_json(request)
+    if prohibido:
+        return prohibido
+    try:
+        datos = json.loads(request.body)
+        activo = datos.get("activo")
+        if not isinstance(activo, bool):
+            raise ValueError("'activo' debe ser true o false")
+        resultado = cambiar_estado_emisores(datos.get("ruts"), activo)
+    except (ValueError, AttributeError) as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return JsonResponse(resultado)
 
 
 # ==========================================
@@ -113,19 +226,25 @@ def emisor_delete(request, pk):
 
 @login_required
 def lista_factores(request):
-    factores = FactorTributario.objects.all()
-    return render(request, 'calificaciones/lista_factores.html', {'factores': factores})
+    # Tabla cacheada por rol y generación, como lista_emisores
+    tabla = cache_listas.tabla(
+        cache_listas.FACTORES, request, 'calificaciones/_tabla_factores.html',
+        {'factores': FactorTributario.objects.all()},
+    )
+    return render(request, 'calificaciones/lista_factores.html', {'tabla': tabla})
 
 @login_required
-def detalle_factor(request, id):
+@lectura_en_replica
+async def detalle_factor(request, id):
     try:
-        factor = FactorTributario.objects.values("id", "codigo", "descripcion", "vigente").get(id=id)
+        factor = await FactorTributario.objects.values("id", "codigo", "descripcion", "vigente").aget(id=id)
         return JsonResponse(factor, safe=False)
     except FactorTributario.DoesNotExist:
         return JsonResponse({"error": "Factor no encontrado"}, status=404)
 
 @login_required
 @analyst_required
+@transaction.atomic
 def factor_create(request):
     if request.method == "POST":
         form = FactorForm(request.POST)
@@ -153,6 +272,7 @@ def factor_create(request):
 
 @login_required
 @analyst_required
+@transaction.atomic
 def factor_update(request, pk):
     factor = get_object_or_404(FactorTributario, pk=pk)
     codigo_anterior = factor.codigo
@@ -221,6 +341,7 @@ def factor_update(request, pk):
 
 @login_required
 @analyst_required
+@transaction.atomic
 def factor_delete(request, pk):
     factor = get_object_or_404(FactorTributario, pk=pk)
     # Validación: No eliminar si está en uso
@@ -259,15 +380,22 @@ def factor_delete(request, pk):
 # ==========================================
 
 @login_required
+@lectura_en_replica
 def lista_calificaciones(request):
-    calificaciones = Calificacion.objects.select_related('emisor', 'factor', 'usuario').all()
-    return render(request, 'calificaciones/lista_calificaciones.html', {'calificaciones': calificaciones})
+    pagina, paginador = paginar(request, Calificacion.objects.select_related('emisor', 'factor', 'usuario').all())
+    return render(request, 'calificaciones/lista_calificaciones.html', {
+        'calificaciones': pagina,
+        'pagina': pagina,
+        'conteo': paginador.conteo,
+    })
 
 @login_required
-def detalle_calificacion(request, id):
+@lectura_en_replica
+async def detalle_calificacion(request, id):
     
     try:
-        c = Calificacion.objects.select_related('emisor', 'factor').get(id=id)
+        # usuario también va en el JOIN: en una vista async no se permite el acceso lazy a FKs
+        c = await Calificacion.objects.select_related('emisor', 'factor', 'usuario').aget(id=id)
         data = {
             "id": c.id,
             "emisor": c.emisor.nombre,
@@ -283,6 +411,7 @@ def detalle_calificacion(request, id):
 
 @login_required
 @analyst_required
+@transaction.atomic
 def calificacion_create(request):
     if request.method == "POST":
         form = CalificacionForm(request.POST)
@@ -307,6 +436,7 @@ def calificacion_create(request):
 
 @login_required
 @analyst_required
+@transaction.atomic
 def calificacion_update(request, pk):
     obj = get_object_or_404(Calificacion, pk=pk)
     factor_anterior = obj.factor.codigo
@@ -338,6 +468,7 @@ def calificacion_update(request, pk):
 
 @login_required
 @analyst_required
+@transaction.atomic
 def calificacion_delete(request, pk):
     obj = get_object_or_404(Calificacion, pk=pk)
     if request.method == "POST":
@@ -348,6 +479,9 @@ def calificacion_delete(request, pk):
             factor_anterior=obj.factor.codigo,
             factor_nuevo="ELIMINADO"
         )
+        cerrar_versiones(Calificacion.objects.filter(pk=obj.pk))
+        outbox.registrar(outbox.CALIFICACION, 'ELIMINAR', [obj.pk])
+        perfiles.invalidar([obj.emisor_id])
         obj.delete()
         messages.success(request, "Calificación eliminada.")
         return redirect("calificacion_list")
@@ -358,8 +492,12 @@ def calificacion_delete(request, pk):
 # 5. CARGA MASIVA (API)
 # ==========================================
 
+@subida_a_disco
 @login_required
 def api_carga_masiva(request):
+    if getattr(request, 'carga_rechazada', None):
+        return JsonResponse({'error': request.carga_rechazada}, status=413)
+
     if request.method == 'POST' and request.FILES.get('archivo'):
         archivo = request.FILES['archivo']
         
@@ -367,81 +505,82 @@ def api_carga_masiva(request):
             return JsonResponse({'error': 'Formato inválido. Use .xlsx'}, status=400)
 
         try:
-            # 1. Cargar datos en memoria (Cache)
-            emisores_map = {e.rut: e for e in Emisor.objects.all()}
-            factores_map = {f.codigo: f for f in FactorTributario.objects.all()}
-            
-            # 2. Leer Excel optimizado
-            wb = openpyxl.load_workbook(archivo, read_only=True, data_only=True)
-            sheet = wb.active
-            
-            nuevas_calificaciones = []
-            errores = []
-            filas_procesadas = 0
-
-            # 3. Iterar filas
-            # values_only=True devuelve una tupla con los valores de la fila
-            for i, row in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
-                
-                # --- CORRECCIÓN DEL ERROR INDEX OUT OF RANGE ---
-                # Si la fila está vacía o tiene menos de 2 columnas, la saltamos
-                if not row or len(row) < 2:
-                    continue
-                
-                rut = row[0]
-                codigo_factor = row[1]
-                
-                # Si las celdas están vacías (None), saltar
-                if not rut or not codigo_factor:
-                    continue
-
-                emisor = emisores_map.get(rut)
-                factor = factores_map.get(codigo_factor)
-
-                if not emisor:
-                    # Opcional: limitar errores para no llenar la memoria si todo falla
-                    if len(errores) < 50: errores.append(f"Fila {i}: RUT {rut} no encontrado")
-                    continue
-                if not factor:
-                    if len(errores) < 50: errores.append(f"Fila {i}: Factor {codigo_factor} no encontrado")
-                    continue
-
-                nuevas_calificaciones.append(
-                    Calificacion(emisor=emisor, factor=factor, usuario=request.user)
-                )
-                filas_procesadas += 1
-
-                # Guardar en lotes de 5,000 para liberar memoria y evitar que se pegue
-                if len(nuevas_calificaciones) >= 5000:
-                    with transaction.atomic():
-                        Calificacion.objects.bulk_create(nuevas_calificaciones, ignore_conflicts=True)
-                    nuevas_calificaciones = []
-                    print(f"Procesadas {filas_procesadas} filas...") # Log en consola para ver avance
-
-            # Guardar el último grupo restante
-            if nuevas_calificaciones:
-                with transaction.atomic():
-                    Calificacion.objects.bulk_create(nuevas_calificaciones, ignore_conflicts=True)
-
-            # 4. Auditoría (Solo 1 registro)
-            if filas_procesadas > 0:
-                HistorialAuditoria.objects.create(
-                    usuario=request.user,
-                    emisor=emisores_map.get(list(emisores_map.keys())[0]) if emisores_map else None,
-                    factor_nuevo="CARGA_MASIVA",
-                    factor_anterior=f"{filas_procesadas} registros cargados exitosamente."
-                )
-
-            wb.close()
+            # Espera su turno en la cola de cargas (tope global y equidad entre usuarios)
+            with cola_cargas.turno(request.user, archivo.name, archivo.size, archivo.filas) as carga, \
+                    ReporteErrores() as reporte:
+                # 1. Cargar datos en memoria (Cache)
+                emisores_map, factores_map = maps_emisores_factores()
             
-            mensaje = f"Éxito: {filas_procesadas} registros cargados."
-            if errores:
-                mensaje += f" (Se omitieron {len(errores)} filas con errores)."
+                nuevas_calificaciones = []
+                filas_procesadas = 0
+
+                # 2. Leer el Excel en streaming (backend según XLSX_READER), por lotes:
+                # cada fila es una tupla de valores y la columna RUT de cada lote se normaliza de una vez
+                filas = enumerate(leer_filas_xlsx(archivo, desde_fila=2), start=2)
+                for lote in en_lotes(filas, 5000):
+                    ruts_numero = normalizar_ruts([row[0] if row else None for _, row in lote])
+
+                    for (i, row), rut_numero in zip(lote, ruts_numero):
+                        # --- CORRECCIÓN DEL ERROR INDEX OUT OF RANGE ---
+                        # Si la fila está vacía o tiene menos de 2 columnas, la saltamos
+                        if not row or len(row) < 2:
+                            continue
+
+                        rut = row[0]
+                        codigo_factor = row[1]
+
+                        # Si las celdas están vacías (None), saltar
+                        if not rut or not codigo_factor:
+                            continue
+
+                        emisor_id = emisores_map.get(rut_numero)
+                        factor_id = factores_map.get(codigo_factor)
+
+                        # Los errores van al CSV del reporte, no a memoria
+                        if not emisor_id:
+                            reporte.agregar([{'fila': i, 'mensaje': f"RUT {rut} no encontrado"}])
+                            continue
+                        if not factor_id:
+                            reporte.agregar([{'fila': i, 'mensaje': f"Factor {codigo_factor} no encontrado"}])
+                            continue
+
+                        nuevas_calificaciones.append(
+                            Calificacion(emisor_id=emisor_id, factor_id=factor_id, usuario=request.user)
+                        )
+                        filas_procesadas += 1
+
+                    # Guardar en lotes de 5,000 para liberar memoria y evitar que se pegue
+                    # (el avance se registra antes de confirmar: si la carga perdió su turno, el lote se revierte)
+                    if nuevas_calificaciones:
+                        with transaction.atomic():
+                            insertar_lote(nuevas_calificaciones)
+                            cola_cargas.avanzar(carga, filas_procesadas, reporte.total)
+                        nuevas_calificaciones = []
+                        logger.info("Carga masiva #%s: %s filas procesadas", carga.pk, filas_procesadas)
+
+                # 4. Auditoría (Solo 1 registro)
+                if filas_procesadas > 0:
+                    HistorialAuditoria.objects.create(
+                        usuario=request.user,
+                        emisor_id=next(iter(emisores_map.values())),
+                        factor_nuevo="CARGA_MASIVA",
+                        factor_anterior=f"{filas_procesadas} registros cargados exitosamente."
+                    )
+
+                mensaje = f"Éxito: {filas_procesadas} registros cargados."
+                if reporte.total:
+                    mensaje += f" (Se omitieron {reporte.total} filas con errores)."
+                reporte.guardar(carga)
                 
-            return JsonResponse({'mensaje': mensaje, 'errores': errores[:10]})
+                return JsonResponse({
+                    'mensaje': mensaje,
+                    'errores_totales': reporte.total,
+                    'reporte_errores': reverse('carga_errores', args=[carga.pk]) if reporte.total else None,
+                    'sha256': getattr(archivo, 'sha256', None),
+                })
 
         except Exception as e:
-            print(f"Error crítico: {e}") # Ver error en terminal
+            logger.exception("Error en la carga masiva de %s", archivo.name)
             return JsonResponse({'error': f"Error en el servidor: {str(e)}"}, status=500)
 
     return JsonResponse({'error': 'Petición inválida'}, status=400)
@@ -452,9 +591,10 @@ def api_carga_masiva(request):
 # ==========================================
 
 @login_required
+@lectura_en_replica
 def lista_auditoria(request):
-    # Solo Analista (is_staff) puede ver el historial
-    if not (request.user.is_superuser or request.user.is_staff):
+    # Solo Analista puede ver el historial
+    if not roles_de(request).es_analista:
         return render(
             request,
             "calificaciones/forbidden.html",
@@ -466,40 +606,42 @@ def lista_auditoria(request):
             status=403,
         )
     
-    historial = HistorialAuditoria.objects.select_related('usuario', 'emisor').all()
-    return render(request, 'calificaciones/lista_auditoria.html', {'historial': historial})
+    pagina, paginador = paginar(request, HistorialAuditoria.objects.select_related('usuario', 'emisor').all())
+    return render(request, 'calificaciones/lista_auditoria.html', {
+        'historial': pagina,
+        'pagina': pagina,
+        'conteo': paginador.conteo,
+    })
 
 
 # ==========================================
 # 5. CARGA MASIVA DE CALIFICACIONES
 # ==========================================
 
+@subida_a_disco
 @login_required
 @analyst_required
 def carga_masiva_calificaciones(request):
-    """Vista para cargar calificaciones desde archivo Excel o CSV"""
+    """Vista para cargar calificaciones desde archivo Excel o CSV (recibido a disco, no en memoria)"""
     if request.method == "POST":
         form = CargaMasivaForm(request.POST, request.FILES)
         if form.is_valid():
             archivo = request.FILES['archivo']
             try:
-                # Determinar el tipo de archivo
-                nombre_archivo = archivo.name.lower()
-                if nombre_archivo.endswith('.csv'):
-                    resultado = procesar_csv_calificaciones(archivo, request.user)
-                else:  # Excel
-                    resultado = procesar_excel_calificaciones(archivo, request.user)
-                
-                messages.success(request, resultado['mensaje'])
-                
-                # Mostrar detalles de la carga
-                if resultado['errores']:
-                    for error in resultado['errores']:
-                        messages.warning(request, f"⚠ Fila {error['fila']}: {error['mensaje']}")
-                
+                with cola_cargas.turno(request.user, archivo.name, archivo.size, archivo.filas,
+                                       _espera_carga(request, archivo.filas)) as carga, ReporteErrores() as reporte:
+                    resultado = _procesar_archivo_carga(
+                        archivo, archivo.name, request.user, form.cleaned_data['modo'],
+                        _avance_carga(request, archivo.filas, carga), reporte,
+                    )
+                    reporte.guardar(carga)
+                _mensajes_carga(request, resultado, archivo.sha256, archivo.filas, carga)
                 return redirect('calificacion_list')
             except Exception as e:
                 messages.error(request, f"Error al procesar archivo: {str(e)}")
+        elif getattr(request, 'carga_rechazada', None):
+            # El upload handler descartó el archivo por tamaño
+            messages.error(request, f"❌ {request.carga_rechazada}")
         else:
             # Mostrar errores del formulario (incluidos los de validación de archivo)
             for field, errors in form.errors.items():
@@ -508,172 +650,71 @@ def carga_masiva_calificaciones(request):
     else:
         form = CargaMasivaForm()
     
-    return render(request, 'calificaciones/carga_masiva.html', {'form': form})
+    return render(request, 'calificaciones/carga_masiva.html', {
+        'form': form,
+        'max_mb': settings.CARGA_MASIVA_MAX_MB,
+    })
 
 
-def _maps_emisores_factores():
-    """Carga emisores y factores en RAM para lookups O(1)."""
-    emisores_map = {e.rut: e for e in Emisor.objects.all()}
-    factores_map = {f.codigo: f for f in FactorTributario.objects.all()}
-    return emisores_map, factores_map
+def _procesar_archivo_carga(archivo, nombre, usuario, modo=MODO_INSERTAR, al_avanzar=None, reporte=None):
+    # Determinar el tipo de archivo
+    if nombre.lower().endswith('.csv'):
+        return procesar_csv_calificaciones(archivo, usuario, modo=modo, al_avanzar=al_avanzar, reporte=reporte)
+    return procesar_excel_calificaciones(archivo, usuario, modo=modo, al_avanzar=al_avanzar, reporte=reporte)
 
 
-def _bulk_insert_calificaciones(pendientes, creadas):
-    """Inserta en lote con ignore_conflicts para saltar duplicados."""
-    if not pendientes:
-        return creadas
-    with transaction.atomic():
-        Calificacion.objects.bulk_create(pendientes, ignore_conflicts=True)
-    return creadas + len(pendientes)
+def _avance_carga(request, total, carga):
+    """Registra el avance en la cola y lo publica por SSE si el navegador envió su carga_id (ver views.eventos)."""
+    carga_id = request.POST.get('carga_id', '')[:64]
+    canal = notificaciones.canal_usuario(request.user.id)
 
+    def al_avanzar(avance):
+        cola_cargas.avanzar(carga, avance['procesadas'], avance['errores'])
+        if carga_id:
+            notificaciones.publicar(canal, 'progreso', {'carga': carga_id, 'total': total, **avance})
+    return al_avanzar
 
-def procesar_excel_calificaciones(archivo, usuario, chunk_size=2000):
-    """Procesa Excel con lookups en memoria y bulk_create por lotes."""
-    workbook = openpyxl.load_workbook(archivo, read_only=True, data_only=True)
-    worksheet = workbook.active
 
-    emisores_map, factores_map = _maps_emisores_factores()
-    existentes = set(Calificacion.objects.values_list('emisor_id', 'factor_id'))
+def _espera_carga(request, total):
+    """Publica por SSE la posición en la cola y la espera estimada mientras la carga no tiene turno."""
+    carga_id = request.POST.get('carga_id', '')[:64]
+    if not carga_id:
+        return None
+    canal = notificaciones.canal_usuario(request.user.id)
 
-    pendientes = []
-    creadas = 0
-    errores = []
-    errores_totales = 0
+    def al_esperar(estado):
+        notificaciones.publicar(canal, 'progreso', {
+            'carga': carga_id, 'total': total, 'estado': estado['estado'],
+            'posicion': estado['posicion'], 'espera_estimada': estado['espera_estimada'],
+        })
+    return al_esperar
 
-    for fila_num, fila in enumerate(worksheet.iter_rows(min_row=2, values_only=True), start=2):
-        try:
-            if not fila or not fila[0] or not fila[1]:
-                continue
-
-            rut = str(fila[0]).strip()
-            codigo_factor = str(fila[1]).strip()
-            comentario = fila[2] if len(fila) > 2 else ""
-
-            emisor = emisores_map.get(rut)
-            if not emisor:
-                errores_totales += 1
-                if len(errores) < 100:
-                    errores.append({'fila': fila_num, 'mensaje': f"Emisor con RUT {rut} no encontrado"})
-                continue
-
-            factor = factores_map.get(codigo_factor)
-            if not factor:
-                errores_totales += 1
-                if len(errores) < 100:
-                    errores.append({'fila': fila_num, 'mensaje': f"Factor {codigo_factor} no encontrado"})
-                continue
-
-            clave = (emisor.id, factor.id)
-            if clave in existentes:
-                continue
-
-            pendientes.append(
-                Calificacion(
-                    emisor=emisor,
-                    factor=factor,
-                    usuario=usuario,
-                    comentario=comentario or ""
-                )
-            )
-            existentes.add(clave)
-
-            if len(pendientes) >= chunk_size:
-                creadas = _bulk_insert_calificaciones(pendientes, creadas)
-                pendientes = []
-
-        except Exception as e:
-            errores_totales += 1
-            if len(errores) < 100:
-                errores.append({'fila': fila_num, 'mensaje': str(e)})
-
-    # Insertar remanentes
-    creadas = _bulk_insert_calificaciones(pendientes, creadas)
-    workbook.close()
-
-    mensaje = f"✓ {creadas} calificaciones cargadas exitosamente"
-    if errores_totales:
-        mensaje += f" ({errores_totales} errores)"
-
-    return {
-        'creadas': creadas,
-        'errores': errores,
-        'mensaje': mensaje
-    }
 
+def _mensajes_carga(request, resultado, sha256, filas, carga):
+    messages.success(request, resultado['mensaje'])
+    detalle = f"Archivo SHA-256 {sha256[:12]}…"
+    if filas is not None:
+        detalle += f" ({filas} filas)"
+    messages.info(request, detalle)
 
-def procesar_csv_calificaciones(archivo, usuario, chunk_size=2000):
-    """Procesa CSV con lookups en memoria y bulk_create por lotes."""
-    import csv
-    import io
+    # Un solo mensaje con el enlace al reporte: la sesión no crece con las filas rechazadas
+    if resultado['errores_totales']:
+        messages.warning(request, format_html(
+            '⚠ {} filas con errores. <a href="{}">Descargar el detalle (CSV)</a>',
+            resultado['errores_totales'], reverse('carga_errores', args=[carga.pk]),
+        ))
 
-    emisores_map, factores_map = _maps_emisores_factores()
-    existentes = set(Calificacion.objects.values_list('emisor_id', 'factor_id'))
 
-    creadas = 0
-    errores = []
-    errores_totales = 0
-    pendientes = []
-
-    contenido = archivo.read().decode('utf-8')
-    reader = csv.DictReader(io.StringIO(contenido))
-
-    for fila_num, fila in enumerate(reader, start=2):
-        try:
-            rut = (fila.get('RUT', '') or '').strip()
-            codigo_factor = (fila.get('Código Factor', '') or '').strip()
-            comentario = (fila.get('Comentario', '') or '').strip()
-
-            if not rut or not codigo_factor:
-                continue
-
-            emisor = emisores_map.get(rut)
-            if not emisor:
-                errores_totales += 1
-                if len(errores) < 100:
-                    errores.append({'fila': fila_num, 'mensaje': f"Emisor con RUT {rut} no encontrado"})
-                continue
-
-            factor = factores_map.get(codigo_factor)
-            if not factor:
-                errores_totales += 1
-                if len(errores) < 100:
-                    errores.append({'fila': fila_num, 'mensaje': f"Factor {codigo_factor} no encontrado"})
-                continue
-
-            clave = (emisor.id, factor.id)
-            if clave in existentes:
-                continue
-
-            pendientes.append(
-                Calificacion(
-                    emisor=emisor,
-                    factor=factor,
-                    usuario=usuario,
-                    comentario=comentario or ""
-                )
-            )
-            existentes.add(clave)
-
-            if len(pendientes) >= chunk_size:
-                creadas = _bulk_insert_calificaciones(pendientes, creadas)
-                pendientes = []
-
-        except Exception as e:
-            errores_totales += 1
-            if len(errores) < 100:
-                errores.append({'fila': fila_num, 'mensaje': str(e)})
-
-    creadas = _bulk_insert_calificaciones(pendientes, creadas)
-
-    mensaje = f"✓ {creadas} calificaciones cargadas exitosamente"
-    if errores_totales:
-        mensaje += f" ({errores_totales} errores)"
-
-    return {
-        'creadas': creadas,
-        'errores': errores,
-        'mensaje': mensaje
-    }
+@login_required
+def carga_errores(request, pk):
+    """CSV con todas las filas rechazadas de una carga (solo su autor o un Administrador)."""
+    carga = get_object_or_404(CargaMasiva, pk=pk)
+    if carga.usuario_id != request.user.id and not roles_de(request).es_admin:
+        return JsonResponse({"error": "No tienes permisos para ver esta carga."}, status=403)
+    if not carga.archivo_errores:
+        return JsonResponse({"error": "La carga no tiene errores registrados."}, status=404)
+    return FileResponse(carga.archivo_errores.open('rb'), as_attachment=True,
+                        filename=f"errores_carga_{carga.pk}.csv", content_type="text/csv")
 
 
 # ==========================================
@@ -683,7 +724,7 @@ def procesar_csv_calificaciones(archivo, usuario, chunk_size=2000):
 @login_required
 def gestion_usuarios(request):
     """Vista para gestionar usuarios (solo superusuarios)"""
-    if not request.user.is_superuser:
+    if not roles_de(request).es_admin:
         return render(
             request,
             "calificaciones/forbidden.html",
@@ -703,7 +744,7 @@ def gestion_usuarios(request):
 @login_required
 def crear_usuario(request):
     """Crea un usuario según el tipo especificado"""
-    if not request.user.is_superuser:
+    if not roles_de(request).es_admin:
         messages.error(request, "No tienes permisos para crear usuarios.")
         return redirect('dashboard')
     
@@ -746,7 +787,7 @@ def crear_usuario(request):
 @login_required
 def eliminar_usuario(request, user_id):
     """Elimina un usuario (no permite eliminar superusuarios)"""
-    if not request.user.is_superuser:
+    if not roles_de(request).es_admin:
         messages.error(request, "No tienes permisos para eliminar usuarios.")
         return redirect('dashboard')
     
@@ -763,4 +804,306 @@ def eliminar_usuario(request, user_id):
         usuario.delete()
         messages.success(request, f"Usuario '{username}' eliminado correctamente.")
     
-    return redirect('gestion_usuarios')
\ No newline at end of file
+    return redirect('gestion_usuarios')
+
+
+# ==========================================
+# 7. API DE CONSULTA (ASYNC)
+# ==========================================
+
+API_LIMITE_DEFAULT = 100
+API_LIMITE_MAXIMO = 500
+
+
+def _paginacion_keyset(request):
+    """Lee ?desde=<id>&limite=<n> para paginar por id sin OFFSET."""
+    try:
+        desde = int(request.GET.get('desde', 0))
+    except ValueError:
+        desde = 0
+    try:
+        limite = int(request.GET.get('limite', API_LIMITE_DEFAULT))
+    except ValueError:
+        limite = API_LIMITE_DEFAULT
+    return desde, max(1, min(limite, API_LIMITE_MAXIMO))
+
+
+async def _respuesta_lista(queryset, desde, limite):
+    resultados = [fila async for fila in queryset.filter(id__gt=desde).order_by('id')[:limite]]
+    siguiente = resultados[-1]['id'] if len(resultados) == limite else None
+    return JsonResponse({'resultados': resultados, 'siguiente': siguiente})
+
+
+@login_required
+@lectura_en_replica
+async def api_emisores(request):
+    """Lista emisores activos en JSON, paginada por id."""
+    desde, limite = _paginacion_keyset(request)
+    queryset = Emisor.objects.filter(activo=True).values("id", "rut", "nombre", "direccion")
+    return await _respuesta_lista(queryset, desde, limite)
+
+
+@login_required
+@lectura_en_replica
+async def api_factores(request):
+    """Lista factores tributarios en JSON, paginada por id."""
+    desde, limite = _paginacion_keyset(request)
+    queryset = FactorTributario.objects.values("id", "codigo", "descripcion", "vigente")
+    return await _respuesta_lista(queryset, desde, limite)
+
+
+@login_required
+@lectura_en_replica
+async def api_calificaciones(request):
+    """Lista calificaciones en JSON, paginada por id. Acepta ?emisor=<id> y ?factor=<id>."""
+    desde, limite = _paginacion_keyset(request)
+    queryset = Calificacion.objects.all()
+    for campo in ('emisor', 'factor'):
+        valor = request.GET.get(campo)
+        if valor and valor.isdigit():
+            queryset = queryset.filter(**{f'{campo}_id': int(valor)})
+    queryset = queryset.values(
+        "id", "emisor_id", "emisor__rut", "factor_id", "factor__codigo",
+        "fecha_asignacion", "comentario",
+    )
+    return await _respuesta_lista(queryset, desde, limite)
+
+
+@login_required
+@lectura_en_replica
+async def api_calificaciones_vigentes(request):
+    """Calificaciones vigentes en ?fecha=<AAAA-MM-DD o ISO 8601> según el historial temporal.
+
+    Acepta ?emisor=<id> y ?factor=<id>; paginada por id de versión como las demás listas.
+    """
+    fecha = _fecha_consulta(request.GET.get('fecha', ''))
+    if fecha is None:
+        return JsonResponse({"error": "Indique ?fecha=AAAA-MM-DD o una fecha-hora ISO 8601"}, status=400)
+    desde, limite = _paginacion_keyset(request)
+    queryset = CalificacionVersion.objects.as_of(fecha)
+    for campo in ('emisor', 'factor'):
+        valor = request.GET.get(campo)
+        if valor and valor.isdigit():
+            queryset = queryset.filter(**{f'{campo}_id': int(valor)})
+    queryset = queryset.values(
+        "id", "calificacion_id", "emisor_id", "factor_id", "comentario", "valido_desde", "valido_hasta",
+    )
+    return await _respuesta_lista(queryset, desde, limite)
+
+
+def _fecha_consulta(valor):
+    """Fecha-hora aware de ?fecha=; una fecha sola se toma desde el inicio del día."""
+    try:
+        fecha = parse_datetime(valor)
+        if fecha is None:
+            dia = parse_date(valor)
+            fecha = datetime.datetime.combine(dia, datetime.time.min) if dia else None
+    except ValueError:
+        return None
+    if fecha is not None and timezone.is_naive(fecha):
+        fecha = timezone.make_aware(fecha)
+    return fecha
+
+
+# ==========================================
+# 8. SNAPSHOT COLUMNAR
+# ==========================================
+
+@login_required
+def snapshot_calificaciones(request):
+    """GET: manifest del snapshot columnar vigente. POST (Analista): genera y publica uno nuevo, incrementalmente."""
+    if request.method == "POST":
+        if not roles_de(request).es_analista:
+            return JsonResponse({"error": "No tienes permisos de Analista."}, status=403)
+        manifest = generar_snapshot()
+    else:
+        manifest = leer_manifest()
+        if manifest is None:
+            return JsonResponse({"error": "Aún no se ha generado un snapshot"}, status=404)
+
+    for nombre, columna in manifest["columnas"].items():
+        columna["url"] = reverse("snapshot_columna", args=[manifest["snapshot"], nombre])
+    return JsonResponse(manifest)
+
+@login_required
+def snapshot_columna(request, snapshot, columna):
+    """Descarga una columna .npy de un snapshot (se puede abrir con numpy.load(mmap_mode='r')).
+
+    La URL incluye el snapshot, así que las columnas que se bajan de un mismo manifest
+    son siempre del mismo snapshot aunque entretanto se publique otro.
+    """
+    ruta = ruta_columna(snapshot, columna)
+    if ruta is None:
+        raise Http404("Columna de snapshot no encontrada")
+    return FileResponse(open(ruta, "rb"), as_attachment=True, filename=f"{columna}.npy",
+                        content_type="application/octet-stream")
+
+
+# ==========================================
+# 9. SUBIDAS REANUDABLES POR BLOQUES
+# ==========================================
+
+def _solo_analista_json(request):
+    if not roles_de(request).es_analista:
+        return JsonResponse({"error": "No tienes permisos de Analista."}, status=403)
+    return None
+
+@login_required
+def subida_iniciar(request):
+    """POST {nombre, tamano}: registra una subida por bloques y devuelve su id."""
+    if request.method != "POST":
+        return JsonResponse({"error": "Método no permitido"}, status=405)
+    prohibido = _solo_analista_json(request)
+    if prohibido:
+        return prohibido
+    try:
+        datos = json.loads(request.body)
+        subida = SubidaReanudable.crear(request.user, datos.get("nombre"), datos.get("tamano"))
+    except (ValueError, AttributeError) as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return JsonResponse(subida.estado(), status=201)
+
+@login_required
+def subida_bloque(request, subida_id):
+    """GET: bytes recibidos (para reanudar). POST: agrega el cuerpo en el offset del header Upload-Offset."""
+    prohibido = _solo_analista_json(request)
+    if prohibido:
+        return prohibido
+    subida = SubidaReanudable.obtener(subida_id, request.user)
+    if subida is None:
+        return JsonResponse({"error": "Subida no encontrada"}, status=404)
+
+    if request.method == "POST":
+        try:
+            offset = int(request.headers.get("Upload-Offset", ""))
+            subida.agregar(offset, request)
+        except ValueError as e:
+            # Offset desfasado o bloque inválido: el cliente reanuda desde 'recibido'
+            return JsonResponse({"error": str(e), **subida.estado()}, status=409)
+    return JsonResponse(subida.estado())
+
+@login_required
+def subida_procesar(request, subida_id):
+    """POST (modo=insertar|actualizar): procesa una subida completa como carga masiva y la elimina."""
+    if request.method != "POST":
+        return JsonResponse({"error": "Método no permitido"}, status=405)
+    prohibido = _solo_analista_json(request)
+    if prohibido:
+        return prohibido
+    subida = SubidaReanudable.obtener(subida_id, request.user)
+    if subida is None:
+        return JsonResponse({"error": "Subida no encontrada"}, status=404)
+    if not subida.completa:
+        return JsonResponse({"error": "La subida está incompleta", **subida.estado()}, status=409)
+
+    modo = request.POST.get("modo") or MODO_INSERTAR
+    if modo not in MODOS:
+        return JsonResponse({"error": f"Modo de carga inválido: {modo}"}, status=400)
+
+    nombre = subida.meta["nombre"]
+    huella = Huella.de_archivo(subida.ruta)
+    filas = huella.filas_csv() if nombre.lower().endswith(".csv") else None
+    try:
+        with cola_cargas.turno(request.user, nombre, subida.meta["tamano"], filas,
+                               _espera_carga(request, filas)) as carga, subida.abrir() as archivo, \
+                ReporteErrores() as reporte:
+            resultado = _procesar_archivo_carga(archivo, nombre, request.user, modo,
+                                                _avance_carga(request, filas, carga), reporte)
+            reporte.guardar(carga)
+    except Exception as e:
+        return JsonResponse({"error": f"Error al procesar archivo: {e}"}, status=400)
+    finally:
+        subida.eliminar()
+
+    _mensajes_carga(request, resultado, huella.sha256, filas, carga)
+    return JsonResponse({
+        "mensaje": resultado["mensaje"],
+        "errores_totales": resultado["errores_totales"],
+        "reporte_errores": reverse("carga_errores", args=[carga.pk]) if resultado["errores_totales"] else None,
+        "sha256": huella.sha256,
+        "filas": filas,
+        "redirect": reverse("calificacion_list"),
+    })
+
+@login_required
+def cola_cargas_estado(request):
+    """Cargas del usuario en cola o en curso, con su posición y la espera estimada en segundos."""
+    prohibido = _solo_analista_json(request)
+    if prohibido:
+        return prohibido
+    return JsonResponse({"cargas": cola_cargas.cargas_del_usuario(request.user), "tope": cola_cargas.tope()})
+
+
+# ==========================================
+# 10. OPERACIONES MASIVAS (eliminar / reasignar por filtro)
+# ==========================================
+
+@login_required
+def operacion_masiva_crear(request):
+    """POST {tipo, filtro, factor_destino, simular}: elimina o reasigna las calificaciones del filtro.
+
+    Con simular=true solo devuelve cuántas filas se afectarían. Las operaciones grandes
+    responden 202 y siguen en segundo plano; su avance se consulta en operacion_masiva_estado.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Método no permitido"}, status=405)
+    prohibido = _solo_analista_json(request)
+    if prohibido:
+        return prohibido
+    try:
+        datos = json.loads(request.body)
+        tipo, filtro = datos.get("tipo"), datos.get("filtro")
+        if datos.get("simular"):
+            return JsonResponse({"simulacion": True, **simular(tipo, filtro, datos.get("factor_destino"))})
+        operacion, en_segundo_plano = crear_operacion(tipo, filtro, request.user, datos.get("factor_destino"))
+    except (ValueError, AttributeError) as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    respuesta = estado_operacion(operacion)
+    respuesta["url"] = reverse("operacion_masiva_estado", args=[operacion.id])
+    return JsonResponse(respuesta, status=202 if en_segundo_plano else 200)
+
+@login_required
+def operacion_masiva_estado(request, pk):
+    """GET: estado y resultado de una operación masiva."""
+    prohibido = _solo_analista_json(request)
+    if prohibido:
+        return prohibido
+    operacion = get_object_or_404(OperacionMasiva, pk=pk)
+    return JsonResponse(estado_operacion(operacion))
+
+
+# ==========================================
+# 11. FEED DE CAMBIOS (outbox)
+# ==========================================
+
+@login_required
+def feed_cambios(request):
+    """GET ?desde=<token>&limite=<n>: cambios posteriores al token, para sincronizar sistemas externos.
+
+    Se lee siempre de la primaria: una réplica atrasada podría saltarse eventos.
+    """
+    prohibido = _solo_analista_json(request)
+    if prohibido:
+        return prohibido
+    try:
+        limite = int(request.GET.get("limite", API_LIMITE_DEFAULT))
+        return JsonResponse(outbox.leer_cambios(request.GET.get("desde"), max(1, min(limite, API_LIMITE_MAXIMO))))
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+
+
+# ==========================================
+# 12. NOTIFICACIONES EN VIVO (server-sent events)
+# ==========================================
+
+@login_required
+def eventos(request):
+    """Server-sent events: con proyecto_nuam.asgi esta ruta la atiende calificaciones.sse, fuera de Django.
+
+    Aquí solo se llega bajo WSGI (runserver, gunicorn sync), donde cada conexión abierta
+    ocuparía un hilo del servidor.
+    """
+    return JsonResponse({"error": "Las notificaciones en vivo requieren servir la app con proyecto_nuam.asgi"},
+                        status=501)
@@ -0,0 +1,222 @@
+"""Lectura de hojas XLSX en streaming para cargas masivas.
+
+`leer_filas_xlsx` entrega las filas de la hoja activa como tuplas de valores (igual que
+`iter_rows(values_only=True)` de openpyxl) usando el backend definido en
+`settings.XLSX_READER`:
+
+- ``'stream'`` (default): recorre el XML de la hoja con `iterparse` directamente sobre el
+  miembro del zip, sin construir celdas ni aplicar estilos. Los shared strings se
+  resuelven a demanda: `sharedStrings.xml` se va leyendo solo hasta el índice pedido.
+- ``'openpyxl'``: `load_workbook(read_only=True, data_only=True)`.
+
+Si el archivo usa algo que el lector en streaming no soporta, se recurre a openpyxl, también
+a mitad de la hoja: openpyxl sigue desde la primera fila que no se entregó.
+El lector en streaming no convierte fechas: las celdas numéricas con formato de fecha
+se entregan como número de serie de Excel (las cargas solo leen RUT, código y comentario).
+"""
+import posixpath
+import zipfile
+from xml.etree.ElementTree import iterparse, ParseError
+
+import openpyxl
+from django.conf import settings
+
+BACKENDS = ('stream', 'openpyxl')
+
+_REL_OFFICE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+
+
+class XlsxNoSoportado(Exception):
+    """El lector en streaming no puede interpretar el archivo (se usa openpyxl)."""
+
+
+def _local(tag):
+    """Nombre del tag sin namespace (acepta SpreadsheetML transicional y strict)."""
+    return tag.rpartition('}')[2]
+
+
+_COLUMNAS = {}
+
+
+def _columna(referencia):
+    """Índice base 0 de la columna de una referencia tipo 'AB12'."""
+    letras = referencia.rstrip('0123456789')
+    indice = _COLUMNAS.get(letras)
+    if indice is None:
+        indice = 0
+        for caracter in letras.upper():
+            indice = indice * 26 + (ord(caracter) - 64)
+        indice = _COLUMNAS[letras] = indice - 1
+    return indice
+
+
+def _numero(texto):
+    # Misma regla que openpyxl: entero salvo que tenga punto decimal o exponente
+    if '.' in texto or 'E' in texto or 'e' in texto:
+        return float(texto)
+    return int(texto)
+
+
+def _texto(elemento):
+    """Texto de un <si> o <is>: concatena los <t> (rich text), omitiendo la fonética <rPh>."""
+    if len(elemento) == 1 and elemento[0].tag.endswith('}t'):
+        return elemento[0].text or ''
+    partes = []
+    for hijo in elemento:
+        nombre = _local(hijo.tag)
+        if nombre == 't':
+            partes.append(hijo.text or '')
+        elif nombre == 'r':
+            partes.extend(t.text or '' for t in hijo if _local(t.tag) == 't')
+    return ''.join(partes)
+
+
+class _SharedStrings:
+    """Tabla de shared strings que se parsea incrementalmente hasta el índice pedido."""
+
+    def __init__(self, zip_file, ruta):
+        self._eventos = iterparse(zip_file.open(ruta), events=('start', 'end')) if ruta else iter(())
+        self._raiz = None
+        self._cadenas = []
+
+    def __getitem__(self, indice):
+        cadenas = self._cadenas
+        while len(cadenas) <= indice:
+            try:
+                evento, elemento = next(self._eventos)
+            except StopIteration:
+                raise XlsxNoSoportado(f'Shared string {indice} inexistente')
+            if evento == 'start':
+                if self._raiz is None:
+                    self._raiz = elemento
+            elif _local(elemento.tag) == 'si':
+                cadenas.append(_texto(elemento))
+                self._raiz.clear()
+        return cadenas[indice]
+
+
+def _rutas_libro(zip_file):
+    """Devuelve (hoja activa, sharedStrings) según workbook.xml y sus relaciones."""
+    try:
+        with zip_file.open('xl/_rels/workbook.xml.rels') as f:
+            relaciones = {
+                rel.get('Id'): (rel.get('Target'), rel.get('Type', ''))
+                for _, rel in iterparse(f) if _local(rel.tag) == 'Relationship'
+            }
+        activa, hojas = 0, []
+        with zip_file.open('xl/workbook.xml') as f:
+            for _, elemento in iterparse(f):
+                nombre = _local(elemento.tag)
+                if nombre == 'workbookView':
+                    activa = int(elemento.get('activeTab', 0))
+                elif nombre == 'sheet':
+                    hojas.append(elemento.get(f'{{{_REL_OFFICE}}}id') or elemento.get('id'))
+    except (KeyError, ParseError, ValueError) as e:
+        raise XlsxNoSoportado(f'Estructura de libro no reconocida: {e}')
+
+    def resolver(destino):
+        # Los targets son relativos a xl/ salvo que empiecen con '/'
+        return destino.lstrip('/') if destino.startswith('/') else posixpath.normpath(posixpath.join('xl', destino))
+
+    if not hojas or hojas[min(activa, len(hojas) - 1)] not in relaciones:
+        raise XlsxNoSoportado('No se encontró la hoja activa')
+    hoja = resolver(relaciones[hojas[min(activa, len(hojas) - 1)]][0])
+    compartidas = next(
+        (resolver(destino) for destino, tipo in relaciones.values() if tipo.endswith('/sharedStrings')),
+        None,
+    )
+    return hoja, compartidas
+
+
+def _filas_stream(archivo, desde_fila):
+    try:
+        zip_file = zipfile.ZipFile(archivo)
+    except zipfile.BadZipFile as e:
+        raise XlsxNoSoportado(str(e))
+    with zip_file:
+        ruta_hoja, ruta_compartidas = _rutas_libro(zip_file)
+        compartidas = _SharedStrings(zip_file, ruta_compartidas)
+
+        siguiente, ancho = 1, 0
+        tag_fila = datos = None
+        with zip_file.open(ruta_hoja) as hoja:
+            for evento, elemento in iterparse(hoja, events=('start', 'end')):
+                if evento == 'start':
+                    if tag_fila is None:
+                        # Namespace de la hoja, para comparar tags completos sin recortarlos
+                        ns = elemento.tag[:elemento.tag.find('}') + 1]
+                        tag_fila, tag_v, tag_is, tag_datos = f'{ns}row', f'{ns}v', f'{ns}is', f'{ns}sheetData'
+                        tag_dimension = f'{ns}dimension'
+                    elif elemento.tag == tag_dimension:
+                        # Como openpyxl, las filas se completan con None hasta el ancho declarado de la hoja
+                        ancho = _columna(elemento.get('ref', 'A').rpartition(':')[2]) + 1
+                    elif datos is None and elemento.tag == tag_datos:
+                        datos = elemento
+                    continue
+                if elemento.tag != tag_fila:
+                    continue
+                numero = int(elemento.get('r') or siguiente)
+                valores = []
+                for celda in elemento:
+                    referencia = celda.get('r')
+                    if referencia:
+                        # Celdas omitidas dentro de la fila quedan como None
+                        faltan = _columna(referencia) - len(valores)
+                        if faltan > 0:
+                            valores.extend([None] * faltan)
+                    tipo = celda.get('t', 'n')
+                    if tipo == 'inlineStr':
+                        hijo = celda.find(tag_is)
+                        valores.append(_texto(hijo) if hijo is not None else None)
+                        continue
+                    texto = celda.findtext(tag_v)
+                    if not texto:
+                        valores.append(None)
+                    elif tipo == 's':
+                        valores.append(compartidas[int(texto)])
+                    elif tipo == 'n':
+                        valores.append(_numero(texto))
+                    elif tipo == 'b':
+                        valores.append(texto == '1')
+                    else:  # 'str' (fórmula), 'e' (error), 'd' (fecha ISO)
+                        valores.append(texto)
+                # Se descartan las filas ya leídas para que la memoria no crezca con la hoja
+                datos.clear()
+
+                if numero >= desde_fila:
+                    # Filas ausentes en el XML se entregan vacías, para conservar la numeración
+                    for _ in range(max(siguiente, desde_fila), numero):
+                        yield (None,) * ancho
+                    if len(valores) < ancho:
+                        valores.extend([None] * (ancho - len(valores)))
+                    yield tuple(valores)
+                siguiente = numero + 1
+
+
+def _filas_openpyxl(archivo, desde_fila):
+    workbook = openpyxl.load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        yield from workbook.active.iter_rows(min_row=desde_fila, values_only=True)
+    finally:
+        workbook.close()
+
+
+def leer_filas_xlsx(archivo, desde_fila=1, backend=None):
+    """Itera las filas (tuplas de valores) de la hoja activa desde `desde_fila` (base 1)."""
+    backend = backend or getattr(settings, 'XLSX_READER', 'stream')
+    if backend not in BACKENDS:
+        raise ValueError(f"XLSX_READER desconocido: {backend!r} (opciones: {', '.join(BACKENDS)})")
+    if backend == 'openpyxl':
+        yield from _filas_openpyxl(archivo, desde_fila)
+        return
+
+    entregadas = 0
+    try:
+        for fila in _filas_stream(archivo, desde_fila):
+            yield fila
+            entregadas += 1
+    except (XlsxNoSoportado, ParseError, ValueError):
+        # openpyxl sigue desde la primera fila que no se entregó (el lector en streaming
+        # entrega también las filas vacías, así que la numeración coincide)
+        archivo.seek(0)
+        yield from _filas_openpyxl(archivo, desde_fila + entregadas)
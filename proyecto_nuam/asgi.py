@@ -3,6 +3,10 @@ ASGI config for nuam_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Server-sent events (the ``eventos`` URL) are served by calificaciones.sse outside the
+Django handler, so an idle connection does not hold a thread; everything else goes
+through Django.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -13,4 +17,16 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'proyecto_nuam.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from django.urls import reverse  # noqa: E402  (requires the app registry loaded above)
+
+from calificaciones.sse import aplicacion_eventos  # noqa: E402
+
+RUTA_EVENTOS = reverse('eventos')
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] == RUTA_EVENTOS:
+        return await aplicacion_eventos(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -0,0 +1,122 @@
+"""Ruteo de lecturas a réplicas de solo lectura.
+
+Las lecturas van a una réplica solo dentro de `lectura_en_replica` (decorador de vistas de
+solo lectura o context manager para exportaciones) y solo para los modelos de
+DB_REPLICA_APPS; todo lo demás (escrituras, sesiones, auth) usa la primaria.
+
+Consistencia para quien escribe:
+
+- Dentro de un request, después de la primera escritura las lecturas vuelven a la primaria.
+- `PrimariaTrasEscrituraMiddleware` deja una cookie tras un request que escribió, y mientras
+  dure (DB_REPLICA_STICKY_SEGUNDOS) los requests siguientes de ese navegador leen de la primaria.
+
+Una réplica con más de DB_REPLICA_MAX_LAG segundos de retraso (o que no responde) se omite;
+si no queda ninguna, se lee de la primaria. El retraso se mide a lo sumo cada
+DB_REPLICA_LAG_CACHE segundos por réplica.
+"""
+import math
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+PRIMARIA = 'default'
+
+# Estado del request en curso: {'primaria': bool, 'escribio': bool} (lo fija el middleware)
+estado_request = ContextVar('estado_request_bd', default=None)
+_en_replica = ContextVar('lectura_en_replica', default=False)
+
+_RETRASO_SQL = (
+    # En una réplica al día (todo lo recibido ya aplicado) el retraso es 0 aunque la primaria esté ociosa
+    'SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END'
+)
+_retrasos = {}
+
+
+def retraso_replica(alias):
+    """Segundos de retraso de la réplica (0 fuera de PostgreSQL; inf si no responde)."""
+    ahora = time.monotonic()
+    medido = _retrasos.get(alias)
+    if medido and ahora - medido[0] < settings.DB_REPLICA_LAG_CACHE:
+        return medido[1]
+    conexion = connections[alias]
+    retraso = 0.0
+    if conexion.vendor == 'postgresql':
+        try:
+            with conexion.cursor() as cursor:
+                cursor.execute(_RETRASO_SQL)
+                retraso = float(cursor.fetchone()[0] or 0)
+        except DatabaseError:
+            retraso = math.inf
+    _retrasos[alias] = (ahora, retraso)
+    return retraso
+
+
+def elegir_replica():
+    """Alias de una réplica dentro del retraso máximo, o None para usar la primaria."""
+    disponibles = [
+        alias for alias in settings.DATABASE_REPLICAS
+        if retraso_replica(alias) <= settings.DB_REPLICA_MAX_LAG
+    ]
+    return random.choice(disponibles) if disponibles else None
+
+
+@contextmanager
+def _contexto_replica():
+    token = _en_replica.set(True)
+    try:
+        yield
+    finally:
+        _en_replica.reset(token)
+
+
+def lectura_en_replica(vista=None):
+    """Permite leer de una réplica: como decorador de vista (sync o async) o `with lectura_en_replica():`."""
+    if vista is None:
+        return _contexto_replica()
+
+    if iscoroutinefunction(vista):
+        @wraps(vista)
+        async def envoltura_async(request, *args, **kwargs):
+            with _contexto_replica():
+                return await vista(request, *args, **kwargs)
+        return envoltura_async
+
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        with _contexto_replica():
+            return vista(request, *args, **kwargs)
+    return envoltura
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not settings.DATABASE_REPLICAS or not _en_replica.get():
+            return None
+        if model._meta.app_label not in settings.DB_REPLICA_APPS:
+            return None
+        estado = estado_request.get()
+        if estado is not None and estado['primaria']:
+            return PRIMARIA
+        return elegir_replica() or PRIMARIA
+
+    def db_for_write(self, model, **hints):
+        estado = estado_request.get()
+        # La sesión se guarda en cada request (SESSION_SAVE_EVERY_REQUEST): no cuenta como escritura
+        if estado is not None and model._meta.app_label != 'sessions':
+            estado['primaria'] = estado['escribio'] = True
+        return PRIMARIA
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Primaria y réplicas tienen los mismos datos
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Las réplicas reciben el esquema por replicación
+        return db not in settings.DATABASE_REPLICAS
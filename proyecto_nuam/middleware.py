@@ -2,18 +2,38 @@
 
 from typing import Callable
 
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
 from django.http import HttpRequest, HttpResponse
 
+from .db_router import estado_request
+
 
 class NoCacheMiddleware:
-	"""Sets strict no-cache headers so back button can't show stale pages after logout."""
+	"""Sets strict no-cache headers so back button can't show stale pages after logout.
+
+	Supports sync and async so ASGI requests to async views never fall back to a thread.
+	"""
+
+	sync_capable = True
+	async_capable = True
 
 	def __init__(self, get_response: Callable[[HttpRequest], HttpResponse]):
 		self.get_response = get_response
+		if iscoroutinefunction(self.get_response):
+			markcoroutinefunction(self)
 
 	def __call__(self, request: HttpRequest) -> HttpResponse:
+		if iscoroutinefunction(self):
+			return self.__acall__(request)
 		response = self.get_response(request)
+		return self._apply_headers(response)
+
+	async def __acall__(self, request: HttpRequest) -> HttpResponse:
+		response = await self.get_response(request)
+		return self._apply_headers(response)
 
+	def _apply_headers(self, response: HttpResponse) -> HttpResponse:
 		content_type = response.get('Content-Type', '')
 		if 'text/html' in content_type:
 			response['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0, private'
@@ -21,3 +41,49 @@ class NoCacheMiddleware:
 			response['Expires'] = '0'
 
 		return response
+
+
+class PrimariaTrasEscrituraMiddleware:
+	"""Keeps a browser reading from the primary database right after it writes.
+
+	Tracks writes made while handling the request (see ReplicaRouter.db_for_write) and, if
+	any happened, sets a short-lived cookie; requests carrying it never read from a replica,
+	so users see their own changes despite replication lag.
+	"""
+
+	sync_capable = True
+	async_capable = True
+	cookie_name = 'nuam_primaria'
+
+	def __init__(self, get_response: Callable[[HttpRequest], HttpResponse]):
+		self.get_response = get_response
+		if iscoroutinefunction(self.get_response):
+			markcoroutinefunction(self)
+
+	def __call__(self, request: HttpRequest) -> HttpResponse:
+		if iscoroutinefunction(self):
+			return self.__acall__(request)
+		estado = {'primaria': self.cookie_name in request.COOKIES, 'escribio': False}
+		token = estado_request.set(estado)
+		try:
+			response = self.get_response(request)
+		finally:
+			estado_request.reset(token)
+		return self._mark_sticky(response, estado)
+
+	async def __acall__(self, request: HttpRequest) -> HttpResponse:
+		# The state is a mutable dict: writes made in sync_to_async threads (copied context) still update it
+		estado = {'primaria': self.cookie_name in request.COOKIES, 'escribio': False}
+		token = estado_request.set(estado)
+		try:
+			response = await self.get_response(request)
+		finally:
+			estado_request.reset(token)
+		return self._mark_sticky(response, estado)
+
+	def _mark_sticky(self, response: HttpResponse, estado: dict) -> HttpResponse:
+		if estado['escribio'] and settings.DATABASE_REPLICAS:
+			response.set_cookie(
+				self.cookie_name, '1', max_age=settings.DB_REPLICA_STICKY_SEGUNDOS, httponly=True, samesite='Lax',
+			)
+		return response